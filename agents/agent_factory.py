@@ -1,78 +1,206 @@
 import os
-import json
-from datetime import datetime
+import asyncio
+import resource
+from collections import OrderedDict, defaultdict
 from agents.base_agent import BaseAgent
-from config.config import BASE_DATA_DIR, DEFAULT_MODEL_NAME
+from agents.evolution import evolution_engine
+from agents.document_store import get_document_store, migrate_legacy_knowledge_bases
+from agents.learning_scheduler import learning_scheduler
+from agents.agent_store import AgentStore, create_agent_store, migrate_legacy_agents_file
+from services.sharding import owns
+from config.config import BASE_DATA_DIR, DEFAULT_MODEL_NAME, AGENT_CACHE_SIZE, AGENT_CACHE_MAX_RSS_MB, AGENT_STORE_BACKEND
 from utils.logger import setup_logger
-from models import AgentCreate, AgentUpdate, AgentResponse, AgentList
+from models import AgentCreate, AgentUpdate, AgentList
 
 logger = setup_logger(__name__)
 
-class DateTimeEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, datetime):
-            return obj.isoformat()
-        return super().default(obj)
+def normalize_interest(interest: str) -> str:
+    return interest.strip().lower()
+
+def current_rss_mb():
+    # Current (not peak) resident set size; only available where /proc is
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * resource.getpagesize() / (1024 * 1024)
+    except (OSError, IndexError, ValueError):
+        return 0
 
 class AgentFactory:
-    def __init__(self, base_data_dir: str = BASE_DATA_DIR, model_name: str = DEFAULT_MODEL_NAME):
+    def __init__(self, base_data_dir: str = BASE_DATA_DIR, model_name: str = DEFAULT_MODEL_NAME,
+                 max_cached_agents: int = AGENT_CACHE_SIZE, max_rss_mb: int = AGENT_CACHE_MAX_RSS_MB,
+                 store: AgentStore = None):
         self.base_data_dir = base_data_dir
         self.model_name = model_name
-        self.agents = {}
-        self.agents_file = os.path.join(base_data_dir, "agents.json")
+        self.max_cached_agents = max(1, max_cached_agents)
+        self.max_rss_mb = max_rss_mb
+        # Effective cache size, lowered while RSS is over budget
+        self.cache_limit = self.max_cached_agents
+        # Materialized agents, least recently used first
+        self.agents = OrderedDict()
         os.makedirs(base_data_dir, exist_ok=True)
-        self.load_agents()
-
-    def load_agents(self):
-        if os.path.exists(self.agents_file):
-            try:
-                with open(self.agents_file, 'r') as f:
-                    agents_data = json.load(f)
-                for agent_data in agents_data:
-                    agent_data['last_learning_time'] = datetime.fromisoformat(agent_data['last_learning_time'])
-                    agent = BaseAgent.from_response(AgentResponse(**agent_data))
-                    self.agents[agent.agent_id] = agent
-            except json.JSONDecodeError:
-                logger.error(f"Error decoding {self.agents_file}. Starting with empty agents list.")
-                self.agents = {}
-        else:
-            logger.info(f"{self.agents_file} not found. Starting with empty agents list.")
+        self.store = store or create_agent_store(AGENT_STORE_BACKEND, base_data_dir)
+        migrate_legacy_agents_file(self.store, os.path.join(base_data_dir, "agents.json"))
+        # Knowledge bases from before the shared store are moved into it once
+        migrate_legacy_knowledge_bases(get_document_store(), base_data_dir)
+        # Inverted index from normalized interest to agent IDs, built from the
+        # store on first use and kept current on every save and delete. With
+        # several workers it only covers this worker's shard.
+        self.interest_index = None
+        self.indexed_interests = {}
+        # Buffered evolutions apply to whichever instance is live and are persisted right away
+        evolution_engine.resolve_agent = self.get_agent
+        evolution_engine.add_listener(self._save_evolved)
+
+    def _save_evolved(self, agent: BaseAgent):
+        # An agent deleted while its evolution was running must not be written back
+        if self.agents.get(agent.agent_id) is agent or self.store.get(agent.agent_id) is not None:
+            self.save_agent(agent)
+
+    def save_agent(self, agent: BaseAgent):
+        # Every interest change (create, update, evolution) ends up here
+        self.store.upsert(agent.to_response())
+        if self.interest_index is not None:
+            self._index_agent(agent.agent_id, agent.interests)
+
+    def _index_agent(self, agent_id: int, interests):
+        interests = frozenset(normalize_interest(interest) for interest in interests)
+        previous = self.indexed_interests.get(agent_id, frozenset())
+        if interests == previous:
+            return
+        self._unindex_agent(agent_id)
+        for interest in interests:
+            self.interest_index[interest].add(agent_id)
+        self.indexed_interests[agent_id] = interests
 
-    def save_agents(self):
-        agents_data = [agent.to_response().dict() for agent in self.agents.values()]
-        with open(self.agents_file, 'w') as f:
-            json.dump(agents_data, f, cls=DateTimeEncoder)
+    def _unindex_agent(self, agent_id: int):
+        for interest in self.indexed_interests.pop(agent_id, ()):
+            agent_ids = self.interest_index[interest]
+            agent_ids.discard(agent_id)
+            if not agent_ids:
+                del self.interest_index[interest]
+
+    def get_interest_index(self):
+        if self.interest_index is None:
+            self.interest_index = defaultdict(set)
+            for record in self.list_agents().agents:
+                if owns(record.agent_id):
+                    self._index_agent(record.agent_id, record.interests)
+        return self.interest_index
+
+    def _cache_agent(self, agent: BaseAgent):
+        self.agents[agent.agent_id] = agent
+        self.agents.move_to_end(agent.agent_id)
+        self._evict()
+
+    def _evict(self):
+        # Freed agents rarely give memory back to the OS and RSS also counts
+        # mapped knowledge base pages, so evicting until RSS drops would empty
+        # the cache. Over budget the limit shrinks by a tenth per insert, down
+        # to a quarter of max_cached_agents, and grows back once under budget.
+        if self.max_rss_mb:
+            if current_rss_mb() > self.max_rss_mb:
+                self.cache_limit = max(self.max_cached_agents // 4, 1, min(self.cache_limit, len(self.agents) * 9 // 10))
+            else:
+                self.cache_limit = min(self.max_cached_agents, self.cache_limit + 1)
+        while len(self.agents) > self.cache_limit:
+            if not self._release_oldest():
+                break
+
+    def _release_oldest(self) -> bool:
+        # Least recently used idle agent; busy ones stay until they are done,
+        # otherwise a second live instance of the same agent would be loaded
+        for agent_id, agent in self.agents.items():
+            if not agent.in_use:
+                break
+        else:
+            return False
+        del self.agents[agent_id]
+        self.save_agent(agent)
+        # Its queued memory writes are flushed, in a worker thread on the event loop
+        try:
+            asyncio.get_running_loop().run_in_executor(None, agent.flush)
+        except RuntimeError:
+            agent.flush()
+        logger.info(f"Evicted agent {agent_id} from the agent cache")
+        return True
 
-    def create_agent(self, agent_create: AgentCreate) -> BaseAgent:
-        agent_id = max(self.agents.keys() or [0]) + 1
+    def create_agent(self, agent_create: AgentCreate, agent_id: int = None) -> BaseAgent:
+        # agent_id is passed in when another worker allocated it for this shard
+        if agent_id is None:
+            agent_id = self.store.allocate_id()
         agent = BaseAgent(agent_id, agent_create, self.model_name)
-        self.agents[agent_id] = agent
-        self.save_agents()
+        self.save_agent(agent)
+        self._cache_agent(agent)
+        learning_scheduler.add_agent(agent_id)
         logger.info(f"Created agent {agent_id} with personality type: {agent_create.personality_type}")
         return agent
 
     def get_agent(self, agent_id: int) -> BaseAgent:
-        return self.agents.get(agent_id)
+        agent = self.agents.get(agent_id)
+        if agent:
+            self.agents.move_to_end(agent_id)
+            return agent
+        record = self.store.get(agent_id)
+        if record is None:
+            return None
+        agent = BaseAgent.from_response(record, self.model_name)
+        self._cache_agent(agent)
+        return agent
+
+    async def learn(self, agent_id: int):
+        # Queued learning resolves the agent when it runs, so it never works
+        # on an instance that was evicted while it waited
+        agent = self.get_agent(agent_id)
+        if agent:
+            await agent.async_learn()
+
+    def get_agent_record(self, agent_id: int):
+        # Agents of other workers' shards are read from the shared store, never loaded
+        if owns(agent_id):
+            agent = self.get_agent(agent_id)
+            return agent.to_response() if agent else None
+        return self.store.get(agent_id)
 
     def list_agents(self) -> AgentList:
-        return AgentList(agents=[agent.to_response() for agent in self.agents.values()])
+        # Served from the stored metadata; cached agents may carry newer state
+        agents = []
+        for record in self.store.list():
+            agent = self.agents.get(record.agent_id)
+            agents.append(agent.to_response() if agent else record)
+        return AgentList(agents=agents)
+
+    def find_agent_ids_by_interest(self, interest: str):
+        return sorted(self.get_interest_index().get(normalize_interest(interest), ()))
 
     def update_agent(self, agent_id: int, agent_update: AgentUpdate):
         agent = self.get_agent(agent_id)
         if agent:
             if agent_update.interests is not None:
                 agent.interests = agent_update.interests
+                agent.persona_changed()
             if agent_update.metadata is not None:
                 agent.metadata.update(agent_update.metadata)
-            self.save_agents()
+            self.save_agent(agent)
             logger.info(f"Updated agent {agent_id}")
         else:
             logger.error(f"Agent {agent_id} not found")
 
     def delete_agent(self, agent_id: int):
-        if agent_id in self.agents:
-            del self.agents[agent_id]
-            self.save_agents()
+        if self.store.delete(agent_id):
+            self.agents.pop(agent_id, None)
+            if self.interest_index is not None:
+                self._unindex_agent(agent_id)
+            learning_scheduler.remove_agent(agent_id)
+            evolution_engine.discard(agent_id)
+            get_document_store().remove_namespace(agent_id)
             logger.info(f"Deleted agent {agent_id}")
         else:
-            logger.error(f"Agent {agent_id} not found")
\ No newline at end of file
+            logger.error(f"Agent {agent_id} not found")
+
+    def close(self):
+        # Flush every materialized agent and persist its latest metadata
+        for agent in self.agents.values():
+            agent.flush()
+            self.save_agent(agent)
+        self.store.close()
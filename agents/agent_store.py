@@ -0,0 +1,305 @@
+import os
+import json
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Dict, List, Optional
+from models import AgentResponse
+from utils.logger import setup_logger
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows
+    fcntl = None
+
+logger = setup_logger(__name__)
+
+class DateTimeEncoder(json.JSONEncoder):
+    def default(self, obj):
+        if isinstance(obj, datetime):
+            return obj.isoformat()
+        return super().default(obj)
+
+def record_from_dict(agent_data: dict) -> AgentResponse:
+    agent_data = dict(agent_data)
+    if isinstance(agent_data['last_learning_time'], str):
+        agent_data['last_learning_time'] = datetime.fromisoformat(agent_data['last_learning_time'])
+    return AgentResponse(**agent_data)
+
+# Persistent home of the agent metadata records. Every mutation touches a
+# single agent, so its cost does not grow with the size of the village.
+class AgentStore(ABC):
+    @abstractmethod
+    def allocate_id(self) -> int:
+        pass
+
+    @abstractmethod
+    def get(self, agent_id: int) -> Optional[AgentResponse]:
+        pass
+
+    @abstractmethod
+    def upsert(self, record: AgentResponse):
+        pass
+
+    @abstractmethod
+    def delete(self, agent_id: int) -> bool:
+        pass
+
+    @abstractmethod
+    def list(self) -> List[AgentResponse]:
+        pass
+
+    @abstractmethod
+    def count(self) -> int:
+        pass
+
+    @abstractmethod
+    def set_next_learning_times(self, next_learning_times: Dict[int, datetime]):
+        pass
+
+    @abstractmethod
+    def learning_schedule(self) -> Dict[int, datetime]:
+        pass
+
+    def close(self):
+        pass
+
+class SQLiteAgentStore(AgentStore):
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA busy_timeout=5000")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS agents ("
+            " agent_id INTEGER PRIMARY KEY,"
+            " personality_type TEXT NOT NULL,"
+            " interests TEXT NOT NULL,"
+            " metadata TEXT NOT NULL,"
+            " last_learning_time TEXT NOT NULL)"
+        )
+        self.conn.execute("CREATE TABLE IF NOT EXISTS id_sequence (next_id INTEGER NOT NULL)")
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(agents)")]
+        if "next_learning_time" not in columns:
+            self.conn.execute("ALTER TABLE agents ADD COLUMN next_learning_time TEXT")
+
+    def _row_to_record(self, row) -> AgentResponse:
+        return AgentResponse(
+            agent_id=row[0],
+            personality_type=row[1],
+            interests=json.loads(row[2]),
+            metadata=json.loads(row[3]),
+            last_learning_time=datetime.fromisoformat(row[4])
+        )
+
+    def allocate_id(self) -> int:
+        # BEGIN IMMEDIATE takes the write lock up front, so concurrent
+        # allocators (threads or processes) never hand out the same ID
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute("SELECT next_id FROM id_sequence").fetchone()
+                if row is None:
+                    max_id = self.conn.execute("SELECT MAX(agent_id) FROM agents").fetchone()[0]
+                    agent_id = (max_id or 0) + 1
+                    self.conn.execute("INSERT INTO id_sequence (next_id) VALUES (?)", (agent_id + 1,))
+                else:
+                    agent_id = row[0]
+                    self.conn.execute("UPDATE id_sequence SET next_id = ?", (agent_id + 1,))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return agent_id
+
+    def get(self, agent_id: int) -> Optional[AgentResponse]:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT agent_id, personality_type, interests, metadata, last_learning_time"
+                " FROM agents WHERE agent_id = ?", (agent_id,)
+            ).fetchone()
+        return self._row_to_record(row) if row else None
+
+    def upsert(self, record: AgentResponse):
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO agents (agent_id, personality_type, interests, metadata, last_learning_time)"
+                " VALUES (?, ?, ?, ?, ?)"
+                " ON CONFLICT(agent_id) DO UPDATE SET"
+                " personality_type = excluded.personality_type,"
+                " interests = excluded.interests,"
+                " metadata = excluded.metadata,"
+                " last_learning_time = excluded.last_learning_time",
+                (
+                    record.agent_id,
+                    record.personality_type,
+                    json.dumps(record.interests),
+                    json.dumps(record.metadata),
+                    record.last_learning_time.isoformat()
+                )
+            )
+
+    def delete(self, agent_id: int) -> bool:
+        with self.lock:
+            cursor = self.conn.execute("DELETE FROM agents WHERE agent_id = ?", (agent_id,))
+        return cursor.rowcount > 0
+
+    def list(self) -> List[AgentResponse]:
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT agent_id, personality_type, interests, metadata, last_learning_time"
+                " FROM agents ORDER BY agent_id"
+            ).fetchall()
+        return [self._row_to_record(row) for row in rows]
+
+    def count(self) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM agents").fetchone()[0]
+
+    def set_next_learning_times(self, next_learning_times: Dict[int, datetime]):
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.executemany(
+                    "UPDATE agents SET next_learning_time = ? WHERE agent_id = ?",
+                    [(when.isoformat(), agent_id) for agent_id, when in next_learning_times.items()]
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def learning_schedule(self) -> Dict[int, datetime]:
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT agent_id, next_learning_time FROM agents WHERE next_learning_time IS NOT NULL"
+            ).fetchall()
+        return {agent_id: datetime.fromisoformat(when) for agent_id, when in rows}
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+class FileAgentStore(AgentStore):
+    # Embedded fallback: one JSON file per agent, written atomically
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.sequence_file = os.path.join(directory, "next_id")
+        self.schedule_dir = os.path.join(directory, "schedule")
+        self.lock = threading.Lock()
+        os.makedirs(self.schedule_dir, exist_ok=True)
+
+    def _agent_file(self, agent_id: int) -> str:
+        return os.path.join(self.directory, f"agent_{agent_id}.json")
+
+    def _write_atomic(self, path: str, data: str):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def _agent_ids(self) -> List[int]:
+        agent_ids = []
+        for name in os.listdir(self.directory):
+            if name.startswith("agent_") and name.endswith(".json"):
+                try:
+                    agent_ids.append(int(name[len("agent_"):-len(".json")]))
+                except ValueError:
+                    continue
+        return sorted(agent_ids)
+
+    def allocate_id(self) -> int:
+        with self.lock:
+            with open(self.sequence_file, 'a+') as f:
+                if fcntl:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    f.seek(0)
+                    content = f.read().strip()
+                    if content:
+                        agent_id = int(content)
+                    else:
+                        agent_id = max(self._agent_ids() or [0]) + 1
+                    f.seek(0)
+                    f.truncate()
+                    f.write(str(agent_id + 1))
+                    f.flush()
+                    os.fsync(f.fileno())
+                finally:
+                    if fcntl:
+                        fcntl.flock(f, fcntl.LOCK_UN)
+        return agent_id
+
+    def get(self, agent_id: int) -> Optional[AgentResponse]:
+        try:
+            with open(self._agent_file(agent_id), 'r') as f:
+                return record_from_dict(json.load(f))
+        except FileNotFoundError:
+            return None
+        except json.JSONDecodeError:
+            logger.error(f"Error decoding record for agent {agent_id}")
+            return None
+
+    def upsert(self, record: AgentResponse):
+        self._write_atomic(self._agent_file(record.agent_id), json.dumps(record.dict(), cls=DateTimeEncoder))
+
+    def delete(self, agent_id: int) -> bool:
+        try:
+            os.remove(os.path.join(self.schedule_dir, f"agent_{agent_id}"))
+        except FileNotFoundError:
+            pass
+        try:
+            os.remove(self._agent_file(agent_id))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def list(self) -> List[AgentResponse]:
+        records = (self.get(agent_id) for agent_id in self._agent_ids())
+        return [record for record in records if record is not None]
+
+    def count(self) -> int:
+        return len(self._agent_ids())
+
+    def set_next_learning_times(self, next_learning_times: Dict[int, datetime]):
+        for agent_id, when in next_learning_times.items():
+            self._write_atomic(os.path.join(self.schedule_dir, f"agent_{agent_id}"), when.isoformat())
+
+    def learning_schedule(self) -> Dict[int, datetime]:
+        schedule = {}
+        for name in os.listdir(self.schedule_dir):
+            if not name.startswith("agent_") or name.endswith(".tmp"):
+                continue
+            try:
+                with open(os.path.join(self.schedule_dir, name), 'r') as f:
+                    schedule[int(name[len("agent_"):])] = datetime.fromisoformat(f.read().strip())
+            except (OSError, ValueError):
+                continue
+        return schedule
+
+def create_agent_store(backend: str, base_data_dir: str) -> AgentStore:
+    if backend == "sqlite":
+        return SQLiteAgentStore(os.path.join(base_data_dir, "agents.db"))
+    if backend == "file":
+        return FileAgentStore(os.path.join(base_data_dir, "agents"))
+    raise ValueError(f"Unknown agent store backend: {backend}")
+
+def migrate_legacy_agents_file(store: AgentStore, agents_file: str):
+    # Import the old whole-file agents.json once, then move it out of the way
+    if not os.path.exists(agents_file) or store.count():
+        return
+    try:
+        with open(agents_file, 'r') as f:
+            agents_data = json.load(f)
+    except json.JSONDecodeError:
+        logger.error(f"Error decoding {agents_file}. Leaving it in place for manual recovery.")
+        return
+    for agent_data in agents_data:
+        store.upsert(record_from_dict(agent_data))
+    os.replace(agents_file, f"{agents_file}.migrated")
+    logger.info(f"Migrated {len(agents_data)} agents from {agents_file}")
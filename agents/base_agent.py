@@ -1,76 +1,192 @@
-from llama_index.core import VectorStoreIndex, Document, SimpleDirectoryReader, StorageContext, load_index_from_storage
-from llama_index.llms.openai import OpenAI
-from config.config import OPENAI_API_KEY, DEFAULT_MODEL_NAME, BASE_DATA_DIR
-from services.web_search import search_web, get_random_article
-from services.task_queue import task_queue
+from config.config import (DEFAULT_MODEL_NAME, BASE_DATA_DIR, MEMORY_WINDOW, QUERY_CACHE_LOOKUP_TIMEOUT,
+                           QUERY_SEARCH_TIMEOUT, QUERY_RETRIEVAL_TIMEOUT, QUERY_SYNTHESIS_TIMEOUT, QUERY_PERSONALITY_TIMEOUT,
+                           RESPONSE_CACHE_ENABLED, LOG_PAYLOADS)
+from agents.memory import ConversationMemory
+from agents.document_store import get_document_store
+from agents.response_cache import response_cache
+from agents.evolution import evolution_engine
+from services.async_web_search import async_search_web, async_get_random_article
+from services.llm_gateway import llm_gateway, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+from services.tokenizer import load_sentence_tokenizer
 from utils.logger import setup_logger
+from utils.metrics import QUERY_STAGE_SECONDS, QUERY_STAGE_FAILURES, QUERY_SECONDS, span
 from models import AgentResponse, AgentCreate
-from datetime import datetime, timedelta
+from datetime import datetime
 import asyncio
-import os
 import json
+import os
+from contextlib import contextmanager
 
 logger = setup_logger(__name__)
 
+def preload_dependencies():
+    # llama_index and the OpenAI client take seconds to import, so they are
+    # imported on first use; this pulls them in ahead of the first query
+    import llama_index.core
+    import llama_index.llms.openai
+    load_sentence_tokenizer()
+
+async def run_stage(name, awaitable, timeout, default):
+    # A failed or slow stage degrades to its default instead of failing the query
+    with QUERY_STAGE_SECONDS.time(stage=name), span(f"query.{name}"):
+        try:
+            return await asyncio.wait_for(awaitable, timeout=timeout)
+        except asyncio.TimeoutError:
+            QUERY_STAGE_FAILURES.inc(stage=name, reason="timeout")
+            logger.warning(f"Query stage '{name}' timed out after {timeout}s")
+        except Exception as e:
+            QUERY_STAGE_FAILURES.inc(stage=name, reason="error")
+            logger.error(f"Query stage '{name}' failed: {str(e)}")
+    return default
+
 class BaseAgent:
     def __init__(self, agent_id: int, agent_create: AgentCreate, model_name: str = DEFAULT_MODEL_NAME):
         self.agent_id = agent_id
         self.personality_type = agent_create.personality_type
         self.interests = agent_create.interests
         self.metadata = agent_create.metadata
-        self.llm = OpenAI(model=model_name, api_key=OPENAI_API_KEY)
+        # LLM calls go through the process-wide gateway, which owns the clients
+        self.model_name = model_name
+        # Periodic learning is driven by the learning scheduler
         self.last_learning_time = datetime.now()
-        self.learning_frequency = timedelta(hours=8)  # Learn every 8 hours
-        self.memory_file = os.path.join(BASE_DATA_DIR, f"agent_{agent_id}_memory.json")
-        self.kb_dir = os.path.join(BASE_DATA_DIR, f"agent_{agent_id}_kb")
+        # Bumped whenever personality or interests change; cached responses are tied to it
+        self.persona_version = 0
+        # Operations in progress; the agent cache never evicts a busy agent
+        self.in_use = 0
+        self.memory_file = os.path.join(BASE_DATA_DIR, f"agent_{agent_id}_memory.jsonl")
         self.load_memory()
-        self.load_knowledge_base()
 
     def load_memory(self):
-        if os.path.exists(self.memory_file):
-            with open(self.memory_file, 'r') as f:
-                self.memory = json.load(f)
-        else:
-            self.memory = []
+        legacy_file = os.path.join(BASE_DATA_DIR, f"agent_{self.agent_id}_memory.json")
+        self.memory = ConversationMemory(self.memory_file, MEMORY_WINDOW, legacy_path=legacy_file)
 
-    def save_memory(self):
-        with open(self.memory_file, 'w') as f:
-            json.dump(self.memory, f)
+    @contextmanager
+    def busy(self):
+        self.in_use += 1
+        try:
+            yield self
+        finally:
+            self.in_use -= 1
 
-    def load_knowledge_base(self):
-        if os.path.exists(self.kb_dir):
-            storage_context = StorageContext.from_defaults(persist_dir=self.kb_dir)
-            self.knowledge_base = load_index_from_storage(storage_context)
-        else:
-            self.knowledge_base = VectorStoreIndex([])
+    def flush(self):
+        # Wait for this agent's queued memory writes (blocking); the
+        # knowledge base is written through to the shared store
+        self.memory.flush()
 
-    def save_knowledge_base(self):
-        self.knowledge_base.storage_context.persist(persist_dir=self.kb_dir)
+    async def query(self, query_text, search_results=None):
+        # search_results can be passed in when several agents answer the same query
+        with self.busy(), QUERY_SECONDS.time(), span("query", agent_id=self.agent_id):
+            persona_version = self.persona_version
+            cached_response, query_embedding = await self.lookup_cached_response(query_text)
+            if cached_response is not None:
+                self.update_memory(query_text, cached_response)
+                return cached_response
+            
+            raw_response, search_results = await self.generate_raw_response(query_text, search_results, query_embedding)
+            
+            final_response = await run_stage(
+                "personality",
+                self.apply_personality(raw_response, query_text, search_results),
+                QUERY_PERSONALITY_TIMEOUT,
+                raw_response
+            )
+            if LOG_PAYLOADS:
+                logger.info(f"Agent {self.agent_id} final response: {final_response}")
+            
+            self.update_memory(query_text, final_response)
+            await self.cache_response(query_text, final_response, persona_version, query_embedding)
+            
+            return final_response
 
-    async def query(self, query_text):
-        await self.check_and_learn()
+    async def stream_query(self, query_text):
+        # Same pipeline as query, but the personality rewrite is streamed as it
+        # is generated. Memory is only updated once the stream has completed.
+        with self.busy():
+            persona_version = self.persona_version
+            cached_response, query_embedding = await self.lookup_cached_response(query_text)
+            if cached_response is not None:
+                yield cached_response
+                self.update_memory(query_text, cached_response)
+                return
         
-        logger.info(f"Agent {self.agent_id} received query: {query_text}")
+            raw_response, search_results = await self.generate_raw_response(query_text, query_embedding=query_embedding)
         
-        search_results = await asyncio.to_thread(search_web, query_text)
-        logger.info(f"Web search results: {search_results}")
+            prompt = self.generate_personality_prompt(raw_response, query_text)
+            chunks = []
+            async for delta in llm_gateway.stream_complete(prompt, self.model_name, PRIORITY_INTERACTIVE):
+                chunks.append(delta)
+                yield delta
         
-        context = self.generate_context(query_text, search_results)
-        
-        query_engine = self.knowledge_base.as_query_engine()
-        response = await asyncio.to_thread(query_engine.query, context)
+            final_response = "".join(chunks)
+            if LOG_PAYLOADS:
+                logger.info(f"Agent {self.agent_id} final response: {final_response}")
+            self.update_memory(query_text, final_response)
+            await self.cache_response(query_text, final_response, persona_version, query_embedding)
+
+    async def lookup_cached_response(self, query_text):
+        # Also returns the query embedding, computed once here and reused by
+        # retrieval and cache_response; (None, None) if the stage fails
+        if not RESPONSE_CACHE_ENABLED:
+            return None, None
+        cached_response, query_embedding = await run_stage(
+            "cache_lookup",
+            response_cache.lookup(self.agent_id, self.persona_version, query_text),
+            QUERY_CACHE_LOOKUP_TIMEOUT,
+            (None, None)
+        )
+        if cached_response is not None and LOG_PAYLOADS:
+            logger.info(f"Agent {self.agent_id} answered from the response cache")
+        return cached_response, query_embedding
+
+    async def cache_response(self, query_text, response, persona_version, query_embedding=None):
+        if RESPONSE_CACHE_ENABLED:
+            with QUERY_STAGE_SECONDS.time(stage="cache_store"):
+                await response_cache.store(self.agent_id, persona_version, query_text, response, query_embedding)
+
+    def persona_changed(self):
+        self.persona_version += 1
+        response_cache.invalidate(self.agent_id)
+
+    async def retrieve_chunks(self, query_text, query_embedding=None):
+        # query_embedding is reused from the response cache lookup when there is one
+        return await get_document_store().retrieve(self.agent_id, query_text, query_embedding)
+
+    async def synthesize(self, context, chunks):
+        # Same question-answering prompt llama_index's query engine uses, sent
+        # through the gateway so it is rate limited like every other call
+        if not chunks:
+            return None
+        from llama_index.core.prompts.default_prompts import DEFAULT_TEXT_QA_PROMPT
+        context_str = "\n\n".join(chunk.text for chunk in chunks)
+        prompt = DEFAULT_TEXT_QA_PROMPT.format(context_str=context_str, query_str=context)
+        return await llm_gateway.complete(prompt, self.model_name, PRIORITY_INTERACTIVE)
+
+    async def generate_raw_response(self, query_text, search_results=None, query_embedding=None):
+        if LOG_PAYLOADS:
+            logger.info(f"Agent {self.agent_id} received query: {query_text}")
         
-        if not response.response.strip():
-            response.response = self.generate_fallback_response(query_text)
+        if search_results is None:
+            search = run_stage("search", async_search_web(query_text), QUERY_SEARCH_TIMEOUT, [])
+        else:
+            search = asyncio.sleep(0, result=search_results)
+        # Web search and knowledge base retrieval are independent, run them together
+        search_results, chunks = await asyncio.gather(
+            search,
+            run_stage("retrieval", self.retrieve_chunks(query_text, query_embedding), QUERY_RETRIEVAL_TIMEOUT, [])
+        )
+        if LOG_PAYLOADS:
+            logger.info(f"Web search results: {search_results}")
         
-        logger.info(f"Agent {self.agent_id} raw response: {response.response}")
+        context = self.generate_context(query_text, search_results)
         
-        final_response = await self.apply_personality(response.response, query_text, search_results)
-        logger.info(f"Agent {self.agent_id} final response: {final_response}")
+        raw_response = await run_stage("synthesis", self.synthesize(context, chunks), QUERY_SYNTHESIS_TIMEOUT, None)
         
-        self.update_memory(query_text, final_response)
+        if not raw_response or not raw_response.strip():
+            raw_response = self.generate_fallback_response(query_text)
         
-        return final_response
+        if LOG_PAYLOADS:
+            logger.info(f"Agent {self.agent_id} raw response: {raw_response}")
+        return raw_response, search_results
 
     def generate_context(self, query_text, search_results):
         context = f"You are an AI assistant with the following personality type: '{self.personality_type}'\n"
@@ -81,61 +197,84 @@ class BaseAgent:
         context += f"Based on the above information and your knowledge, please respond to the following query in a way that reflects your personality:\n\nQuery: {query_text}\n\n"
         return context
 
-    async def apply_personality(self, response, query_text, search_results):
+    def generate_personality_prompt(self, response, query_text):
         prompt = f"Given your personality type '{self.personality_type}' and interests in {', '.join(self.interests)},\n"
         prompt += f"rewrite the following response to the query '{query_text}' in a way that reflects your personality and interests:\n\n{response}\n\nPersonality-adjusted response:"
-        personality_response = await asyncio.to_thread(self.llm.complete, prompt)
-        return personality_response.text
+        return prompt
+
+    async def apply_personality(self, response, query_text, search_results):
+        prompt = self.generate_personality_prompt(response, query_text)
+        return await llm_gateway.complete(prompt, self.model_name, PRIORITY_INTERACTIVE)
 
     def generate_fallback_response(self, query_text):
         return f"I'm afraid I don't have enough information to provide a specific answer about '{query_text}'. However, as someone interested in {', '.join(self.interests)}, I'd be happy to explore this topic further with you. Could you provide more context or specify which aspect you're most curious about?"
 
     def update_memory(self, query, response):
-        self.memory.append({
-            "query": query, 
-            "response": response, 
-            "timestamp": datetime.now().isoformat()
-        })
-        if len(self.memory) > 100:  # Keep only the last 100 interactions
-            self.memory.pop(0)
-        self.save_memory()
-
-    async def check_and_learn(self):
-        current_time = datetime.now()
-        if current_time - self.last_learning_time >= self.learning_frequency:
-            await task_queue.add_task(self.async_learn())
-            self.last_learning_time = current_time
+        # Buffered in RAM and appended to the memory log by a background writer
+        with QUERY_STAGE_SECONDS.time(stage="memory_write"):
+            self.memory.append({
+                "query": query, 
+                "response": response, 
+                "timestamp": datetime.now().isoformat()
+            })
+
+    async def get_recent_interactions(self, limit=10):
+        await self.memory.aload()
+        if limit <= len(self.memory):
+            return self.memory.last(limit)
+        # Older entries are read from the log once this agent's queued writes land
+        return await asyncio.to_thread(self.memory.last, limit)
 
     async def async_learn(self):
-        article = await asyncio.to_thread(get_random_article, self.interests)
-        if article:
-            logger.info(f"Agent {self.agent_id} is learning from article: {article['title']}")
-            await self.process_article(article)
+        with self.busy():
+            self.last_learning_time = datetime.now()
+            article = await async_get_random_article(self.interests)
+            if article:
+                logger.info(f"Agent {self.agent_id} is learning from article: {article['title']}")
+                await self.process_article(article)
 
     async def process_article(self, article):
-        document = Document(text=article['content'], metadata={"source": article['url']})
-        self.knowledge_base.insert(document)
-        self.save_knowledge_base()
-        await self.evolve_interests(article['content'])
-        await self.evolve_personality(article['content'])
-
-    async def evolve_interests(self, content):
-        prompt = f"Based on the following content, suggest up to 3 new potential interests that are related to but different from {', '.join(self.interests)}:\n\n{content}\n\nNew interests:"
-        new_interests = await asyncio.to_thread(self.llm.complete, prompt)
-        new_interests = new_interests.text.split(',')
-        self.interests.extend([interest.strip() for interest in new_interests if interest.strip() not in self.interests])
-        self.interests = self.interests[:10]  # Keep only top 10 interests
-
-    async def evolve_personality(self, content):
-        prompt = f"Based on the following content and your current personality type '{self.personality_type}', suggest a slight evolution or refinement of the personality:\n\n{content}\n\nEvolved personality:"
-        evolved_personality = await asyncio.to_thread(self.llm.complete, prompt)
-        self.personality_type = evolved_personality.text.strip()
+        # Embedded only if no other agent has learned the same content before
+        await get_document_store().add_document(self.agent_id, article['url'], article['content'])
+        evolution_engine.record(self, article['content'])
+
+    async def evolve(self, contents):
+        # One structured call refines both the interests and the personality
+        with self.busy():
+            content = "\n\n---\n\n".join(contents)
+            prompt = f"Your current personality type is '{self.personality_type}' and your interests are {', '.join(self.interests)}.\n"
+            prompt += "Based on the following content, suggest up to 3 new potential interests that are related to but different from your current interests, "
+            prompt += "and a slight evolution or refinement of your personality:\n\n"
+            prompt += f"{content}\n\n"
+            prompt += 'Respond with JSON only, in the form {"interests": ["..."], "personality": "..."}.'
+            evolution_text = await llm_gateway.complete(prompt, self.model_name, PRIORITY_BACKGROUND)
+            try:
+                evolution = json.loads(evolution_text[evolution_text.index("{"):evolution_text.rindex("}") + 1])
+            except ValueError:
+                logger.warning(f"Agent {self.agent_id} got an unparseable evolution: {evolution_text}")
+                return
+            suggested = evolution.get("interests")
+            if isinstance(suggested, str):
+                # "robotics, art" instead of a list
+                suggested = suggested.split(",")
+            if not isinstance(suggested, list):
+                suggested = []
+            new_interests = [str(interest).strip() for interest in suggested]
+            interests = self.interests + [interest for interest in dict.fromkeys(new_interests) if interest and interest not in self.interests]
+            interests = interests[:10]  # Keep only top 10 interests
+            personality = evolution.get("personality")
+            evolved_personality = personality.strip() if isinstance(personality, str) else ""
+            if interests == self.interests and evolved_personality in ("", self.personality_type):
+                return
+            self.interests = interests
+            if evolved_personality:
+                self.personality_type = evolved_personality
+            self.persona_changed()
 
     async def learn_from_interaction(self, query, response):
         self.update_memory(query, response)
         # We no longer add interactions to the knowledge base
-        await self.evolve_interests(response)
-        await self.evolve_personality(response)
+        evolution_engine.record(self, response)
 
     def to_response(self) -> AgentResponse:
         return AgentResponse(
@@ -147,16 +286,16 @@ class BaseAgent:
         )
 
     @classmethod
-    def from_response(cls, response: AgentResponse):
+    def from_response(cls, response: AgentResponse, model_name: str = DEFAULT_MODEL_NAME):
+        # __init__ starts loading the memory log in a worker thread
         agent = cls(
             agent_id=response.agent_id,
             agent_create=AgentCreate(
                 personality_type=response.personality_type,
                 interests=response.interests,
                 metadata=response.metadata
-            )
+            ),
+            model_name=model_name
         )
         agent.last_learning_time = response.last_learning_time
-        agent.load_memory()
-        agent.load_knowledge_base()
-        return agent
\ No newline at end of file
+        return agent
@@ -0,0 +1,362 @@
+import asyncio
+import hashlib
+import os
+import re
+import shutil
+import sqlite3
+import threading
+from dataclasses import dataclass
+from typing import List, Optional
+import numpy as np
+from config.config import SHARED_KB_DIR, KB_RETRIEVAL_TOP_K
+from services.cache import normalize_url, LoadCancelledError
+from services.llm_gateway import llm_gateway
+from utils.logger import setup_logger
+from utils.metrics import KB_INSERT_SECONDS
+
+logger = setup_logger(__name__)
+
+# Rows the vector file grows by at least, so appends don't resize it every time
+MIN_GROWTH_ROWS = 1024
+# Per-agent VectorStoreIndex directories from before the shared store, and the
+# copies a crash mid-persist could leave behind
+LEGACY_KB_DIR = re.compile(r"^agent_(\d+)_kb(?:\.old|\.tmp)?$")
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+def split_into_chunks(content: str) -> List[str]:
+    # Same splitter (and chunk size) VectorStoreIndex used for each agent's KB
+    from llama_index.core import Settings
+    return [chunk for chunk in Settings.node_parser.split_text(content) if chunk.strip()]
+
+async def embed_chunks(chunks: List[str]):
+    return await llm_gateway.embed_texts(chunks)
+
+async def embed_query(query_text: str):
+    return await llm_gateway.embed_query(query_text)
+
+def normalize_rows(vectors) -> np.ndarray:
+    matrix = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+@dataclass
+class RetrievedChunk:
+    text: str
+    score: float
+    source: str
+
+class DocumentStore:
+    # Content-addressed documents shared by every agent's knowledge base. A
+    # document (URL + content hash) is chunked and embedded once; its unit
+    # vectors are rows of one memory-mapped float32 matrix and its chunk texts
+    # live in SQLite. An agent's knowledge base is just a namespace: the set of
+    # documents it has learned, so retrieval scans only those rows.
+    def __init__(self, directory: str = SHARED_KB_DIR):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.vectors_path = os.path.join(directory, "vectors.f32")
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(directory, "documents.db"), check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA busy_timeout=5000")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            " doc_id INTEGER PRIMARY KEY,"
+            " url TEXT NOT NULL,"
+            " content_hash TEXT NOT NULL,"
+            " first_row INTEGER NOT NULL,"
+            " row_count INTEGER NOT NULL,"
+            " UNIQUE (url, content_hash))"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS documents_by_hash ON documents (content_hash)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS chunks (row INTEGER PRIMARY KEY, text TEXT NOT NULL, source TEXT NOT NULL)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS agent_documents ("
+            " agent_id INTEGER NOT NULL,"
+            " doc_id INTEGER NOT NULL,"
+            " PRIMARY KEY (agent_id, doc_id))"
+        )
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self.vectors = None
+        # agent_id -> sorted array of the vector rows in its namespace
+        self.namespaces = {}
+        # content hash -> task producing (chunks, vectors), so concurrent
+        # learners of the same article embed it once
+        self.in_flight = {}
+        self.embedded_documents = 0
+        self.reused_documents = 0
+
+    def _get_meta(self, key: str) -> Optional[str]:
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value):
+        self.conn.execute("INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                          (key, str(value)))
+
+    def _dim(self) -> Optional[int]:
+        dim = self._get_meta("dim")
+        return int(dim) if dim else None
+
+    def _map(self, dim: int, rows_needed: int, grow: bool = False) -> np.memmap:
+        # Remaps when the file has grown, possibly in another process. Mappings
+        # handed out earlier stay valid for the rows they cover.
+        if self.vectors is not None and self.vectors.shape[0] >= rows_needed:
+            return self.vectors
+        row_bytes = dim * np.dtype(np.float32).itemsize
+        capacity = os.path.getsize(self.vectors_path) // row_bytes if os.path.exists(self.vectors_path) else 0
+        if capacity < rows_needed:
+            if not grow:
+                raise ValueError(f"Vector file has {capacity} rows, {rows_needed} are referenced")
+            capacity = max(rows_needed, capacity * 2, MIN_GROWTH_ROWS)
+            with open(self.vectors_path, "ab") as f:
+                f.truncate(capacity * row_bytes)
+        self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(capacity, dim))
+        return self.vectors
+
+    def _link(self, agent_id: int, url: str, digest: str) -> bool:
+        # Adds an already-embedded document to the agent's namespace. Same
+        # content under a new URL reuses the existing rows. Call inside a
+        # transaction; returns False if the content has never been embedded.
+        row = self.conn.execute("SELECT doc_id FROM documents WHERE url = ? AND content_hash = ?", (url, digest)).fetchone()
+        if row is None:
+            existing = self.conn.execute(
+                "SELECT first_row, row_count FROM documents WHERE content_hash = ? LIMIT 1", (digest,)
+            ).fetchone()
+            if existing is None:
+                return False
+            cursor = self.conn.execute(
+                "INSERT INTO documents (url, content_hash, first_row, row_count) VALUES (?, ?, ?, ?)",
+                (url, digest, existing[0], existing[1])
+            )
+            row = (cursor.lastrowid,)
+        self.conn.execute("INSERT OR IGNORE INTO agent_documents (agent_id, doc_id) VALUES (?, ?)", (agent_id, row[0]))
+        self.namespaces.pop(agent_id, None)
+        return True
+
+    def link_existing(self, agent_id: int, url: str, digest: str) -> bool:
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                linked = self._link(agent_id, url, digest)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return linked
+
+    def insert(self, agent_id: int, url: str, digest: str, chunks: List[str], vectors) -> bool:
+        # Returns False if someone else stored the same content meanwhile, in
+        # which case their rows are reused and these vectors are dropped
+        vectors = normalize_rows(vectors)
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                if self._link(agent_id, url, digest):
+                    self.conn.execute("COMMIT")
+                    return False
+                dim = self._dim()
+                if dim is None:
+                    dim = vectors.shape[1]
+                    self._set_meta("dim", dim)
+                elif dim != vectors.shape[1]:
+                    raise ValueError(f"Embedding dimension changed from {dim} to {vectors.shape[1]}; "
+                                     f"move {self.directory} away to rebuild the shared knowledge base")
+                first_row = int(self._get_meta("next_row") or 0)
+                matrix = self._map(dim, first_row + len(chunks), grow=True)
+                matrix[first_row:first_row + len(chunks)] = vectors
+                # Vectors reach the file before any row referencing them is committed
+                matrix.flush()
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO chunks (row, text, source) VALUES (?, ?, ?)",
+                    [(first_row + i, chunk, url) for i, chunk in enumerate(chunks)]
+                )
+                cursor = self.conn.execute(
+                    "INSERT INTO documents (url, content_hash, first_row, row_count) VALUES (?, ?, ?, ?)",
+                    (url, digest, first_row, len(chunks))
+                )
+                self.conn.execute("INSERT INTO agent_documents (agent_id, doc_id) VALUES (?, ?)", (agent_id, cursor.lastrowid))
+                self._set_meta("next_row", first_row + len(chunks))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.namespaces.pop(agent_id, None)
+        return True
+
+    async def _embed_once(self, digest: str, content: str):
+        # Shared like TTLCache.aget_or_load: a learner that is cancelled leaves
+        # the embedding running for the others
+        task = self.in_flight.get(digest)
+        if task is None:
+            task = self.in_flight[digest] = asyncio.create_task(self._embed(digest, content))
+            task.add_done_callback(lambda done: done.cancelled() or done.exception())
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if task.cancelled() and not asyncio.current_task().cancelling():
+                raise LoadCancelledError("Embedding the document was cancelled")
+            raise
+
+    async def _embed(self, digest: str, content: str):
+        try:
+            chunks = await asyncio.to_thread(split_into_chunks, content)
+            vectors = await embed_chunks(chunks) if chunks else []
+            return chunks, vectors
+        finally:
+            self.in_flight.pop(digest, None)
+
+    async def add_document(self, agent_id: int, url: str, content: str) -> bool:
+        # Returns True if the content had to be embedded, False if it was reused
+        if not content or not content.strip():
+            return False
+        with KB_INSERT_SECONDS.time():
+            url = normalize_url(url)
+            digest = content_hash(content)
+            if await asyncio.to_thread(self.link_existing, agent_id, url, digest):
+                self.reused_documents += 1
+                return False
+            chunks, vectors = await self._embed_once(digest, content)
+            if not chunks:
+                return False
+            embedded = await asyncio.to_thread(self.insert, agent_id, url, digest, chunks, vectors)
+            if embedded:
+                self.embedded_documents += 1
+            else:
+                self.reused_documents += 1
+            return embedded
+
+    def agent_rows(self, agent_id: int) -> np.ndarray:
+        with self.lock:
+            rows = self.namespaces.get(agent_id)
+            if rows is None:
+                ranges = self.conn.execute(
+                    "SELECT d.first_row, d.row_count FROM agent_documents a JOIN documents d ON d.doc_id = a.doc_id"
+                    " WHERE a.agent_id = ?", (agent_id,)
+                ).fetchall()
+                rows = np.unique(np.concatenate([np.arange(first, first + count) for first, count in ranges]
+                                                or [np.empty(0, dtype=np.int64)]))
+                self.namespaces[agent_id] = rows
+        return rows
+
+    def search(self, agent_id: int, query_embedding, top_k: int = KB_RETRIEVAL_TOP_K) -> List[RetrievedChunk]:
+        rows = self.agent_rows(agent_id)
+        if len(rows) == 0:
+            return []
+        with self.lock:
+            dim = self._dim()
+            matrix = self._map(dim, int(rows[-1]) + 1)
+        query = normalize_rows([query_embedding])[0]
+        scores = matrix[rows] @ query
+        k = min(top_k, len(rows))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        with self.lock:
+            texts = dict(
+                (row, (text, source)) for row, text, source in self.conn.execute(
+                    f"SELECT row, text, source FROM chunks WHERE row IN ({','.join('?' * k)})",
+                    [int(rows[i]) for i in best]
+                )
+            )
+        return [RetrievedChunk(texts[int(rows[i])][0], float(scores[i]), texts[int(rows[i])][1]) for i in best]
+
+    async def retrieve(self, agent_id: int, query_text: str, query_embedding=None,
+                       top_k: int = KB_RETRIEVAL_TOP_K) -> List[RetrievedChunk]:
+        # An empty knowledge base costs no embedding call. The namespace lookup
+        # can wait on the store lock behind an insert, so it runs in a thread.
+        if query_embedding is None:
+            if len(await asyncio.to_thread(self.agent_rows, agent_id)) == 0:
+                return []
+            query_embedding = await embed_query(query_text)
+        return await asyncio.to_thread(self.search, agent_id, query_embedding, top_k)
+
+    def remove_namespace(self, agent_id: int):
+        # The shared documents stay; other agents may reference them
+        with self.lock:
+            self.conn.execute("DELETE FROM agent_documents WHERE agent_id = ?", (agent_id,))
+            self.namespaces.pop(agent_id, None)
+
+    def stats(self) -> dict:
+        with self.lock:
+            documents, contents = self.conn.execute("SELECT COUNT(*), COUNT(DISTINCT content_hash) FROM documents").fetchone()
+            namespaces = self.conn.execute("SELECT COUNT(DISTINCT agent_id) FROM agent_documents").fetchone()[0]
+            chunks = int(self._get_meta("next_row") or 0)
+            dim = self._dim()
+        return {
+            "documents": documents,
+            "distinct_contents": contents,
+            "chunks": chunks,
+            "namespaces": namespaces,
+            "embedding_dim": dim,
+            "vector_bytes": chunks * (dim or 0) * np.dtype(np.float32).itemsize,
+            "embedded_documents": self.embedded_documents,
+            "reused_documents": self.reused_documents
+        }
+
+    def close(self):
+        with self.lock:
+            if self.vectors is not None:
+                self.vectors.flush()
+                self.vectors = None
+            self.conn.close()
+
+def migrate_legacy_knowledge_base(store: DocumentStore, agent_id: int, kb_dir: str):
+    # Moves a per-agent VectorStoreIndex directory into the agent's namespace,
+    # reusing its stored embeddings, and renames it to .migrated
+    old_dir = f"{kb_dir}.old"
+    if not os.path.exists(kb_dir) and os.path.exists(old_dir):
+        # A crash mid-persist left only the previous copy behind
+        os.replace(old_dir, kb_dir)
+    shutil.rmtree(f"{kb_dir}.tmp", ignore_errors=True)
+    if not os.path.exists(kb_dir):
+        return
+    from llama_index.core import StorageContext, load_index_from_storage
+    index = load_index_from_storage(StorageContext.from_defaults(persist_dir=kb_dir))
+    documents = {}
+    for node_id, node in index.docstore.docs.items():
+        try:
+            vector = index.vector_store.get(node_id)
+        except KeyError:
+            continue
+        source = normalize_url(node.metadata.get("source") or f"{kb_dir}#{node.ref_doc_id}")
+        chunks, vectors = documents.setdefault(source, ([], []))
+        chunks.append(node.get_content())
+        vectors.append(vector)
+    for source, (chunks, vectors) in documents.items():
+        store.insert(agent_id, source, content_hash("\n\n".join(chunks)), chunks, vectors)
+    os.replace(kb_dir, f"{kb_dir}.migrated")
+    logger.info(f"Migrated {len(documents)} documents from {kb_dir} to the shared knowledge base")
+
+def migrate_legacy_knowledge_bases(store: DocumentStore, base_data_dir: str):
+    # Runs once at startup, before any agent is loaded, so loading an agent
+    # never has to open an old index
+    if not os.path.isdir(base_data_dir):
+        return
+    agent_ids = sorted({int(match.group(1)) for match in map(LEGACY_KB_DIR.match, os.listdir(base_data_dir)) if match})
+    for agent_id in agent_ids:
+        try:
+            migrate_legacy_knowledge_base(store, agent_id, os.path.join(base_data_dir, f"agent_{agent_id}_kb"))
+        except Exception as e:
+            logger.error(f"Could not migrate the knowledge base of agent {agent_id}: {str(e)}")
+
+_document_store = None
+_document_store_lock = threading.Lock()
+
+def get_document_store() -> DocumentStore:
+    # Opened on first use, so importing this module creates no files
+    global _document_store
+    with _document_store_lock:
+        if _document_store is None:
+            _document_store = DocumentStore()
+    return _document_store
+
+def close_document_store():
+    global _document_store
+    with _document_store_lock:
+        if _document_store is not None:
+            _document_store.close()
+            _document_store = None
@@ -0,0 +1,92 @@
+import asyncio
+import time
+from config.config import EVOLUTION_WINDOW, EVOLUTION_BATCH_SIZE, EVOLUTION_TOKEN_BUDGET
+from utils.async_utils import wait_event
+from utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+def truncate_to_budget(contents, token_budget):
+    # Share the budget evenly between events, about four characters per token
+    if not contents:
+        return []
+    per_event = max(1, token_budget * 4 // len(contents))
+    return [content[:per_event] for content in contents]
+
+class EvolutionEngine:
+    # Buffers learning events per agent and evolves each agent with a single
+    # LLM call once it has EVOLUTION_BATCH_SIZE events or its oldest event is
+    # EVOLUTION_WINDOW seconds old.
+    def __init__(self, window: float = EVOLUTION_WINDOW, batch_size: int = EVOLUTION_BATCH_SIZE,
+                 token_budget: int = EVOLUTION_TOKEN_BUDGET):
+        self.window = window
+        self.batch_size = batch_size
+        self.token_budget = token_budget
+        self.buffers = {}
+        self.wakeup = asyncio.Event()
+        # Set by the owner of the agents, so evolution applies to the live instance
+        self.resolve_agent = None
+        self.listeners = []
+        self.evolutions = 0
+        self.events = 0
+
+    def add_listener(self, listener):
+        # Called with the agent after each evolution
+        self.listeners.append(listener)
+
+    def record(self, agent, content: str):
+        buffer = self.buffers.setdefault(agent.agent_id, {"agent": agent, "events": [], "first_at": time.monotonic()})
+        buffer["events"].append(content)
+        self.events += 1
+        if len(buffer["events"]) >= self.batch_size:
+            self.wakeup.set()
+
+    def discard(self, agent_id: int):
+        # Drops the buffered events of a deleted agent
+        self.buffers.pop(agent_id, None)
+
+    def _due_agent_ids(self):
+        now = time.monotonic()
+        return [
+            agent_id for agent_id, buffer in self.buffers.items()
+            if len(buffer["events"]) >= self.batch_size or now - buffer["first_at"] >= self.window
+        ]
+
+    async def run(self):
+        while True:
+            await wait_event(self.wakeup, min(self.window, 5.0))
+            self.wakeup.clear()
+            await self.flush(self._due_agent_ids())
+
+    async def flush(self, agent_ids=None):
+        if agent_ids is None:
+            agent_ids = list(self.buffers)
+        buffers = [(agent_id, self.buffers.pop(agent_id)) for agent_id in agent_ids if agent_id in self.buffers]
+        await asyncio.gather(*(self._evolve(agent_id, buffer) for agent_id, buffer in buffers))
+
+    async def _evolve(self, agent_id, buffer):
+        agent = self.resolve_agent(agent_id) if self.resolve_agent else buffer["agent"]
+        if agent is None:
+            # Deleted while its events were buffered
+            return
+        try:
+            await agent.evolve(truncate_to_budget(buffer["events"], self.token_budget))
+            self.evolutions += 1
+        except Exception as e:
+            logger.error(f"Evolution of agent {agent_id} failed: {str(e)}")
+            return
+        for listener in self.listeners:
+            try:
+                listener(agent)
+            except Exception as e:
+                logger.error(f"Evolution listener failed for agent {agent_id}: {str(e)}")
+
+    def stats(self) -> dict:
+        return {
+            "buffered_agents": len(self.buffers),
+            "buffered_events": sum(len(buffer["events"]) for buffer in self.buffers.values()),
+            "events": self.events,
+            "evolutions": self.evolutions
+        }
+
+evolution_engine = EvolutionEngine()
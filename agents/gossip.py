@@ -0,0 +1,115 @@
+import asyncio
+import random
+from collections import defaultdict
+from config.config import QUERY_SEARCH_TIMEOUT, GOSSIP_MAX_PAIRS, GOSSIP_CONCURRENCY
+from agents.agent_factory import normalize_interest
+from agents.base_agent import run_stage
+from services.async_web_search import async_search_web
+from services.sharding import is_sharded, owns, owner_of, shard_client
+from utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+def interaction_query(interest: str) -> str:
+    return f"What's the latest development in {interest}?"
+
+def plan_gossip_round(interest_index, max_pairs: int = GOSSIP_MAX_PAIRS, interests=None, rng=None):
+    # Pairs agents through the interest index: for each interest one teacher
+    # answers, and every partner paired with it learns from that one answer.
+    # An agent learns at most once per round; interests are visited in random
+    # order so repeated rounds spread across the whole village.
+    rng = rng or random.Random()
+    candidates = [interest for interest in (interests or interest_index) if len(interest_index.get(interest, ())) > 1]
+    rng.shuffle(candidates)
+    learned = set()
+    plan = []
+    pairs = 0
+    for interest in candidates:
+        if pairs >= max_pairs:
+            break
+        agent_ids = sorted(interest_index[interest])
+        rng.shuffle(agent_ids)
+        teacher_id = agent_ids[0]
+        learner_ids = [agent_id for agent_id in agent_ids[1:] if agent_id not in learned][:max_pairs - pairs]
+        if learner_ids:
+            learned.update(learner_ids)
+            pairs += len(learner_ids)
+            plan.append({"interest": interest, "teacher": teacher_id, "learners": learner_ids})
+    return plan
+
+async def village_interest_index(agent_factory):
+    if not is_sharded():
+        return agent_factory.get_interest_index()
+    # The factory's index only covers this worker's shard, and other workers
+    # change their agents without telling it, so a round spanning every shard
+    # is planned from the shared store
+    index = defaultdict(set)
+    for record in await asyncio.to_thread(agent_factory.store.list):
+        for interest in record.interests:
+            index[normalize_interest(interest)].add(record.agent_id)
+    return index
+
+async def ask(agent_factory, agent_id: int, query: str, search_results=None):
+    # Answered by the worker owning the agent; None if the agent is gone
+    if owns(agent_id):
+        agent = agent_factory.get_agent(agent_id)
+        return await agent.query(query, search_results=search_results) if agent else None
+    reply = await shard_client.request(owner_of(agent_id), "POST", f"/query/{agent_id}", {"query": query})
+    if reply.status_code == 404:
+        return None
+    reply.raise_for_status()
+    return reply.json()["response"]
+
+async def share_knowledge(agent_factory, agent_id: int, query: str, response: str) -> bool:
+    # Delivered to the worker owning the agent; False if the agent is gone
+    if owns(agent_id):
+        agent = agent_factory.get_agent(agent_id)
+        if agent:
+            await agent.learn_from_interaction(query, response)
+        return agent is not None
+    reply = await shard_client.request(owner_of(agent_id), "POST", f"/internal/agents/{agent_id}/learn",
+                                       {"query": query, "response": response})
+    if reply.status_code == 404:
+        return False
+    reply.raise_for_status()
+    return True
+
+async def run_gossip_round(agent_factory, max_pairs: int = GOSSIP_MAX_PAIRS, concurrency: int = GOSSIP_CONCURRENCY,
+                           interests=None):
+    plan = plan_gossip_round(await village_interest_index(agent_factory), max_pairs, interests)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def exchange(step):
+        query = interaction_query(step["interest"])
+        async with semaphore:
+            try:
+                search_results = None
+                if owns(step["teacher"]):
+                    search_results = await run_stage("search", async_search_web(query), QUERY_SEARCH_TIMEOUT, [])
+                response = await ask(agent_factory, step["teacher"], query, search_results)
+            except Exception as e:
+                logger.error(f"Gossip query to agent {step['teacher']} failed: {str(e)}")
+                return {**step, "learners": [], "error": "Query failed"}
+            if response is None:
+                return {**step, "learners": [], "error": "Teacher not found"}
+        # Learning is bookkeeping on the learners' workers, no need to hold a slot for it
+        delivered = await asyncio.gather(
+            *(share_knowledge(agent_factory, learner_id, query, response) for learner_id in step["learners"]),
+            return_exceptions=True
+        )
+        learners = []
+        for learner_id, result in zip(step["learners"], delivered):
+            if isinstance(result, Exception):
+                logger.error(f"Gossip delivery to agent {learner_id} failed: {str(result)}")
+            elif result:
+                learners.append(learner_id)
+        return {**step, "learners": learners}
+
+    exchanges = await asyncio.gather(*(exchange(step) for step in plan))
+    logger.info(f"Gossip round: {len(exchanges)} interests, {sum(len(e['learners']) for e in exchanges)} agents learned")
+    return {
+        "queries": len(exchanges),
+        "pairs": sum(len(exchange["learners"]) for exchange in exchanges),
+        "failed": sum(1 for exchange in exchanges if "error" in exchange),
+        "exchanges": exchanges
+    }
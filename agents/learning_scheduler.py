@@ -0,0 +1,121 @@
+import asyncio
+import heapq
+import random
+from datetime import datetime, timedelta
+from config.config import LEARNING_INTERVAL_HOURS, LEARNING_JITTER, LEARNING_MAX_CONCURRENT
+from services.task_queue import task_queue, PRIORITY_PERIODIC, QueueFullError
+from services.sharding import owns
+from utils.async_utils import wait_event
+from utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# How long to wait before retrying when the task queue is full
+QUEUE_FULL_RETRY = timedelta(minutes=1)
+
+class LearningScheduler:
+    # Periodic learning for every agent, driven from one min-heap of next-due
+    # times. New agents are spread uniformly over one interval, later runs are
+    # jittered, and at most max_concurrent_learners run at once.
+    def __init__(self, interval: timedelta = timedelta(hours=LEARNING_INTERVAL_HOURS), jitter: float = LEARNING_JITTER,
+                 max_concurrent_learners: int = LEARNING_MAX_CONCURRENT):
+        self.interval = interval
+        self.jitter = jitter
+        self.max_concurrent_learners = max_concurrent_learners
+        self.heap = []
+        # Authoritative due times; heap entries that disagree are stale
+        self.due_times = {}
+        self.learning = set()
+        self.wakeup = asyncio.Event()
+        self.factory = None
+        self.runs = 0
+
+    def start(self, factory):
+        # Load persisted due times; agents without one are spread over an interval.
+        # With several workers each one schedules only the agents of its shard.
+        self.factory = factory
+        schedule = factory.store.learning_schedule()
+        new_times = {}
+        for record in factory.store.list():
+            if not owns(record.agent_id):
+                continue
+            due = schedule.get(record.agent_id)
+            if due is None:
+                due = self._initial_due_time()
+                new_times[record.agent_id] = due
+            self._push(record.agent_id, due)
+        if new_times:
+            factory.store.set_next_learning_times(new_times)
+        logger.info(f"Scheduled periodic learning for {len(self.due_times)} agents")
+
+    def _initial_due_time(self) -> datetime:
+        return datetime.now() + self.interval * random.random()
+
+    def _next_due_time(self) -> datetime:
+        return datetime.now() + self.interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def _push(self, agent_id: int, due: datetime):
+        timestamp = due.timestamp()
+        self.due_times[agent_id] = timestamp
+        heapq.heappush(self.heap, (timestamp, agent_id))
+        self.wakeup.set()
+
+    def _reschedule(self, agent_id: int, due: datetime):
+        self._push(agent_id, due)
+        if self.factory:
+            self.factory.store.set_next_learning_times({agent_id: due})
+
+    def add_agent(self, agent_id: int):
+        self._reschedule(agent_id, self._initial_due_time())
+
+    def remove_agent(self, agent_id: int):
+        self.due_times.pop(agent_id, None)
+
+    async def run(self):
+        while True:
+            self.wakeup.clear()
+            now = datetime.now().timestamp()
+            while self.heap and self.heap[0][0] <= now and len(self.learning) < self.max_concurrent_learners:
+                due, agent_id = heapq.heappop(self.heap)
+                if self.due_times.get(agent_id) != due:
+                    continue
+                await self._start_learning(agent_id)
+            timeout = None
+            if self.heap and len(self.learning) < self.max_concurrent_learners:
+                timeout = max(0.0, self.heap[0][0] - datetime.now().timestamp())
+            await wait_event(self.wakeup, timeout)
+
+    async def _start_learning(self, agent_id: int):
+        if self.factory is None or self.factory.store.get(agent_id) is None:
+            self.due_times.pop(agent_id, None)
+            return
+        self.learning.add(agent_id)
+        try:
+            queued = await task_queue.add_task(self._learn(agent_id), priority=PRIORITY_PERIODIC, key=agent_id)
+        except QueueFullError:
+            self.learning.discard(agent_id)
+            self._reschedule(agent_id, datetime.now() + QUEUE_FULL_RETRY)
+            return
+        if not queued:
+            # A user-triggered learning task is already queued for this agent
+            self.learning.discard(agent_id)
+        self._reschedule(agent_id, self._next_due_time())
+
+    async def _learn(self, agent_id: int):
+        try:
+            await self.factory.learn(agent_id)
+            self.runs += 1
+        finally:
+            self.learning.discard(agent_id)
+            self.wakeup.set()
+
+    def stats(self) -> dict:
+        return {
+            "scheduled_agents": len(self.due_times),
+            "learning": len(self.learning),
+            "max_concurrent_learners": self.max_concurrent_learners,
+            "runs": self.runs,
+            "next_due": datetime.fromtimestamp(min(self.due_times.values())).isoformat() if self.due_times else None
+        }
+
+learning_scheduler = LearningScheduler()
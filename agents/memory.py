@@ -0,0 +1,226 @@
+import os
+import json
+import asyncio
+import queue
+import threading
+from collections import deque
+from config.config import MEMORY_WINDOW, MEMORY_FSYNC
+from utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+def read_last_lines(path: str, n: int, block_size: int = 8192):
+    # Read backwards from the end of the file so only the tail is touched
+    if n <= 0 or not os.path.exists(path):
+        return []
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        data = b''
+        while position > 0 and data.count(b'\n') <= n:
+            read_size = min(block_size, position)
+            position -= read_size
+            f.seek(position)
+            data = f.read(read_size) + data
+    return [line for line in data.splitlines() if line.strip()][-n:]
+
+def read_last_entries(path: str, n: int):
+    entries = []
+    for line in read_last_lines(path, n):
+        try:
+            entries.append(json.loads(line))
+        except json.JSONDecodeError:
+            # A torn final write after a crash; everything before it is intact
+            logger.warning(f"Skipping corrupt memory entry in {path}")
+    return entries
+
+class MemoryLogWriter:
+    # Single background thread shared by every agent. Whatever has queued up
+    # since the last wake-up is written as one batch (group commit).
+    def __init__(self, fsync: bool = MEMORY_FSYNC):
+        self.fsync = fsync
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+        # Operations queued but not yet written, per file
+        self.pending = {}
+        self.written = threading.Condition()
+
+    def _ensure_started(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name="memory-log-writer", daemon=True)
+                self.thread.start()
+
+    def _put(self, op: str, path: str, payload):
+        self._ensure_started()
+        with self.written:
+            self.pending[path] = self.pending.get(path, 0) + 1
+        self.queue.put((op, path, payload))
+
+    def append(self, path: str, entry: dict):
+        self._put("append", path, json.dumps(entry))
+
+    def compact(self, path: str, keep: int):
+        self._put("compact", path, keep)
+
+    def flush(self, path: str = None):
+        # Block until what is queued for path (every file if None) has reached
+        # the file system. Other agents' writes are not waited for.
+        with self.written:
+            self.written.wait_for(lambda: not self.pending.get(path) if path else not self.pending)
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write_batch(batch)
+            except Exception as e:
+                logger.error(f"Memory log write error: {str(e)}")
+            finally:
+                with self.written:
+                    for _, path, _ in batch:
+                        self.pending[path] -= 1
+                        if not self.pending[path]:
+                            del self.pending[path]
+                    self.written.notify_all()
+                for _ in batch:
+                    self.queue.task_done()
+
+    def _write_batch(self, batch):
+        open_files = {}
+        try:
+            for op, path, payload in batch:
+                if op == "append":
+                    f = open_files.get(path)
+                    if f is None:
+                        f = open_files[path] = open(path, 'a')
+                    f.write(payload + "\n")
+                else:
+                    f = open_files.pop(path, None)
+                    if f:
+                        self._close(f)
+                    self._compact(path, payload)
+        finally:
+            for f in open_files.values():
+                self._close(f)
+
+    def _close(self, f):
+        f.flush()
+        if self.fsync:
+            os.fsync(f.fileno())
+        f.close()
+
+    def _compact(self, path: str, keep: int):
+        lines = read_last_lines(path, keep)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.writelines(line + b"\n" for line in lines)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+memory_log_writer = MemoryLogWriter()
+
+class ConversationMemory:
+    # The last `window` interactions are kept in a ring buffer; the JSONL log
+    # behind it is append-only and compacted back down to `window` entries
+    # once another `window` entries have been appended. The log is read in a
+    # worker thread when the memory is created on the event loop; entries
+    # appended before that finishes are held back and written after it.
+    def __init__(self, path: str, window: int = MEMORY_WINDOW, legacy_path: str = None,
+                 writer: MemoryLogWriter = memory_log_writer):
+        self.path = path
+        self.window = window
+        self.legacy_path = legacy_path
+        self.writer = writer
+        self.appended_since_compaction = 0
+        self.entries = None
+        self.unwritten = []
+        # load_lock serializes loads (in threads); state_lock is only held briefly
+        self.load_lock = threading.Lock()
+        self.state_lock = threading.Lock()
+        try:
+            asyncio.get_running_loop().run_in_executor(None, self.load)
+        except RuntimeError:
+            self.load()
+
+    @property
+    def loaded(self) -> bool:
+        return self.entries is not None
+
+    def load(self):
+        # Blocking; on the event loop use aload()
+        with self.load_lock:
+            if self.loaded:
+                return
+            try:
+                if self.legacy_path and os.path.exists(self.legacy_path) and not os.path.exists(self.path):
+                    self._migrate_legacy(self.legacy_path)
+                # Writes queued before this agent was last evicted must land before the tail is read
+                self.writer.flush(self.path)
+                entries = read_last_entries(self.path, self.window)
+            except Exception as e:
+                logger.error(f"Could not load memory from {self.path}: {str(e)}")
+                entries = []
+            with self.state_lock:
+                self.entries = deque(entries, maxlen=self.window)
+                unwritten, self.unwritten = self.unwritten, []
+                for entry in unwritten:
+                    self._append(entry)
+
+    async def aload(self):
+        if not self.loaded:
+            await asyncio.to_thread(self.load)
+
+    def _migrate_legacy(self, legacy_path: str):
+        try:
+            with open(legacy_path, 'r') as f:
+                entries = json.load(f)
+        except json.JSONDecodeError:
+            logger.error(f"Error decoding {legacy_path}. Starting with empty memory.")
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            for entry in entries[-self.window:]:
+                f.write(json.dumps(entry) + "\n")
+        os.replace(tmp_path, self.path)
+        os.replace(legacy_path, f"{legacy_path}.migrated")
+
+    def append(self, entry: dict):
+        with self.state_lock:
+            if not self.loaded:
+                self.unwritten.append(entry)
+                return
+            self._append(entry)
+
+    def _append(self, entry: dict):
+        # Caller holds self.state_lock
+        self.entries.append(entry)
+        self.writer.append(self.path, entry)
+        self.appended_since_compaction += 1
+        if self.appended_since_compaction >= self.window:
+            self.writer.compact(self.path, self.window)
+            self.appended_since_compaction = 0
+
+    def last(self, n: int):
+        # Blocking unless the memory is loaded and n is within the window
+        self.load()
+        if n <= len(self.entries):
+            return list(self.entries)[-n:] if n > 0 else []
+        # Older entries may still be in the log if it has not been compacted yet
+        self.writer.flush(self.path)
+        return read_last_entries(self.path, n)
+
+    def __len__(self):
+        return len(self.entries) if self.loaded else 0
+
+    def flush(self):
+        # Blocking: loads the memory if needed, then waits for its queued writes
+        self.load()
+        self.writer.flush(self.path)
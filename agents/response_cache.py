@@ -0,0 +1,126 @@
+import time
+from collections import OrderedDict
+import numpy as np
+from services.cache import normalize_query
+from services.llm_gateway import llm_gateway
+from config.config import RESPONSE_CACHE_SIMILARITY, RESPONSE_CACHE_TTL, RESPONSE_CACHE_MAX_ENTRIES
+from utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+async def default_embed(text):
+    return await llm_gateway.embed_query(text)
+
+class ResponseCache:
+    # Final responses keyed on (agent, persona version, query embedding). A
+    # lookup hits when a live entry for the same agent and version is at least
+    # `similarity_threshold` cosine-similar to the query, or is the same text.
+    def __init__(self, similarity_threshold: float = RESPONSE_CACHE_SIMILARITY, ttl: float = RESPONSE_CACHE_TTL,
+                 max_entries: int = RESPONSE_CACHE_MAX_ENTRIES, embed=default_embed):
+        self.similarity_threshold = similarity_threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.embed = embed
+        # (agent_id, normalized query) -> entry, least recently used first
+        self.entries = OrderedDict()
+        self.agent_keys = {}
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _remove(self, key):
+        self.entries.pop(key, None)
+        agent_keys = self.agent_keys.get(key[0])
+        if agent_keys is not None:
+            agent_keys.discard(key)
+            if not agent_keys:
+                del self.agent_keys[key[0]]
+
+    def _is_live(self, entry, version):
+        return entry["version"] == version and entry["expires_at"] >= time.time()
+
+    async def lookup(self, agent_id: int, version: int, query_text: str):
+        # Returns (response or None, query embedding or None). On a miss the
+        # query is still embedded, so retrieval and store() can reuse it.
+        key = (agent_id, normalize_query(query_text))
+        entry = self.entries.get(key)
+        if entry is not None:
+            if self._is_live(entry, version):
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry["response"], entry["embedding"]
+            self._remove(key)
+
+        try:
+            embedding = self._normalize(await self.embed(query_text))
+        except Exception as e:
+            logger.error(f"Could not embed query for the response cache: {str(e)}")
+            self.misses += 1
+            return None, None
+
+        candidates = []
+        for candidate_key in list(self.agent_keys.get(agent_id, ())):
+            candidate = self.entries[candidate_key]
+            if self._is_live(candidate, version):
+                candidates.append((candidate_key, candidate))
+            else:
+                self._remove(candidate_key)
+        if not candidates:
+            self.misses += 1
+            return None, embedding
+
+        matrix = np.stack([candidate["embedding"] for _, candidate in candidates])
+        similarities = matrix @ embedding
+        best = int(np.argmax(similarities))
+        if similarities[best] >= self.similarity_threshold:
+            best_key, best_entry = candidates[best]
+            self.entries.move_to_end(best_key)
+            self.hits += 1
+            self.semantic_hits += 1
+            return best_entry["response"], embedding
+        self.misses += 1
+        return None, embedding
+
+    async def store(self, agent_id: int, version: int, query_text: str, response: str, embedding=None):
+        if embedding is None:
+            try:
+                embedding = self._normalize(await self.embed(query_text))
+            except Exception as e:
+                logger.error(f"Could not embed query for the response cache: {str(e)}")
+                return
+        key = (agent_id, normalize_query(query_text))
+        self.entries[key] = {
+            "version": version,
+            "embedding": embedding,
+            "response": response,
+            "expires_at": time.time() + self.ttl
+        }
+        self.entries.move_to_end(key)
+        self.agent_keys.setdefault(agent_id, set()).add(key)
+        while len(self.entries) > self.max_entries:
+            self._remove(next(iter(self.entries)))
+
+    def invalidate(self, agent_id: int):
+        for key in list(self.agent_keys.get(agent_id, ())):
+            self._remove(key)
+        self.invalidations += 1
+
+    def _normalize(self, embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "name": "responses",
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+response_cache = ResponseCache()
@@ -0,0 +1,72 @@
+"""Cold start of the real server process: interpreter start, imports and
+lifespan, up to the first successful GET /agents, and then up to /readyz.
+
+    python -m benchmarks.cold_start --runs 5
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def wait_for(url: str, deadline: float) -> bool:
+    while time.perf_counter() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return True
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(0.01)
+    return False
+
+def measure(app_dir: str, timeout: float) -> dict:
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    # Runs from a scratch directory so the data directory starts empty
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", app_dir, "--port", str(port), "--log-level", "warning"],
+        cwd=tempfile.mkdtemp(prefix="agent-village-cold-start-"),
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+    try:
+        deadline = started + timeout
+        if not wait_for(f"{base_url}/agents", deadline):
+            raise RuntimeError(f"Server did not answer /agents within {timeout}s: {server.stderr.read1().decode()[-2000:]}")
+        first_agents = time.perf_counter() - started
+        # Older trees have no readiness endpoint
+        ready = time.perf_counter() - started if wait_for(f"{base_url}/readyz", min(deadline, time.perf_counter() + 30)) else None
+        return {"first_agents_seconds": first_agents, "ready_seconds": ready}
+    finally:
+        server.terminate()
+        server.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--app-dir", default=REPO_ROOT, help="Tree to start, e.g. a worktree of an older commit")
+    args = parser.parse_args()
+
+    runs = [measure(args.app_dir, args.timeout) for _ in range(args.runs)]
+    first_agents = [run["first_agents_seconds"] for run in runs]
+    print(f"first /agents: median {statistics.median(first_agents):.2f}s, min {min(first_agents):.2f}s, max {max(first_agents):.2f}s")
+    ready = [run["ready_seconds"] for run in runs if run["ready_seconds"] is not None]
+    if ready:
+        print(f"ready:         median {statistics.median(ready):.2f}s, min {min(ready):.2f}s, max {max(ready):.2f}s")
+
+if __name__ == "__main__":
+    main()
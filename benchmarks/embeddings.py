@@ -0,0 +1,25 @@
+import zlib
+import numpy as np
+from llama_index.core.embeddings import BaseEmbedding
+
+# Kept apart from benchmarks.fakes so that importing the fakes doesn't pull in
+# llama_index before the app's own startup is measured
+
+class HashEmbedding(BaseEmbedding):
+    # Deterministic pseudo-random unit vectors, so different texts are not
+    # similar to each other (MockEmbedding returns one constant vector)
+    embed_dim: int = 64
+
+    def _vector(self, text: str):
+        rng = np.random.default_rng(zlib.crc32(text.encode()))
+        vector = rng.standard_normal(self.embed_dim)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def _get_query_embedding(self, query: str):
+        return self._vector(query)
+
+    async def _aget_query_embedding(self, query: str):
+        return self._vector(query)
+
+    def _get_text_embedding(self, text: str):
+        return self._vector(text)
@@ -0,0 +1,136 @@
+import asyncio
+import json
+import random
+import threading
+import zlib
+from types import SimpleNamespace
+from aiohttp import web
+
+TOPICS = [
+    "artificial intelligence", "space exploration", "quantum computing", "climate science", "robotics",
+    "genetics", "renewable energy", "neuroscience", "cryptography", "oceanography", "materials science",
+    "economics", "linguistics", "astronomy", "virology", "philosophy of mind"
+]
+
+SENTENCES = [
+    "Researchers announced a new result that surprised the community.",
+    "The findings build on a decade of careful measurement.",
+    "Critics argue that more data is needed before drawing conclusions.",
+    "Several teams are now racing to reproduce the experiment.",
+    "The technique could be applied to a wide range of problems.",
+    "Funding agencies have signalled strong interest in follow-up work.",
+    "Early prototypes already outperform the previous generation.",
+    "The open questions are mostly about cost and scale."
+]
+
+WORDS = " ".join(SENTENCES).split()
+
+class FakeLLM:
+    # Stand-in for the OpenAI client behind the LLM gateway: fixed latency per
+    # call, and streaming split into words with a delay per token
+    def __init__(self, latency: float = 0.05, token_latency: float = 0.005, tokens: int = 40):
+        self.latency = latency
+        self.token_latency = token_latency
+        self.tokens = tokens
+        self.calls = 0
+
+    def _text(self, prompt: str) -> str:
+        if "Respond with JSON" in prompt:
+            return json.dumps({"interests": random.sample(TOPICS, 2), "personality": "Curious and evolving researcher"})
+        return " ".join(random.choice(WORDS) for _ in range(self.tokens))
+
+    async def acomplete(self, prompt: str, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return SimpleNamespace(text=self._text(prompt))
+
+    async def astream_complete(self, prompt: str, **kwargs):
+        self.calls += 1
+        words = self._text(prompt).split(" ")
+
+        async def stream():
+            await asyncio.sleep(self.latency)
+            text = ""
+            for word in words:
+                await asyncio.sleep(self.token_latency)
+                delta = word + " "
+                text += delta
+                yield SimpleNamespace(text=text, delta=delta)
+
+        return stream()
+
+def search_page(query: str, base_url: str, num_results: int = 8) -> str:
+    # Same markup the search parser looks for: div.g > a, h3, div.VwiC3b
+    results = []
+    for i in range(num_results):
+        article_id = zlib.crc32(f"{query}|{i}".encode()) % 1000
+        results.append(
+            f'<div class="g"><a href="{base_url}/articles/{article_id}">link</a>'
+            f'<h3>{query.title()} result {i}</h3>'
+            f'<div class="VwiC3b">{random.choice(SENTENCES)}</div></div>'
+        )
+    return f"<html><body><div id=\"search\">{''.join(results)}</div></body></html>"
+
+def article_page(article_id: int, paragraphs: int = 40) -> str:
+    rng = random.Random(article_id)
+    body = "".join(
+        f"<p>{' '.join(rng.choice(SENTENCES) for _ in range(5))}</p>" for _ in range(paragraphs)
+    )
+    return (
+        f"<html><head><title>Article {article_id}</title><style>p {{ color: black; }}</style>"
+        f"<script>var tracking = {article_id};</script></head><body><h1>Article {article_id}</h1>{body}</body></html>"
+    )
+
+class StubWebServer:
+    # Local search engine and article host, served from its own thread and
+    # event loop so it does not compete with the app under test
+    def __init__(self, host: str = "127.0.0.1", latency: float = 0.01):
+        self.host = host
+        self.latency = latency
+        self.port = None
+        self.requests = 0
+        self.loop = None
+        self.thread = None
+        self.ready = threading.Event()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def _search(self, request):
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        return web.Response(text=search_page(request.query.get("q", ""), self.base_url), content_type="text/html")
+
+    async def _article(self, request):
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        return web.Response(text=article_page(int(request.match_info["article_id"])), content_type="text/html")
+
+    async def _start(self):
+        app = web.Application()
+        app.router.add_get("/search", self._search)
+        app.router.add_get("/articles/{article_id}", self._article)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, self.host, 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        self.loop.run_until_complete(self._start())
+        self.ready.set()
+        self.loop.run_forever()
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="stub-web-server", daemon=True)
+        self.thread.start()
+        self.ready.wait()
+        return self
+
+    def stop(self):
+        if self.loop:
+            asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result()
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
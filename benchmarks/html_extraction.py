@@ -0,0 +1,166 @@
+"""Page extraction benchmark: whole-page BeautifulSoup vs the streaming extractor.
+
+Runs over a local HTML corpus, either generated (small, medium and very large
+pages with navigation, scripts and styles) or read from --corpus DIR. For each
+implementation it reports pages/s, MB/s of input, peak Python memory while
+extracting, whether the text matches the legacy output, and how long the event
+loop stalls while pages are extracted "off the loop" in each mode.
+
+    python -m benchmarks.html_extraction
+    python -m benchmarks.html_extraction --corpus ~/saved_pages --processes 4
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.fakes import SENTENCES, WORDS
+from services.html_extract import extract_text, extract_text_from_bytes, FEED_CHUNK_BYTES
+from services.tokenizer import sent_tokenize
+
+def legacy_extract_text(html, max_sentences=50):
+    # services/web_search.extract_text before pages were streamed
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, 'html.parser')
+    for script in soup(["script", "style"]):
+        script.decompose()
+    text = soup.get_text()
+    lines = (line.strip() for line in text.splitlines())
+    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+    text = '\n'.join(chunk for chunk in chunks if chunk)
+    sentences = sent_tokenize(text)
+    return ' '.join(sentences[:max_sentences])
+
+def synthetic_page(rng, paragraphs, heavy_head=False):
+    nav = "".join(f'<li><a href="/section/{i}">Section {i}</a></li>' for i in range(rng.randint(10, 60)))
+    script = "var config = {" + ",".join(f'"k{i}": "{rng.random()}"' for i in range(2000 if heavy_head else 50)) + "};"
+    style = " ".join(f".c{i} {{ margin: {i}px; }}" for i in range(500 if heavy_head else 20))
+    body = "".join(
+        f"<div class=\"para\"><p>{' '.join(rng.choice(SENTENCES) for _ in range(rng.randint(2, 6)))} "
+        f"<em>{' '.join(rng.choice(WORDS) for _ in range(6))}</em> &amp; more.</p></div>\n"
+        for _ in range(paragraphs)
+    )
+    return (
+        f"<!DOCTYPE html><html><head><title>Page</title><style>{style}</style><script>{script}</script></head>"
+        f"<body><nav><ul>{nav}</ul></nav><!-- main content --><article>{body}</article>"
+        f"<footer>Copyright &copy; Example</footer><script>track();</script></body></html>"
+    )
+
+def generated_corpus(pages, seed=7):
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(pages):
+        kind = i % 3
+        if kind == 0:
+            corpus.append(synthetic_page(rng, 5))  # short news item
+        elif kind == 1:
+            corpus.append(synthetic_page(rng, 120, heavy_head=True))  # long article
+        else:
+            corpus.append(synthetic_page(rng, 8000))  # multi-megabyte dump
+    return corpus
+
+def load_corpus(directory):
+    corpus = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith((".html", ".htm")):
+            with open(os.path.join(directory, name), "rb") as f:
+                corpus.append(f.read().decode("utf-8", errors="replace"))
+    return corpus
+
+def measure(extract, corpus):
+    tracemalloc.start()
+    started = time.perf_counter()
+    outputs = [extract(html) for html in corpus]
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return outputs, elapsed, peak
+
+async def loop_lag(extract_all):
+    # Largest gap between 1 ms ticks of the event loop while extraction runs
+    worst = 0.0
+    running = True
+
+    async def ticker():
+        nonlocal worst
+        last = time.perf_counter()
+        while running:
+            await asyncio.sleep(0.001)
+            now = time.perf_counter()
+            worst = max(worst, now - last - 0.001)
+            last = now
+
+    tick = asyncio.create_task(ticker())
+    await extract_all()
+    running = False
+    await tick
+    return worst
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="Directory of .html files; generated when omitted")
+    parser.add_argument("--pages", type=int, default=30, help="Generated pages")
+    parser.add_argument("--processes", type=int, default=2, help="Extraction processes for the pool run")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus) if args.corpus else generated_corpus(args.pages)
+    corpus_bytes = [html.encode("utf-8") for html in corpus]
+    megabytes = sum(len(data) for data in corpus_bytes) / (1024 * 1024)
+    print(f"{len(corpus)} pages, {megabytes:.1f} MB, largest {max(map(len, corpus_bytes)) / 1024:.0f} KB")
+
+    legacy, legacy_seconds, legacy_peak = measure(legacy_extract_text, corpus)
+    streamed, streamed_seconds, streamed_peak = measure(extract_text, corpus)
+    matching = sum(a == b for a, b in zip(legacy, streamed))
+    for label, seconds, peak in (("legacy", legacy_seconds, legacy_peak), ("streaming", streamed_seconds, streamed_peak)):
+        print(f"  {label:<10} {len(corpus) / seconds:8.1f} pages/s  {megabytes / seconds:7.1f} MB/s  "
+              f"peak {peak / (1024 * 1024):7.1f} MB")
+    print(f"  speedup {legacy_seconds / streamed_seconds:.1f}x, identical output for {matching}/{len(corpus)} pages")
+
+    async def in_threads(extract):
+        await asyncio.gather(*(asyncio.to_thread(extract, html) for html in corpus))
+
+    async def in_chunks():
+        # What AsyncWebClient.fetch does: one thread hop per received chunk
+        from services.html_extract import TextExtractor
+        async def one(html):
+            extractor = TextExtractor()
+            for start in range(0, len(html), FEED_CHUNK_BYTES):
+                await asyncio.to_thread(extractor.feed, html[start:start + FEED_CHUNK_BYTES])
+                if extractor.done:
+                    break
+            return await asyncio.to_thread(extractor.result)
+        await asyncio.gather(*(one(html) for html in corpus))
+
+    async def in_processes(pool):
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(pool, extract_text_from_bytes, data, "utf-8") for data in corpus_bytes))
+
+    async def lags():
+        results = [
+            ("legacy, thread per page", await loop_lag(lambda: in_threads(legacy_extract_text))),
+            ("streaming, thread per chunk", await loop_lag(in_chunks)),
+        ]
+        with ProcessPoolExecutor(args.processes) as pool:
+            # Warm the workers so process start-up is not counted
+            await in_processes(pool)
+            started = time.perf_counter()
+            lag = await loop_lag(lambda: in_processes(pool))
+            elapsed = time.perf_counter() - started
+            results.append((f"streaming, {args.processes} processes", lag))
+        return results, elapsed
+
+    results, pool_seconds = asyncio.run(lags())
+    print("Worst event loop stall while extracting the corpus concurrently:")
+    for label, lag in results:
+        print(f"  {label:<28} {lag * 1000:8.1f} ms")
+    print(f"  process pool throughput {len(corpus) / pool_seconds:.1f} pages/s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+"""Offline load benchmark for the FastAPI app in main.py.
+
+Everything external is replaced by local stand-ins: a fake LLM behind the
+LLM gateway, hash-based embeddings, and a stub search engine / article host.
+Each village size runs in a fresh subprocess so startup time and RSS are
+measured from a cold start. Results are written to benchmarks/results and
+compared with the previous run.
+
+    python -m benchmarks.run_benchmarks --agents 10,1000,10000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+SCENARIOS = ["query", "learn", "interact", "gossip", "crud"]
+
+def percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize() / (1024 * 1024)
+    except (OSError, IndexError, ValueError):
+        return 0.0
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def seed_agents(count, topics):
+    from agents.agent_store import create_agent_store
+    from config.config import AGENT_STORE_BACKEND, BASE_DATA_DIR
+    from models import AgentResponse
+    os.makedirs(BASE_DATA_DIR, exist_ok=True)
+    store = create_agent_store(AGENT_STORE_BACKEND, BASE_DATA_DIR)
+    rng = random.Random(42)
+    for _ in range(count):
+        agent_id = store.allocate_id()
+        store.upsert(AgentResponse(
+            agent_id=agent_id,
+            personality_type=rng.choice(["Curious", "Skeptical", "Enthusiastic", "Methodical"]) + " researcher",
+            interests=rng.sample(topics, 3),
+            metadata={"seeded": "true"},
+            last_learning_time=datetime.now()
+        ))
+    store.close()
+
+def request_factory(scenario, agent_count, topics):
+    created = []
+
+    def next_request(i):
+        agent_id = random.randint(1, agent_count)
+        if scenario == "query":
+            return "POST", f"/query/{agent_id}", {"query": f"What is new in {random.choice(topics)}? ({i})"}
+        if scenario == "learn":
+            return "POST", f"/agents/{agent_id}/learn", None
+        if scenario == "interact":
+            return "POST", f"/agents/{agent_id}/interact/{random.randint(1, agent_count)}", None
+        if scenario == "gossip":
+            return "POST", "/gossip/round", {"max_pairs": 50}
+        # crud: create, read, update, delete, with the occasional full listing
+        step = i % 5
+        if step == 0:
+            return "POST", "/agents", {
+                "personality_type": "Benchmark agent", "interests": random.sample(topics, 2), "metadata": {}
+            }
+        if step == 4 and i % 50 == 4:
+            return "GET", "/agents", None
+        target = created.pop() if step == 3 and created else agent_id
+        if step == 1:
+            return "GET", f"/agents/{target}", None
+        if step == 2:
+            return "PUT", f"/agents/{target}", {"metadata": {"touched": str(i)}}
+        if step == 3:
+            return "DELETE", f"/agents/{target}", None
+        return "GET", f"/agents/{agent_id}", None
+
+    return next_request, created
+
+async def run_scenario(client, scenario, agent_count, topics, requests, concurrency):
+    next_request, created = request_factory(scenario, agent_count, topics)
+    latencies = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            method, path, body = next_request(i)
+            started = time.perf_counter()
+            response = await client.request(method, path, json=body)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+            elif method == "POST" and path == "/agents":
+                created.append(response.json()["agent_id"])
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "rss_mb": rss_mb()
+    }
+
+async def run_worker(args):
+    # Runs in its own process: seeds a village in a scratch directory and
+    # drives main.app in-process through httpx's ASGI transport
+    sys.path.insert(0, REPO_ROOT)
+    from benchmarks.fakes import StubWebServer, FakeLLM, TOPICS
+
+    os.chdir(tempfile.mkdtemp(prefix="agent-village-bench-"))
+    stub = StubWebServer(latency=args.web_latency).start()
+    os.environ["SEARCH_URL"] = f"{stub.base_url}/search"
+    os.environ.setdefault("LLM_REQUESTS_PER_MINUTE", "1000000")
+    os.environ.setdefault("LLM_TOKENS_PER_MINUTE", "1000000000")
+    os.environ.setdefault("TASK_QUEUE_DRAIN_TIMEOUT", "5")
+    os.environ.setdefault("LOG_PAYLOADS", "false")
+    seed_agents(args.agents, TOPICS)
+
+    import httpx
+    started = time.perf_counter()
+    import main
+    imported = time.perf_counter()
+
+    result = {"agents": args.agents, "scenarios": {}}
+    async with main.lifespan(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+            response = await client.get("/agents")
+            response.raise_for_status()
+            result["import_seconds"] = imported - started
+            result["startup_seconds"] = time.perf_counter() - started
+            result["rss_after_startup_mb"] = rss_mb()
+
+            # Installed after startup is measured; importing them loads llama_index
+            from llama_index.core import Settings
+            from benchmarks.embeddings import HashEmbedding
+            from config.config import DEFAULT_MODEL_NAME
+            from services.llm_gateway import llm_gateway
+            Settings.embed_model = HashEmbedding()
+            fake_llm = FakeLLM(latency=args.llm_latency, token_latency=args.token_latency)
+            llm_gateway.set_llm(DEFAULT_MODEL_NAME, fake_llm)
+            for scenario in args.scenarios:
+                result["scenarios"][scenario] = await run_scenario(
+                    client, scenario, args.agents, TOPICS, args.requests, args.concurrency
+                )
+    result["peak_rss_mb"] = peak_rss_mb()
+    result["llm_calls"] = fake_llm.calls
+    result["web_requests"] = stub.requests
+    stub.stop()
+    return result
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def latest_results(exclude=None):
+    if not os.path.isdir(RESULTS_DIR):
+        return None
+    files = sorted(name for name in os.listdir(RESULTS_DIR) if name.endswith(".json") and name != exclude)
+    if not files:
+        return None
+    with open(os.path.join(RESULTS_DIR, files[-1])) as f:
+        return json.load(f)
+
+def compare(previous, current, threshold):
+    # Flag latency increases and throughput drops beyond the threshold
+    previous_runs = {run["agents"]: run for run in previous["runs"]}
+    lines = [f"Compared with {previous['timestamp']} ({previous.get('commit')}):"]
+    for run in current["runs"]:
+        before = previous_runs.get(run["agents"])
+        if not before:
+            continue
+        for scenario, stats in run["scenarios"].items():
+            old = before["scenarios"].get(scenario)
+            if not old:
+                continue
+            for metric, higher_is_worse in (("p50_ms", True), ("p99_ms", True), ("throughput_rps", False)):
+                if not old[metric]:
+                    continue
+                change = (stats[metric] - old[metric]) / old[metric]
+                regressed = change > threshold if higher_is_worse else change < -threshold
+                marker = "  REGRESSION" if regressed else ""
+                lines.append(f"  {run['agents']:>6} agents {scenario:<9} {metric:<15} {old[metric]:>10.2f} -> {stats[metric]:>10.2f} ({change:+.1%}){marker}")
+        if before.get("startup_seconds"):
+            change = (run["startup_seconds"] - before["startup_seconds"]) / before["startup_seconds"]
+            marker = "  REGRESSION" if change > threshold else ""
+            lines.append(f"  {run['agents']:>6} agents startup_seconds {before['startup_seconds']:.2f} -> {run['startup_seconds']:.2f} ({change:+.1%}){marker}")
+    return "\n".join(lines)
+
+def print_run(run):
+    print(f"{run['agents']} agents: startup {run['startup_seconds']:.2f}s (import {run['import_seconds']:.2f}s), "
+          f"RSS {run['rss_after_startup_mb']:.0f} MB after startup, peak {run['peak_rss_mb']:.0f} MB")
+    for scenario, stats in run["scenarios"].items():
+        print(f"  {scenario:<9} p50 {stats['p50_ms']:8.1f} ms  p99 {stats['p99_ms']:8.1f} ms  "
+              f"{stats['throughput_rps']:8.1f} req/s  errors {stats['errors']}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--agents", default="10,1000,10000", help="Comma-separated village sizes")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated subset of " + ",".join(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=500, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Seconds per fake LLM call")
+    parser.add_argument("--token-latency", type=float, default=0.002, help="Seconds per streamed fake token")
+    parser.add_argument("--web-latency", type=float, default=0.01, help="Seconds per stub web request")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative change reported as a regression")
+    parser.add_argument("--no-save", action="store_true", help="Do not store the results")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.scenarios = [scenario for scenario in args.scenarios.split(",") if scenario]
+
+    if args.worker:
+        args.agents = int(args.agents)
+        print(json.dumps(asyncio.run(run_worker(args))))
+        return
+
+    runs = []
+    for agent_count in (int(size) for size in args.agents.split(",")):
+        command = [
+            sys.executable, "-m", "benchmarks.run_benchmarks", "--worker", "--agents", str(agent_count),
+            "--scenarios", ",".join(args.scenarios), "--requests", str(args.requests),
+            "--concurrency", str(args.concurrency), "--llm-latency", str(args.llm_latency),
+            "--token-latency", str(args.token_latency), "--web-latency", str(args.web_latency)
+        ]
+        completed = subprocess.run(command, cwd=REPO_ROOT, capture_output=True, text=True)
+        if completed.returncode != 0:
+            print(completed.stderr[-4000:], file=sys.stderr)
+            raise SystemExit(f"Benchmark worker for {agent_count} agents failed")
+        run = json.loads(completed.stdout.strip().splitlines()[-1])
+        print_run(run)
+        runs.append(run)
+
+    results = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("worker", "no_save")},
+        "runs": runs
+    }
+    previous = latest_results()
+    if previous:
+        print(compare(previous, results, args.threshold))
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"bench_{results['timestamp'].replace(':', '')}.json")
+        with open(path, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {path}")
+
+if __name__ == "__main__":
+    main()
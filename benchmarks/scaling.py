@@ -0,0 +1,159 @@
+"""Multi-worker scaling benchmark.
+
+Starts cluster.py with 1, 2, 4... workers over the same seeded village (fake
+LLM, hash embeddings and a stub web server, as in run_benchmarks) and drives it
+over TCP from several load-generator processes. Requests hit random agents, so
+with N workers roughly (N-1)/N of them are forwarded to the owning worker.
+
+    python -m benchmarks.scaling --workers 1,2,4 --agents 1000
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.run_benchmarks import percentile, seed_agents
+
+SCENARIOS = ["query", "read"]
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def wait_until_ready(base_url, workers, process, timeout=120):
+    # Every worker must have answered /healthz and the cluster must be ready
+    import httpx
+    seen = set()
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit("Cluster exited during startup")
+        try:
+            health = httpx.get(f"{base_url}/healthz", timeout=2)
+            seen.add(health.json()["worker"])
+            if len(seen) == workers and httpx.get(f"{base_url}/readyz", timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.05)
+    raise SystemExit(f"Cluster did not become ready, workers seen: {sorted(seen)}")
+
+def generate_load(base_url, scenario, agent_count, requests, concurrency, seed):
+    # Runs in a load-generator process; returns latencies and the error count
+    import httpx
+    rng = random.Random(seed)
+
+    async def run():
+        latencies = []
+        errors = 0
+        counter = iter(range(requests))
+        limits = httpx.Limits(max_connections=concurrency)
+        async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+            async def worker():
+                nonlocal errors
+                for i in counter:
+                    agent_id = rng.randint(1, agent_count)
+                    started = time.perf_counter()
+                    try:
+                        if scenario == "query":
+                            response = await client.post(f"/query/{agent_id}", json={"query": f"Any news? ({seed}-{i})"})
+                        else:
+                            response = await client.get(f"/agents/{agent_id}")
+                        if response.status_code >= 400:
+                            errors += 1
+                    except httpx.HTTPError:
+                        errors += 1
+                    latencies.append(time.perf_counter() - started)
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return latencies, errors
+
+    return asyncio.run(run())
+
+def run_load(base_url, scenario, args):
+    per_client = args.requests // args.clients
+    jobs = [(base_url, scenario, args.agents, per_client, args.concurrency, seed) for seed in range(args.clients)]
+    with multiprocessing.get_context("spawn").Pool(args.clients) as pool:
+        started = time.perf_counter()
+        results = pool.starmap(generate_load, jobs)
+        elapsed = time.perf_counter() - started
+    latencies = [latency for client_latencies, _ in results for latency in client_latencies]
+    return {
+        "requests": len(latencies),
+        "errors": sum(errors for _, errors in results),
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0
+    }
+
+def run_cluster(workers, stub, args):
+    data_dir = tempfile.mkdtemp(prefix="agent-village-scaling-")
+    os.chdir(data_dir)
+    from benchmarks.fakes import TOPICS
+    seed_agents(args.agents, TOPICS)
+    port = free_port()
+    env = dict(
+        os.environ, SEARCH_URL=f"{stub.base_url}/search", LLM_REQUESTS_PER_MINUTE="1000000",
+        LLM_TOKENS_PER_MINUTE="1000000000", LOG_PAYLOADS="false", BENCH_LLM_LATENCY=str(args.llm_latency),
+        PYTHONPATH=REPO_ROOT
+    )
+    command = [
+        sys.executable, os.path.join(REPO_ROOT, "cluster.py"), "--workers", str(workers), "--host", "127.0.0.1",
+        "--port", str(port), "--app", "benchmarks.stub_app:app", "--log-level", "warning", "--graceful-timeout", "5"
+    ]
+    with open(os.path.join(data_dir, "cluster.log"), "w") as log:
+        process = subprocess.Popen(command, cwd=data_dir, env=env, stdout=log, stderr=subprocess.STDOUT)
+        base_url = f"http://127.0.0.1:{port}"
+        try:
+            wait_until_ready(base_url, workers, process)
+            return {scenario: run_load(base_url, scenario, args) for scenario in args.scenarios}
+        finally:
+            process.send_signal(signal.SIGINT)
+            try:
+                process.wait(timeout=60)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,2,4", help="Comma-separated worker counts")
+    parser.add_argument("--agents", type=int, default=1000)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated subset of " + ",".join(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=2000, help="Requests per scenario")
+    parser.add_argument("--clients", type=int, default=4, help="Load-generator processes")
+    parser.add_argument("--concurrency", type=int, default=16, help="Requests in flight per load generator")
+    parser.add_argument("--llm-latency", type=float, default=0.01, help="Seconds per fake LLM call")
+    args = parser.parse_args()
+    args.scenarios = [scenario for scenario in args.scenarios.split(",") if scenario]
+    worker_counts = [int(count) for count in args.workers.split(",")]
+
+    from benchmarks.fakes import StubWebServer
+    stub = StubWebServer(latency=0.001).start()
+    cpus = os.cpu_count() or 1
+    print(f"{cpus} CPUs, {args.agents} agents, {args.clients} load generators x {args.concurrency} in flight")
+    if max(worker_counts) > cpus:
+        print(f"  note: more workers than CPUs, throughput cannot scale past {cpus} workers here")
+    baseline = {}
+    try:
+        for workers in worker_counts:
+            results = run_cluster(workers, stub, args)
+            for scenario, stats in results.items():
+                baseline.setdefault(scenario, stats["throughput_rps"])
+                speedup = stats["throughput_rps"] / baseline[scenario] if baseline[scenario] else 0.0
+                print(f"  {workers:>2} workers {scenario:<6} {stats['throughput_rps']:8.1f} req/s ({speedup:.2f}x)  "
+                      f"p50 {stats['p50_ms']:7.1f} ms  p99 {stats['p99_ms']:7.1f} ms  errors {stats['errors']}")
+    finally:
+        stub.stop()
+
+if __name__ == "__main__":
+    main()
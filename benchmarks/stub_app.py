@@ -0,0 +1,16 @@
+# main.app with the LLM and embeddings replaced by the local stand-ins, for
+# benchmarks that run the app in separate server processes:
+#     python cluster.py --app benchmarks.stub_app:app
+import os
+from llama_index.core import Settings
+from benchmarks.embeddings import HashEmbedding
+from benchmarks.fakes import FakeLLM
+from config.config import DEFAULT_MODEL_NAME
+from services.llm_gateway import llm_gateway
+from main import app
+
+Settings.embed_model = HashEmbedding()
+llm_gateway.set_llm(DEFAULT_MODEL_NAME, FakeLLM(
+    latency=float(os.getenv("BENCH_LLM_LATENCY", "0.05")),
+    token_latency=float(os.getenv("BENCH_TOKEN_LATENCY", "0.002"))
+))
@@ -0,0 +1,107 @@
+"""Run the agent village on several worker processes.
+
+Every worker serves the public port (the kernel spreads connections between
+them) and a private Unix socket. Agents are sharded by agent ID; a worker that
+receives a request for an agent it does not own forwards it to the owner, so
+each agent's memory, schedule and learning live in exactly one process.
+
+    python cluster.py --workers 4 --port 8000
+"""
+import argparse
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+def prepare_data_dir():
+    # One-off migrations run here, before the workers could race on them
+    from agents.agent_store import create_agent_store, migrate_legacy_agents_file
+    from agents.document_store import DocumentStore, migrate_legacy_knowledge_bases
+    from config.config import AGENT_STORE_BACKEND, BASE_DATA_DIR, WORKER_SOCKET_DIR
+    os.makedirs(BASE_DATA_DIR, exist_ok=True)
+    os.makedirs(WORKER_SOCKET_DIR, exist_ok=True)
+    store = create_agent_store(AGENT_STORE_BACKEND, BASE_DATA_DIR)
+    migrate_legacy_agents_file(store, os.path.join(BASE_DATA_DIR, "agents.json"))
+    store.close()
+    document_store = DocumentStore()
+    migrate_legacy_knowledge_bases(document_store, BASE_DATA_DIR)
+    document_store.close()
+
+def run_worker(args):
+    import uvicorn
+    from services.sharding import worker_socket
+    public = socket.socket(fileno=args.fd)
+    path = worker_socket(args.worker_id)
+    if os.path.exists(path):
+        os.unlink(path)
+    private = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    private.bind(path)
+    config = uvicorn.Config(args.app, log_level=args.log_level, timeout_graceful_shutdown=args.graceful_timeout)
+    uvicorn.Server(config).run(sockets=[public, private])
+
+def start_worker(args, listener, worker_id):
+    env = dict(os.environ, WORKER_COUNT=str(args.workers), WORKER_ID=str(worker_id))
+    command = [
+        sys.executable, os.path.join(REPO_ROOT, "cluster.py"), "--worker-id", str(worker_id), "--fd", str(listener.fileno()),
+        "--app", args.app, "--log-level", args.log_level, "--graceful-timeout", str(args.graceful_timeout)
+    ]
+    return subprocess.Popen(command, env=env, pass_fds=[listener.fileno()])
+
+def run_cluster(args):
+    os.environ["WORKER_COUNT"] = str(args.workers)
+    prepare_data_dir()
+    listener = socket.socket(socket.AF_INET6 if ":" in args.host else socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((args.host, args.port))
+    listener.listen(2048)
+    print(f"Serving on http://{args.host}:{args.port} with {args.workers} workers", flush=True)
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    workers = {worker_id: start_worker(args, listener, worker_id) for worker_id in range(args.workers)}
+    # Restart crashed workers; a worker owns its shard, nobody else can serve it
+    while not stopping:
+        for worker_id, process in list(workers.items()):
+            if process.poll() is not None:
+                print(f"Worker {worker_id} exited with {process.returncode}, restarting", file=sys.stderr, flush=True)
+                workers[worker_id] = start_worker(args, listener, worker_id)
+        time.sleep(0.5)
+
+    for process in workers.values():
+        process.send_signal(signal.SIGTERM)
+    for process in workers.values():
+        try:
+            process.wait(timeout=args.graceful_timeout + 30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    listener.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--app", default="main:app", help="ASGI app each worker serves")
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--graceful-timeout", type=int, default=30, help="Seconds a worker waits for open requests on shutdown")
+    parser.add_argument("--worker-id", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--fd", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    sys.path.insert(0, REPO_ROOT)
+    if args.worker_id is not None:
+        run_worker(args)
+    else:
+        run_cluster(args)
+
+if __name__ == "__main__":
+    main()
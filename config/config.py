@@ -3,9 +3,131 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+# Checked when the first LLM call is made, so the API can start without it
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-if not OPENAI_API_KEY:
-    raise ValueError("Please set the OPENAI_API_KEY environment variable")
 
 BASE_DATA_DIR = "data"
-DEFAULT_MODEL_NAME = "gpt-3.5-turbo"
\ No newline at end of file
+DEFAULT_MODEL_NAME = "gpt-3.5-turbo"
+
+# Agent registry: how many materialized agents to keep in memory, and an optional
+# RSS budget (in MB, 0 disables it) past which the cache is gradually shrunk
+# to a quarter of its size. Only idle agents are evicted.
+AGENT_CACHE_SIZE = int(os.getenv("AGENT_CACHE_SIZE", "256"))
+AGENT_CACHE_MAX_RSS_MB = int(os.getenv("AGENT_CACHE_MAX_RSS_MB", "0"))
+
+# Where agent metadata lives: "sqlite" (WAL mode) or "file" (one JSON file per agent)
+AGENT_STORE_BACKEND = os.getenv("AGENT_STORE_BACKEND", "sqlite")
+
+# Conversation memory: how many interactions each agent keeps, and whether the
+# append-only memory log is fsynced after every group commit
+MEMORY_WINDOW = int(os.getenv("MEMORY_WINDOW", "100"))
+MEMORY_FSYNC = os.getenv("MEMORY_FSYNC", "false").lower() == "true"
+
+# Knowledge bases: every learned article is embedded once into a store shared
+# by all agents, each agent retrieving the KB_RETRIEVAL_TOP_K best chunks of
+# the articles it has learned
+SHARED_KB_DIR = os.getenv("SHARED_KB_DIR", os.path.join(BASE_DATA_DIR, "shared_kb"))
+KB_RETRIEVAL_TOP_K = int(os.getenv("KB_RETRIEVAL_TOP_K", "2"))
+
+# Shared web search / page cache (TTLs in seconds). With WEB_CACHE_ON_DISK the
+# cache also survives restarts under BASE_DATA_DIR/web_cache
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "3600"))
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "2048"))
+PAGE_CACHE_TTL = float(os.getenv("PAGE_CACHE_TTL", "86400"))
+PAGE_CACHE_SIZE = int(os.getenv("PAGE_CACHE_SIZE", "512"))
+WEB_CACHE_ON_DISK = os.getenv("WEB_CACHE_ON_DISK", "false").lower() == "true"
+
+# Outbound HTTP for web search and page fetches
+SEARCH_URL = os.getenv("SEARCH_URL", "https://www.google.com/search")
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "10"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_CONNECTIONS_PER_HOST = int(os.getenv("HTTP_MAX_CONNECTIONS_PER_HOST", "8"))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "3"))
+HTTP_BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", "0.5"))
+
+# Background task queue: worker count, bound on queued tasks, and how long
+# shutdown waits for queued tasks to finish
+TASK_QUEUE_WORKERS = int(os.getenv("TASK_QUEUE_WORKERS", "3"))
+TASK_QUEUE_MAX_SIZE = int(os.getenv("TASK_QUEUE_MAX_SIZE", "1000"))
+TASK_QUEUE_DRAIN_TIMEOUT = float(os.getenv("TASK_QUEUE_DRAIN_TIMEOUT", "30"))
+
+# Per-stage timeouts (seconds) for BaseAgent.query; a stage that runs over
+# degrades gracefully instead of failing the whole query
+QUERY_CACHE_LOOKUP_TIMEOUT = float(os.getenv("QUERY_CACHE_LOOKUP_TIMEOUT", "5"))
+QUERY_SEARCH_TIMEOUT = float(os.getenv("QUERY_SEARCH_TIMEOUT", "5"))
+QUERY_RETRIEVAL_TIMEOUT = float(os.getenv("QUERY_RETRIEVAL_TIMEOUT", "10"))
+QUERY_SYNTHESIS_TIMEOUT = float(os.getenv("QUERY_SYNTHESIS_TIMEOUT", "30"))
+QUERY_PERSONALITY_TIMEOUT = float(os.getenv("QUERY_PERSONALITY_TIMEOUT", "30"))
+
+# Per-agent cache of final responses for repeated and near-duplicate queries
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.95"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "10000"))
+
+# Batch queries: how many agents answer at once by default, and the upper
+# bound a request may ask for
+BATCH_QUERY_CONCURRENCY = int(os.getenv("BATCH_QUERY_CONCURRENCY", "8"))
+BATCH_QUERY_MAX_CONCURRENCY = int(os.getenv("BATCH_QUERY_MAX_CONCURRENCY", "64"))
+
+# Shared LLM gateway: provider rate limits, global concurrency cap, retries,
+# and the completion length assumed when budgeting tokens for a call
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "500"))
+LLM_TOKENS_PER_MINUTE = float(os.getenv("LLM_TOKENS_PER_MINUTE", "200000"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "1.0"))
+LLM_EXPECTED_COMPLETION_TOKENS = int(os.getenv("LLM_EXPECTED_COMPLETION_TOKENS", "256"))
+
+# Personality/interest evolution: learning events are batched per agent and
+# evolved with one LLM call per EVOLUTION_WINDOW seconds or EVOLUTION_BATCH_SIZE
+# events, with the content trimmed to EVOLUTION_TOKEN_BUDGET tokens
+EVOLUTION_WINDOW = float(os.getenv("EVOLUTION_WINDOW", "300"))
+EVOLUTION_BATCH_SIZE = int(os.getenv("EVOLUTION_BATCH_SIZE", "5"))
+EVOLUTION_TOKEN_BUDGET = int(os.getenv("EVOLUTION_TOKEN_BUDGET", "1500"))
+
+# Periodic learning: every agent learns about once per LEARNING_INTERVAL_HOURS,
+# give or take LEARNING_JITTER of the interval, with at most
+# LEARNING_MAX_CONCURRENT agents learning at the same time
+LEARNING_INTERVAL_HOURS = float(os.getenv("LEARNING_INTERVAL_HOURS", "8"))
+LEARNING_JITTER = float(os.getenv("LEARNING_JITTER", "0.1"))
+LEARNING_MAX_CONCURRENT = int(os.getenv("LEARNING_MAX_CONCURRENT", "3"))
+
+# Observability: LOG_PAYLOADS logs queries, search results and responses in
+# full on every request; TRACING_ENABLED emits OpenTelemetry spans for query
+# stages when the opentelemetry package is installed
+LOG_PAYLOADS = os.getenv("LOG_PAYLOADS", "true").lower() == "true"
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() == "true"
+
+# Startup: NLTK tokenizer data is read from NLTK_DATA_DIR (populate it with
+# `python -m services.tokenizer`) and never downloaded at runtime. With
+# WARM_UP_ON_START the LLM and index libraries are imported in the background
+# right after startup; /readyz reports ready once that is done.
+NLTK_DATA_DIR = os.getenv("NLTK_DATA_DIR", os.path.join(BASE_DATA_DIR, "nltk_data"))
+WARM_UP_ON_START = os.getenv("WARM_UP_ON_START", "true").lower() == "true"
+
+# Page extraction: bodies are read and parsed incrementally, stopping after
+# PAGE_MAX_BYTES or once PAGE_MAX_SENTENCES sentences have been found. With
+# HTML_EXTRACT_PROCESSES > 0 parsing runs in a process pool instead of threads.
+PAGE_MAX_BYTES = int(os.getenv("PAGE_MAX_BYTES", str(2 * 1024 * 1024)))
+PAGE_MAX_SENTENCES = int(os.getenv("PAGE_MAX_SENTENCES", "50"))
+HTML_EXTRACT_PROCESSES = int(os.getenv("HTML_EXTRACT_PROCESSES", "0"))
+
+# Gossip rounds: agents sharing an interest exchange knowledge, one query per
+# interest, at most GOSSIP_MAX_PAIRS learners per round, GOSSIP_CONCURRENCY
+# queries in flight
+GOSSIP_MAX_PAIRS = int(os.getenv("GOSSIP_MAX_PAIRS", "200"))
+GOSSIP_CONCURRENCY = int(os.getenv("GOSSIP_CONCURRENCY", "8"))
+
+# Multi-worker mode (see cluster.py): agents are sharded across WORKER_COUNT
+# processes by agent ID, and each worker also listens on a private Unix socket
+# in WORKER_SOCKET_DIR for requests forwarded by the others
+WORKER_COUNT = int(os.getenv("WORKER_COUNT", "1"))
+WORKER_ID = int(os.getenv("WORKER_ID", "0"))
+WORKER_SOCKET_DIR = os.getenv("WORKER_SOCKET_DIR", os.path.join(BASE_DATA_DIR, "run"))
+# Timeouts (seconds) for requests forwarded between workers. Reads wait for a
+# whole agent query; streamed responses (forwarded agent requests, batch
+# fan-out) may go quiet for longer between chunks
+SHARD_CONNECT_TIMEOUT = float(os.getenv("SHARD_CONNECT_TIMEOUT", "5"))
+SHARD_READ_TIMEOUT = float(os.getenv("SHARD_READ_TIMEOUT", "120"))
+SHARD_STREAM_READ_TIMEOUT = float(os.getenv("SHARD_STREAM_READ_TIMEOUT", "300"))
@@ -1,50 +1,145 @@
-from fastapi import FastAPI, HTTPException
-from contextlib import asynccontextmanager
-from agents.agent_factory import AgentFactory
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
+from contextlib import asynccontextmanager, ExitStack
+from starlette.background import BackgroundTask
+from agents.agent_factory import AgentFactory, normalize_interest
+from agents.gossip import run_gossip_round, share_knowledge, interaction_query
 from utils.logger import setup_logger
-from models import AgentCreate, AgentUpdate, AgentResponse, Query, QueryResponse, AgentList
-from services.task_queue import task_queue
+from models import (AgentCreate, AgentUpdate, AgentResponse, Query, QueryResponse, AgentList, MemoryResponse, BatchQuery, GossipRound,
+                    KnowledgeExchange)
+from services.task_queue import task_queue, PRIORITY_USER, QueueFullError
+from config.config import (TASK_QUEUE_DRAIN_TIMEOUT, QUERY_SEARCH_TIMEOUT, BATCH_QUERY_CONCURRENCY, BATCH_QUERY_MAX_CONCURRENCY,
+                           OPENAI_API_KEY, WARM_UP_ON_START, GOSSIP_MAX_PAIRS, GOSSIP_CONCURRENCY, WORKER_COUNT,
+                           WORKER_ID)
+from agents.document_store import get_document_store, close_document_store
+from agents.evolution import evolution_engine
+from agents.learning_scheduler import learning_scheduler
+from services.async_web_search import async_web_client, async_search_web
+from services.html_extract import shutdown_extract_pool
+from services.sharding import ShardRouter, shard_client, owns, owner_of, is_sharded, is_forwarded, other_workers
+from agents.base_agent import run_stage, preload_dependencies
+from services.web_search import web_cache_stats
+from agents.response_cache import response_cache
+from services.llm_gateway import llm_gateway
+from utils.metrics import metrics
+from services.tokenizer import tokenizer_status
 import asyncio
-import nltk
-import ssl
+import json
+import time
 
 logger = setup_logger(__name__)
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    # Startup: create background tasks and initialize NLTK
-    task_queue_task = asyncio.create_task(task_queue.run())
-    
-    try:
-        _create_unverified_https_context = ssl._create_unverified_context
-    except AttributeError:
-        pass
-    else:
-        ssl._create_default_https_context = _create_unverified_https_context
+# Liveness only needs the process to answer; readiness also waits for warm-up
+readiness = {"started": False, "warmed_up": False, "warm_up_seconds": None}
 
+async def warm_up():
+    started = time.perf_counter()
     try:
-        nltk.download('punkt', quiet=True)
+        await asyncio.to_thread(preload_dependencies)
     except Exception as e:
-        logger.warning(f"Failed to download NLTK data: {str(e)}")
-        logger.warning("NLTK tokenization might not work properly.")
+        logger.error(f"Warm-up failed, dependencies will load on first use: {str(e)}")
+    readiness["warmed_up"] = True
+    readiness["warm_up_seconds"] = time.perf_counter() - started
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Startup: create background tasks. Nothing here touches the network or
+    # imports the LLM stack, that happens in the background warm-up.
+    task_queue_task = asyncio.create_task(task_queue.run())
+    evolution_task = asyncio.create_task(evolution_engine.run())
+    learning_scheduler.start(agent_factory)
+    learning_scheduler_task = asyncio.create_task(learning_scheduler.run())
+    warm_up_task = asyncio.create_task(warm_up()) if WARM_UP_ON_START else None
+    readiness["warmed_up"] = not WARM_UP_ON_START
+    readiness["started"] = True
     
     yield
     
-    # Shutdown: cancel background tasks
+    # Shutdown: stop scheduling, drain queued tasks, then stop background tasks
+    readiness["started"] = False
+    if warm_up_task:
+        # The import thread can't be interrupted; don't leave the task dangling
+        await asyncio.gather(warm_up_task, return_exceptions=True)
+    learning_scheduler_task.cancel()
+    try:
+        await learning_scheduler_task
+    except asyncio.CancelledError:
+        pass
+    await task_queue.shutdown(TASK_QUEUE_DRAIN_TIMEOUT)
     task_queue_task.cancel()
     try:
         await task_queue_task
     except asyncio.CancelledError:
-        logger.info("Task queue has been shut down")
+        pass
+    logger.info("Task queue has been shut down")
+
+    evolution_task.cancel()
+    try:
+        await evolution_task
+    except asyncio.CancelledError:
+        pass
+    await evolution_engine.flush()
+    agent_factory.close()
+    close_document_store()
+    await async_web_client.close()
+    await shard_client.close()
+    shutdown_extract_pool()
 
 app = FastAPI(lifespan=lifespan)
+# Sends each single-agent request to the worker owning that agent's shard
+app.add_middleware(ShardRouter)
 agent_factory = AgentFactory()
 
+def cache_stat(field):
+    return lambda: {(("cache", stats["name"]),): stats[field] for stats in web_cache_stats() + [response_cache.stats()]}
+
+# Counters that the caches, gateway and queue already keep, read at scrape time
+metrics.counter_callback("cache_hits_total", "Cache hits", cache_stat("hits"))
+metrics.counter_callback("cache_misses_total", "Cache misses", cache_stat("misses"))
+metrics.gauge_callback("cache_entries", "Entries held in each cache", cache_stat("entries"))
+metrics.counter_callback("llm_calls_total", "LLM calls, including retries", lambda: llm_gateway.stats()["calls"])
+metrics.counter_callback("llm_retries_total", "LLM calls retried after a transient error", lambda: llm_gateway.stats()["retries"])
+metrics.counter_callback("llm_errors_total", "LLM calls that failed", lambda: llm_gateway.stats()["errors"])
+metrics.gauge_callback("llm_waiting", "LLM calls waiting for admission", lambda: llm_gateway.stats()["waiting"])
+metrics.gauge_callback("task_queue_depth", "Tasks waiting in the task queue", lambda: task_queue.stats()["queue_depth"])
+metrics.counter_callback("task_queue_tasks_total", "Tasks by outcome", lambda: {
+    (("outcome", outcome),): task_queue.stats()[outcome] for outcome in ("completed", "failed", "rejected", "deduplicated", "promoted")
+})
+metrics.counter_callback("evolutions_total", "Batched personality and interest evolutions", lambda: evolution_engine.stats()["evolutions"])
+metrics.counter_callback("kb_documents_total", "Learned articles by whether they had to be embedded", lambda: {
+    (("outcome", "embedded"),): get_document_store().embedded_documents, (("outcome", "reused"),): get_document_store().reused_documents
+})
+metrics.gauge_callback("kb_chunks", "Chunks in the shared knowledge base", lambda: get_document_store().stats()["chunks"])
+metrics.gauge_callback("cached_agents", "Agents loaded in memory", lambda: len(agent_factory.agents))
+
 @app.post("/agents", response_model=AgentResponse)
 async def create_agent(agent_create: AgentCreate):
-    agent = agent_factory.create_agent(agent_create)
+    # IDs come from the shared store, whichever worker took the request
+    agent_id = agent_factory.store.allocate_id()
+    if not owns(agent_id):
+        response = await shard_client.request(owner_of(agent_id), "POST", f"/internal/agents/{agent_id}", agent_create.dict())
+        return JSONResponse(status_code=response.status_code, content=response.json())
+    agent = agent_factory.create_agent(agent_create, agent_id)
+    return agent.to_response()
+
+# Only reachable from other workers: creates an agent for this worker's shard
+@app.post("/internal/agents/{agent_id}", response_model=AgentResponse, include_in_schema=False)
+async def create_shard_agent(agent_id: int, agent_create: AgentCreate, request: Request):
+    if not is_forwarded(request.scope):
+        raise HTTPException(status_code=404, detail="Not Found")
+    agent = agent_factory.create_agent(agent_create, agent_id)
     return agent.to_response()
 
+@app.post("/internal/agents/{agent_id}/learn", include_in_schema=False)
+async def learn_from_exchange(agent_id: int, exchange: KnowledgeExchange, request: Request):
+    if not is_forwarded(request.scope):
+        raise HTTPException(status_code=404, detail="Not Found")
+    agent = agent_factory.get_agent(agent_id)
+    if not agent:
+        raise HTTPException(status_code=404, detail="Agent not found")
+    await agent.learn_from_interaction(exchange.query, exchange.response)
+    return {"message": f"Agent {agent_id} learned from the exchange"}
+
 @app.get("/agents/{agent_id}", response_model=AgentResponse)
 async def get_agent(agent_id: int):
     agent = agent_factory.get_agent(agent_id)
@@ -65,6 +160,87 @@ async def delete_agent(agent_id: int):
     agent_factory.delete_agent(agent_id)
     return {"message": "Agent deleted successfully"}
 
+# Declared before /query/{agent_id} so "batch" is not taken for an agent ID
+@app.post("/query/batch")
+async def batch_query_agents(batch: BatchQuery, request: Request):
+    if batch.agent_ids is None and batch.interest is None:
+        raise HTTPException(status_code=400, detail="Provide agent_ids or an interest")
+    agent_ids = batch.agent_ids if batch.agent_ids is not None else agent_factory.find_agent_ids_by_interest(batch.interest)
+    # Each worker answers for its own shard; the one taking the request fans out
+    remote_batches = {}
+    if is_sharded():
+        if batch.agent_ids is not None:
+            agent_ids = [agent_id for agent_id in agent_ids if owns(agent_id)]
+        if not is_forwarded(request.scope):
+            for worker in other_workers():
+                body = batch.dict()
+                if batch.agent_ids is not None:
+                    body["agent_ids"] = [agent_id for agent_id in batch.agent_ids if owner_of(agent_id) == worker]
+                    if not body["agent_ids"]:
+                        continue
+                remote_batches[worker] = body
+    concurrency = min(max(1, batch.concurrency or BATCH_QUERY_CONCURRENCY), BATCH_QUERY_MAX_CONCURRENCY)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def answer(agent_id, search_results):
+        async with semaphore:
+            agent = agent_factory.get_agent(agent_id)
+            if not agent:
+                return {"agent_id": agent_id, "error": "Agent not found"}
+            try:
+                response = await agent.query(batch.query, search_results=search_results)
+            except Exception as e:
+                logger.error(f"Batch query to agent {agent_id} failed: {str(e)}")
+                return {"agent_id": agent_id, "error": "Query failed"}
+            return QueryResponse(
+                agent_id=agent_id,
+                personality_type=agent.personality_type,
+                interests=agent.interests,
+                query=batch.query,
+                response=response
+            ).dict()
+
+    async def remote_answers(worker, body, lines):
+        try:
+            async for line in shard_client.stream_lines(worker, "POST", "/query/batch", body):
+                await lines.put(line)
+        except Exception as e:
+            logger.error(f"Batch query forwarded to worker {worker} failed: {str(e)}")
+            for agent_id in body.get("agent_ids") or []:
+                await lines.put(json.dumps({"agent_id": agent_id, "error": "Query failed"}))
+
+    async def results():
+        # One web search per worker for everybody, then stream answers as they finish
+        search_results = []
+        if agent_ids:
+            search_results = await run_stage("search", async_search_web(batch.query), QUERY_SEARCH_TIMEOUT, [])
+        lines = asyncio.Queue()
+
+        async def produce(coroutine):
+            try:
+                await coroutine
+            finally:
+                await lines.put(None)
+
+        async def local_answer(agent_id):
+            await lines.put(json.dumps(await answer(agent_id, search_results)))
+
+        tasks = [asyncio.create_task(produce(local_answer(agent_id))) for agent_id in dict.fromkeys(agent_ids)]
+        tasks += [asyncio.create_task(produce(remote_answers(worker, body, lines))) for worker, body in remote_batches.items()]
+        try:
+            remaining = len(tasks)
+            while remaining:
+                line = await lines.get()
+                if line is None:
+                    remaining -= 1
+                else:
+                    yield line + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
 @app.post("/query/{agent_id}", response_model=QueryResponse)
 async def query_agent(agent_id: int, query: Query):
     agent = agent_factory.get_agent(agent_id)
@@ -79,35 +255,140 @@ async def query_agent(agent_id: int, query: Query):
         response=response
     )
 
+def format_sse(data: dict, event: str = None) -> str:
+    message = f"event: {event}\n" if event else ""
+    return message + f"data: {json.dumps(data)}\n\n"
+
+@app.post("/query/{agent_id}/stream")
+async def stream_query_agent(agent_id: int, query: Query):
+    agent = agent_factory.get_agent(agent_id)
+    if not agent:
+        raise HTTPException(status_code=404, detail="Agent not found")
+    # Pinned from here, so the agent is not evicted before the body starts
+    # streaming. Released when the stream ends, or by the background task if
+    # it never started; closing the stack twice is a no-op.
+    pinned = ExitStack()
+    pinned.enter_context(agent.busy())
+
+    async def events():
+        chunks = []
+        try:
+            async for delta in agent.stream_query(query.query):
+                chunks.append(delta)
+                yield format_sse({"delta": delta})
+        except Exception as e:
+            logger.error(f"Streaming query to agent {agent_id} failed: {str(e)}")
+            yield format_sse({"detail": "Query failed"}, event="error")
+            return
+        finally:
+            pinned.close()
+        yield format_sse(QueryResponse(
+            agent_id=agent_id,
+            personality_type=agent.personality_type,
+            interests=agent.interests,
+            query=query.query,
+            response="".join(chunks)
+        ).dict(), event="done")
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"},
+                             background=BackgroundTask(pinned.close))
+
 @app.get("/agents", response_model=AgentList)
 async def list_agents():
     return agent_factory.list_agents()
 
+@app.get("/agents/{agent_id}/memory", response_model=MemoryResponse)
+async def get_agent_memory(agent_id: int, limit: int = 10):
+    agent = agent_factory.get_agent(agent_id)
+    if not agent:
+        raise HTTPException(status_code=404, detail="Agent not found")
+    return MemoryResponse(agent_id=agent_id, interactions=await agent.get_recent_interactions(limit))
+
 @app.post("/agents/{agent_id}/learn")
 async def trigger_agent_learning(agent_id: int):
     agent = agent_factory.get_agent(agent_id)
     if not agent:
         raise HTTPException(status_code=404, detail="Agent not found")
-    await task_queue.add_task(agent.async_learn())
+    try:
+        queued = await task_queue.add_task(agent_factory.learn(agent_id), priority=PRIORITY_USER, key=agent_id)
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    if not queued:
+        return {"message": f"Agent {agent_id} already has a learning task queued"}
     return {"message": f"Learning task for agent {agent_id} has been queued"}
 
+@app.get("/cache/stats")
+async def cache_stats():
+    return {"caches": web_cache_stats() + [response_cache.stats()]}
+
+@app.get("/kb/stats")
+async def knowledge_base_stats():
+    return get_document_store().stats()
+
+@app.get("/llm/stats")
+async def llm_stats():
+    return llm_gateway.stats()
+
+@app.get("/evolution/stats")
+async def evolution_stats():
+    return evolution_engine.stats()
+
+@app.get("/learning/stats")
+async def learning_stats():
+    return learning_scheduler.stats()
+
+@app.get("/tasks/stats")
+async def task_queue_stats():
+    return task_queue.stats()
+
+@app.get("/healthz")
+async def liveness():
+    return {"status": "ok", "worker": WORKER_ID, "workers": WORKER_COUNT}
+
+@app.get("/readyz")
+async def readiness_check():
+    ready = readiness["started"] and readiness["warmed_up"]
+    return JSONResponse(status_code=200 if ready else 503, content={
+        "status": "ready" if ready else "starting",
+        **readiness,
+        "tokenizer": tokenizer_status(),
+        # Informational: agents can be managed without it, queries can't be answered
+        "llm_configured": bool(OPENAI_API_KEY)
+    })
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.post("/agents/{agent_id}/interact/{target_agent_id}")
 async def agent_interaction(agent_id: int, target_agent_id: int):
+    # The request is routed to agent_id's worker; the target may live on another
     agent = agent_factory.get_agent(agent_id)
-    target_agent = agent_factory.get_agent(target_agent_id)
+    target_agent = agent_factory.get_agent_record(target_agent_id)
     if not agent or not target_agent:
         raise HTTPException(status_code=404, detail="One or both agents not found")
     
     shared_interests = set(agent.interests) & set(target_agent.interests)
     if shared_interests:
         interest = list(shared_interests)[0]
-        query = f"What's the latest development in {interest}?"
+        query = interaction_query(interest)
         response = await agent.query(query)
-        await target_agent.learn_from_interaction(query, response)
+        await share_knowledge(agent_factory, target_agent_id, query, response)
         return {"message": f"Agents {agent_id} and {target_agent_id} exchanged knowledge about {interest}"}
     else:
         return {"message": "No shared interests found for knowledge exchange"}
 
+@app.post("/gossip/round")
+async def gossip_round(gossip: GossipRound = None):
+    # Village-wide knowledge exchange: partners come from the interest index
+    # and each interest is queried once for all of its learners. With several
+    # workers the round is planned here and each step runs on its agent's owner.
+    gossip = gossip or GossipRound()
+    interests = [normalize_interest(interest) for interest in gossip.interests] if gossip.interests else None
+    max_pairs = max(0, gossip.max_pairs if gossip.max_pairs is not None else GOSSIP_MAX_PAIRS)
+    concurrency = min(max(1, gossip.concurrency or GOSSIP_CONCURRENCY), BATCH_QUERY_MAX_CONCURRENCY)
+    return await run_gossip_round(agent_factory, max_pairs, concurrency, interests)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -21,6 +21,21 @@ class AgentResponse(BaseModel):
 class Query(BaseModel):
     query: str
 
+class BatchQuery(BaseModel):
+    query: str
+    agent_ids: Optional[List[int]] = None
+    interest: Optional[str] = None
+    concurrency: Optional[int] = None
+
+class KnowledgeExchange(BaseModel):
+    query: str
+    response: str
+
+class GossipRound(BaseModel):
+    interests: Optional[List[str]] = None
+    max_pairs: Optional[int] = None
+    concurrency: Optional[int] = None
+
 class QueryResponse(BaseModel):
     agent_id: int
     personality_type: str
@@ -29,4 +44,13 @@ class QueryResponse(BaseModel):
     response: str
 
 class AgentList(BaseModel):
-    agents: List[AgentResponse]
\ No newline at end of file
+    agents: List[AgentResponse]
+
+class Interaction(BaseModel):
+    query: str
+    response: str
+    timestamp: datetime
+
+class MemoryResponse(BaseModel):
+    agent_id: int
+    interactions: List[Interaction]
@@ -0,0 +1,163 @@
+import asyncio
+import random
+import aiohttp
+from utils.logger import setup_logger
+from utils.metrics import HTTP_RETRIES, HTTP_ERRORS
+from services.cache import normalize_url
+from services.web_search import (USER_AGENT, FETCH_FAILED_MESSAGE, search_cache, page_cache, search_cache_key,
+                                 parse_search_results)
+from services.html_extract import (TextExtractor, incremental_decoder, extract_text_from_bytes, get_extract_pool,
+                                   FEED_CHUNK_BYTES)
+from config.config import (SEARCH_URL, HTTP_TIMEOUT, HTTP_MAX_CONNECTIONS, HTTP_MAX_CONNECTIONS_PER_HOST,
+                           HTTP_MAX_RETRIES, HTTP_BACKOFF_BASE, PAGE_MAX_BYTES)
+
+logger = setup_logger(__name__)
+
+class RetryableStatus(Exception):
+    pass
+
+class AsyncWebClient:
+    # One pooled aiohttp session for all search and page traffic. Retries back
+    # off exponentially with full jitter and never block the event loop.
+    def __init__(self, search_url: str = SEARCH_URL, timeout: float = HTTP_TIMEOUT,
+                 max_connections: int = HTTP_MAX_CONNECTIONS, max_connections_per_host: int = HTTP_MAX_CONNECTIONS_PER_HOST,
+                 max_retries: int = HTTP_MAX_RETRIES, backoff_base: float = HTTP_BACKOFF_BASE):
+        self.search_url = search_url
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.max_connections_per_host = max_connections_per_host
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.session = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections,
+                limit_per_host=self.max_connections_per_host,
+                ttl_dns_cache=300
+            )
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={"User-Agent": USER_AGENT}
+            )
+        return self.session
+
+    def backoff_delay(self, attempt: int) -> float:
+        return random.uniform(0, self.backoff_base * (2 ** attempt))
+
+    async def _request(self, url: str, read, params: dict = None):
+        # read(response) consumes the body; it is retried along with the request
+        for attempt in range(self.max_retries):
+            try:
+                async with self._get_session().get(url, params=params) as response:
+                    if response.status == 429 or response.status >= 500:
+                        raise RetryableStatus(f"HTTP {response.status} from {url}")
+                    response.raise_for_status()
+                    return await read(response)
+            except aiohttp.ClientResponseError:
+                # Other 4xx responses will not get better by retrying
+                raise
+            except (aiohttp.ClientError, asyncio.TimeoutError, RetryableStatus) as e:
+                logger.error(f"Error requesting {url} (attempt {attempt + 1}): {str(e)}")
+                if attempt == self.max_retries - 1:
+                    HTTP_ERRORS.inc()
+                    raise
+                HTTP_RETRIES.inc()
+                await asyncio.sleep(self.backoff_delay(attempt))
+
+    async def get_text(self, url: str, params: dict = None) -> str:
+        return await self._request(url, lambda response: response.text(errors="replace"), params)
+
+    async def search(self, query: str, num_results: int = 5) -> list:
+        html = await self.get_text(self.search_url, params={"q": query})
+        return parse_search_results(html, num_results)
+
+    async def fetch(self, url: str) -> str:
+        pool = get_extract_pool()
+        if pool is None:
+            return await self._request(url, read_page_text)
+        data, charset = await self._request(url, read_page_bytes)
+        return await asyncio.get_running_loop().run_in_executor(pool, extract_text_from_bytes, data, charset)
+
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
+
+async def read_page_bytes(response) -> tuple:
+    # Body capped at PAGE_MAX_BYTES, for parsing in the extraction process pool
+    data = bytearray()
+    async for chunk in response.content.iter_chunked(FEED_CHUNK_BYTES):
+        data += chunk[:PAGE_MAX_BYTES - len(data)]
+        if len(data) >= PAGE_MAX_BYTES:
+            break
+    return bytes(data), response.charset
+
+async def read_page_text(response) -> str:
+    # Each chunk is parsed in a worker thread as it arrives, so the event loop
+    # never holds a whole page; reading stops at PAGE_MAX_BYTES or as soon as
+    # enough sentences have been extracted
+    decoder = incremental_decoder(response.charset)
+    extractor = TextExtractor()
+    received = 0
+    async for chunk in response.content.iter_chunked(FEED_CHUNK_BYTES):
+        chunk = chunk[:PAGE_MAX_BYTES - received]
+        received += len(chunk)
+        await asyncio.to_thread(extractor.feed, decoder.decode(chunk))
+        if extractor.done or received >= PAGE_MAX_BYTES:
+            break
+    return await asyncio.to_thread(extractor.result)
+
+async_web_client = AsyncWebClient()
+
+async def async_search_web(query, num_results=5, client: AsyncWebClient = None):
+    client = client or async_web_client
+
+    async def load():
+        try:
+            return await client.search(query, num_results)
+        except Exception as e:
+            logger.error(f"Error during web search: {str(e)}")
+            return []
+
+    return await search_cache.aget_or_load(search_cache_key(query, num_results), load, should_cache=bool)
+
+async def async_fetch_webpage_content(url, client: AsyncWebClient = None):
+    client = client or async_web_client
+
+    async def load():
+        try:
+            return await client.fetch(url)
+        except Exception as e:
+            logger.error(f"Error fetching webpage content: {str(e)}")
+            return FETCH_FAILED_MESSAGE
+
+    return await page_cache.aget_or_load(
+        normalize_url(url), load, should_cache=lambda content: content != FETCH_FAILED_MESSAGE
+    )
+
+async def async_fetch_top_pages(query, k=3, client: AsyncWebClient = None):
+    # Fetch the top-k result pages concurrently, bounded by the connector limits
+    search_results = await async_search_web(query, client=client)
+    top_results = search_results[:k]
+    contents = await asyncio.gather(*(async_fetch_webpage_content(result['link'], client) for result in top_results))
+    return [
+        {"title": result['title'], "content": content, "url": result['link']}
+        for result, content in zip(top_results, contents)
+        if content != FETCH_FAILED_MESSAGE
+    ]
+
+async def async_get_random_article(interests, client: AsyncWebClient = None):
+    query = random.choice(interests)
+    search_results = await async_search_web(query, client=client)
+    if search_results:
+        article = random.choice(search_results)
+        content = await async_fetch_webpage_content(article['link'], client)
+        return {
+            "title": article['title'],
+            "content": content,
+            "url": article['link']
+        }
+    return None
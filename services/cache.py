@@ -0,0 +1,210 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from urllib.parse import urlsplit, urlunsplit
+from utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+def normalize_url(url: str) -> str:
+    parts = urlsplit(url.strip())
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or "/", parts.query, ""))
+
+def _always(value):
+    return True
+
+class LoadCancelledError(Exception):
+    # Raised to callers waiting on a shared load that was cancelled
+    pass
+
+class TTLCache:
+    # Process-wide, size-bounded LRU with per-entry expiry and an optional
+    # on-disk tier. Concurrent misses for the same key share one load, both
+    # for threads (get_or_load) and for coroutines (aget_or_load).
+    def __init__(self, name: str, ttl: float, max_entries: int, disk_dir: str = None):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.in_flight = {}
+        self.async_in_flight = {}
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.coalesced = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, hashlib.sha1(key.encode()).hexdigest() + ".json")
+
+    def _read_disk(self, key: str):
+        try:
+            with open(self._disk_path(key), 'r') as f:
+                entry = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        if entry.get("key") != key or entry["expires_at"] < time.time():
+            return None
+        return entry
+
+    def _write_disk(self, key: str, value, expires_at: float):
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump({"key": key, "expires_at": expires_at, "value": value}, f)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError) as e:
+            logger.warning(f"Could not write {self.name} cache entry to disk: {str(e)}")
+
+    def _lookup(self, key: str):
+        # Caller holds self.lock; memory only, the disk tier is read by _load_disk
+        entry = self.entries.get(key)
+        if entry is not None:
+            if entry[0] >= time.time():
+                self.entries.move_to_end(key)
+                return True, entry[1]
+            del self.entries[key]
+        return False, None
+
+    def _load_disk(self, key: str):
+        # Reads the disk tier without holding the lock; a hit is kept in memory
+        if not self.disk_dir:
+            return False, None
+        disk_entry = self._read_disk(key)
+        if disk_entry is None:
+            return False, None
+        with self.lock:
+            self.disk_hits += 1
+            self._store(key, disk_entry["value"], disk_entry["expires_at"])
+        return True, disk_entry["value"]
+
+    def _store(self, key: str, value, expires_at: float):
+        # Caller holds self.lock
+        self.entries[key] = (expires_at, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def _count(self, found: bool):
+        with self.lock:
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key: str, default=None):
+        with self.lock:
+            found, value = self._lookup(key)
+        if not found:
+            found, value = self._load_disk(key)
+        self._count(found)
+        return value if found else default
+
+    def set(self, key: str, value, ttl: float = None):
+        expires_at = time.time() + (ttl or self.ttl)
+        with self.lock:
+            self._store(key, value, expires_at)
+        if self.disk_dir:
+            self._write_disk(key, value, expires_at)
+
+    async def aset(self, key: str, value, ttl: float = None):
+        expires_at = time.time() + (ttl or self.ttl)
+        with self.lock:
+            self._store(key, value, expires_at)
+        if self.disk_dir:
+            await asyncio.to_thread(self._write_disk, key, value, expires_at)
+
+    def get_or_load(self, key: str, loader, should_cache=_always):
+        with self.lock:
+            found, value = self._lookup(key)
+            if found:
+                self.hits += 1
+                return value
+            future = self.in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = self.in_flight[key] = Future()
+            else:
+                self.coalesced += 1
+        if not owner:
+            return future.result()
+        try:
+            found, value = self._load_disk(key)
+            self._count(found)
+            if not found:
+                value = loader()
+                if should_cache(value):
+                    self.set(key, value)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                self.in_flight.pop(key, None)
+
+    async def aget_or_load(self, key: str, loader, should_cache=_always):
+        # The load runs in its own task shared by every caller asking for the
+        # key, so a caller that is cancelled (say by a stage timeout) leaves it
+        # running for the others
+        with self.lock:
+            found, value = self._lookup(key)
+            if found:
+                self.hits += 1
+                return value
+        task = self.async_in_flight.get(key)
+        if task is None:
+            task = self.async_in_flight[key] = asyncio.create_task(self._aload(key, loader, should_cache))
+            # Nobody may be left waiting; don't warn about an unretrieved exception
+            task.add_done_callback(lambda done: done.cancelled() or done.exception())
+        else:
+            self.coalesced += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if task.cancelled() and not asyncio.current_task().cancelling():
+                # The load itself was stopped, not this caller
+                raise LoadCancelledError(f"Loading {self.name} cache entry was cancelled")
+            raise
+
+    async def _aload(self, key: str, loader, should_cache):
+        try:
+            found, value = await asyncio.to_thread(self._load_disk, key) if self.disk_dir else (False, None)
+            self._count(found)
+            if not found:
+                value = await loader()
+                if should_cache(value):
+                    await self.aset(key, value)
+            return value
+        finally:
+            self.async_in_flight.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "name": self.name,
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "coalesced": self.coalesced,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
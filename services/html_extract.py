@@ -0,0 +1,115 @@
+import codecs
+import multiprocessing
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from html.parser import HTMLParser
+from config.config import PAGE_MAX_SENTENCES, HTML_EXTRACT_PROCESSES
+from services.tokenizer import sent_tokenize
+
+# Size of the pieces a body is read and parsed in
+FEED_CHUNK_BYTES = 64 * 1024
+
+# Text inside these elements is never page content
+SKIPPED_TAGS = {"script", "style"}
+
+# Cheap upper bound on sentence ends, used to decide when a real check is worthwhile
+SENTENCE_END = re.compile(r"[.!?][\"')\]]*\s")
+
+def normalize_text(text):
+    lines = (line.strip() for line in text.splitlines())
+    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+    return '\n'.join(chunk for chunk in chunks if chunk)
+
+class TextExtractor(HTMLParser):
+    # Incremental equivalent of BeautifulSoup(html).get_text() followed by
+    # keeping the first max_sentences sentences. Feed it the page piece by
+    # piece; `done` turns true once more than max_sentences sentences have
+    # been seen, and the rest of the page need not be read or parsed.
+    def __init__(self, max_sentences: int = PAGE_MAX_SENTENCES):
+        super().__init__(convert_charrefs=True)
+        self.max_sentences = max_sentences
+        self.parts = []
+        self.length = 0
+        self.skip_depth = 0
+        self.sentence_ends = 0
+        self.checked_length = 0
+        self.done = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIPPED_TAGS:
+            self.skip_depth += 1
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_TAGS and self.skip_depth:
+            self.skip_depth -= 1
+
+    def handle_data(self, data):
+        if self.skip_depth:
+            return
+        self.parts.append(data)
+        self.length += len(data)
+        self.sentence_ends += len(SENTENCE_END.findall(data))
+
+    def feed(self, data: str):
+        if self.done:
+            return
+        super().feed(data)
+        # Tokenize only once the text has doubled since the last check, so
+        # checking costs O(n) over the whole page
+        if self.sentence_ends > self.max_sentences and self.length >= 2 * self.checked_length:
+            self.checked_length = self.length
+            self.done = len(sent_tokenize(normalize_text("".join(self.parts)))) > self.max_sentences
+
+    def result(self) -> str:
+        if not self.done:
+            # Flush text held back while waiting for more input
+            self.close()
+        sentences = sent_tokenize(normalize_text("".join(self.parts)))
+        return ' '.join(sentences[:self.max_sentences])
+
+def incremental_decoder(charset: str = None):
+    try:
+        return codecs.getincrementaldecoder(charset or "utf-8")(errors="replace")
+    except LookupError:
+        return codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+def extract_text(html: str, max_sentences: int = PAGE_MAX_SENTENCES) -> str:
+    extractor = TextExtractor(max_sentences)
+    for start in range(0, len(html), FEED_CHUNK_BYTES):
+        extractor.feed(html[start:start + FEED_CHUNK_BYTES])
+        if extractor.done:
+            break
+    return extractor.result()
+
+def extract_text_from_bytes(data: bytes, charset: str = None, max_sentences: int = PAGE_MAX_SENTENCES) -> str:
+    # Entry point for the process pool: bytes in, text out
+    decoder = incremental_decoder(charset)
+    extractor = TextExtractor(max_sentences)
+    for start in range(0, len(data), FEED_CHUNK_BYTES):
+        extractor.feed(decoder.decode(data[start:start + FEED_CHUNK_BYTES]))
+        if extractor.done:
+            break
+    return extractor.result()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_extract_pool():
+    # None unless HTML_EXTRACT_PROCESSES is set; extraction then runs in
+    # threads, which share the GIL with request handling
+    global _pool
+    if HTML_EXTRACT_PROCESSES <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: the server process has threads running
+            _pool = ProcessPoolExecutor(HTML_EXTRACT_PROCESSES, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+def shutdown_extract_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
@@ -0,0 +1,217 @@
+import asyncio
+import heapq
+import itertools
+import random
+import time
+from config.config import (OPENAI_API_KEY, DEFAULT_MODEL_NAME, LLM_REQUESTS_PER_MINUTE, LLM_TOKENS_PER_MINUTE,
+                           LLM_MAX_CONCURRENCY, LLM_MAX_RETRIES, LLM_BACKOFF_BASE, LLM_EXPECTED_COMPLETION_TOKENS)
+from utils.logger import setup_logger
+from utils.metrics import LLM_REQUEST_SECONDS
+
+logger = setup_logger(__name__)
+
+# Lower values are admitted first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+
+# Model label on LLM_REQUEST_SECONDS for embedding calls
+EMBEDDING_METRIC_MODEL = "embedding"
+
+def retryable_errors():
+    # The OpenAI SDK is slow to import, so it is only loaded once a call is made
+    import openai
+    return (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError, openai.InternalServerError)
+
+def estimate_tokens(text: str) -> int:
+    # Roughly four characters per token for English text
+    return len(text) // 4 + 1
+
+class TokenBucket:
+    def __init__(self, rate_per_minute: float):
+        self.capacity = rate_per_minute
+        self.rate = rate_per_minute / 60.0
+        self.tokens = rate_per_minute
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def delay(self, amount: float) -> float:
+        # Seconds until `amount` tokens are available; 0 if they are now
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float):
+        self.tokens -= min(amount, self.capacity)
+
+class LLMGateway:
+    # Every LLM call in the process goes through here: one shared client (and
+    # HTTP connection pool) per model, a global concurrency cap, requests- and
+    # tokens-per-minute buckets, priority lanes and retries with backoff.
+    def __init__(self, requests_per_minute: float = LLM_REQUESTS_PER_MINUTE, tokens_per_minute: float = LLM_TOKENS_PER_MINUTE,
+                 max_concurrency: int = LLM_MAX_CONCURRENCY, max_retries: int = LLM_MAX_RETRIES,
+                 backoff_base: float = LLM_BACKOFF_BASE):
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.llms = {}
+        self.active = 0
+        self.waiters = []
+        self.sequence = itertools.count()
+        self.dispatch_timer = None
+        self.calls = 0
+        self.retries = 0
+        self.errors = 0
+
+    def get_llm(self, model_name: str = DEFAULT_MODEL_NAME):
+        if model_name not in self.llms:
+            if not OPENAI_API_KEY:
+                raise ValueError("Please set the OPENAI_API_KEY environment variable")
+            from llama_index.llms.openai import OpenAI
+            # Retries are handled here, not inside the client
+            self.llms[model_name] = OpenAI(model=model_name, api_key=OPENAI_API_KEY, max_retries=0)
+        return self.llms[model_name]
+
+    def set_llm(self, model_name: str, llm):
+        # Swap in another implementation, e.g. a local fake for tests and benchmarks
+        self.llms[model_name] = llm
+
+    def _dispatch(self):
+        self.dispatch_timer = None
+        while self.waiters and self.active < self.max_concurrency:
+            priority, _, tokens, future = self.waiters[0]
+            if future.done():
+                heapq.heappop(self.waiters)
+                continue
+            delay = max(self.request_bucket.delay(1), self.token_bucket.delay(tokens))
+            if delay > 0:
+                self.dispatch_timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+                return
+            heapq.heappop(self.waiters)
+            self.request_bucket.consume(1)
+            self.token_bucket.consume(tokens)
+            self.active += 1
+            future.set_result(None)
+
+    async def _acquire(self, priority: int, tokens: int):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(self.sequence), tokens, future))
+        if self.dispatch_timer is None:
+            self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Admitted just as we were cancelled: hand the slot back
+            if future.done() and not future.cancelled():
+                self._release()
+            raise
+
+    def _release(self):
+        self.active -= 1
+        if self.dispatch_timer is None:
+            self._dispatch()
+
+    def _backoff_delay(self, attempt: int) -> float:
+        return random.uniform(0, self.backoff_base * (2 ** attempt))
+
+    async def _call(self, call, tokens: int, priority: int, kind: str):
+        # Admission, retries and backoff around one awaitable-returning call
+        retryable = retryable_errors()
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(priority, tokens)
+            try:
+                self.calls += 1
+                return await call()
+            except retryable as e:
+                if attempt == self.max_retries:
+                    self.errors += 1
+                    raise
+                self.retries += 1
+                logger.warning(f"LLM {kind} call failed (attempt {attempt + 1}), retrying: {str(e)}")
+            except Exception:
+                self.errors += 1
+                raise
+            finally:
+                self._release()
+            await asyncio.sleep(self._backoff_delay(attempt))
+
+    async def complete(self, prompt: str, model_name: str = DEFAULT_MODEL_NAME, priority: int = PRIORITY_INTERACTIVE) -> str:
+        llm = self.get_llm(model_name)
+
+        async def call():
+            with LLM_REQUEST_SECONDS.time(model=model_name, kind="complete"):
+                response = await llm.acomplete(prompt)
+            return response.text
+
+        return await self._call(call, estimate_tokens(prompt) + LLM_EXPECTED_COMPLETION_TOKENS, priority, "complete")
+
+    async def embed_query(self, text: str, priority: int = PRIORITY_INTERACTIVE):
+        # Embeddings share the admission, rate limits and retries of completions
+        from llama_index.core import Settings
+        embed_model = Settings.embed_model
+
+        async def call():
+            with LLM_REQUEST_SECONDS.time(model=EMBEDDING_METRIC_MODEL, kind="embed"):
+                return await embed_model.aget_query_embedding(text)
+
+        return await self._call(call, estimate_tokens(text), priority, "embed")
+
+    async def embed_texts(self, texts, priority: int = PRIORITY_BACKGROUND):
+        from llama_index.core import Settings
+        embed_model = Settings.embed_model
+
+        async def call():
+            with LLM_REQUEST_SECONDS.time(model=EMBEDDING_METRIC_MODEL, kind="embed"):
+                return await embed_model.aget_text_embedding_batch(texts)
+
+        return await self._call(call, sum(estimate_tokens(text) for text in texts), priority, "embed")
+
+    async def stream_complete(self, prompt: str, model_name: str = DEFAULT_MODEL_NAME, priority: int = PRIORITY_INTERACTIVE):
+        # Yields text deltas. Only failures before the first delta are retried.
+        llm = self.get_llm(model_name)
+        retryable = retryable_errors()
+        tokens = estimate_tokens(prompt) + LLM_EXPECTED_COMPLETION_TOKENS
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(priority, tokens)
+            started = False
+            try:
+                self.calls += 1
+                requested_at = time.perf_counter()
+                async for chunk in await llm.astream_complete(prompt):
+                    if chunk.delta:
+                        if not started:
+                            # Time to first delta; the rest is paced by the reader
+                            LLM_REQUEST_SECONDS.observe(time.perf_counter() - requested_at, model=model_name, kind="stream")
+                        started = True
+                        yield chunk.delta
+                return
+            except retryable as e:
+                if started or attempt == self.max_retries:
+                    self.errors += 1
+                    raise
+                self.retries += 1
+                logger.warning(f"LLM stream failed (attempt {attempt + 1}), retrying: {str(e)}")
+            except Exception:
+                self.errors += 1
+                raise
+            finally:
+                self._release()
+            await asyncio.sleep(self._backoff_delay(attempt))
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "waiting": sum(1 for *_, future in self.waiters if not future.done()),
+            "calls": self.calls,
+            "retries": self.retries,
+            "errors": self.errors
+        }
+
+llm_gateway = LLMGateway()
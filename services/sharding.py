@@ -0,0 +1,128 @@
+import json
+import os
+import re
+import zlib
+import httpx
+from config.config import (WORKER_COUNT, WORKER_ID, WORKER_SOCKET_DIR, SHARD_CONNECT_TIMEOUT, SHARD_READ_TIMEOUT,
+                           SHARD_STREAM_READ_TIMEOUT)
+from utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Set on requests one worker passes to another; they are always handled locally
+FORWARDED_HEADER = "x-agent-village-forwarded"
+
+# Paths that act on a single agent, routed to the worker that owns it
+AGENT_PATH = re.compile(r"^/(?:agents|query)/(\d+)(?:/|$)")
+
+# Not passed through when proxying a response
+HOP_BY_HOP_HEADERS = {b"connection", b"keep-alive", b"transfer-encoding", b"content-length"}
+
+def owner_of(agent_id: int, worker_count: int = WORKER_COUNT) -> int:
+    # Stable across processes and restarts, unlike hash()
+    return zlib.crc32(str(agent_id).encode()) % worker_count
+
+def owns(agent_id: int) -> bool:
+    return WORKER_COUNT <= 1 or owner_of(agent_id) == WORKER_ID
+
+def is_sharded() -> bool:
+    return WORKER_COUNT > 1
+
+def other_workers():
+    return [worker for worker in range(WORKER_COUNT) if worker != WORKER_ID]
+
+def worker_socket(worker: int) -> str:
+    return os.path.join(WORKER_SOCKET_DIR, f"worker_{worker}.sock")
+
+def is_forwarded(scope) -> bool:
+    # Only trusted on the private Unix socket, where the server address has no port
+    server = scope.get("server")
+    return (is_sharded() and server is not None and server[1] is None
+            and dict(scope["headers"]).get(FORWARDED_HEADER.encode()) == b"1")
+
+class ShardClient:
+    # One keep-alive HTTP client per peer worker, over its Unix socket
+    def __init__(self, connect_timeout: float = SHARD_CONNECT_TIMEOUT, read_timeout: float = SHARD_READ_TIMEOUT,
+                 stream_read_timeout: float = SHARD_STREAM_READ_TIMEOUT):
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout, pool=connect_timeout)
+        self.stream_timeout = httpx.Timeout(stream_read_timeout, connect=connect_timeout, pool=connect_timeout)
+        self.clients = {}
+
+    def client(self, worker: int) -> httpx.AsyncClient:
+        client = self.clients.get(worker)
+        if client is None:
+            client = httpx.AsyncClient(
+                transport=httpx.AsyncHTTPTransport(uds=worker_socket(worker)),
+                base_url=f"http://worker-{worker}",
+                headers={FORWARDED_HEADER: "1"},
+                timeout=self.timeout
+            )
+            self.clients[worker] = client
+        return client
+
+    async def request(self, worker: int, method: str, path: str, body=None) -> httpx.Response:
+        return await self.client(worker).request(method, path, json=body)
+
+    async def stream_lines(self, worker: int, method: str, path: str, body=None):
+        async with self.client(worker).stream(method, path, json=body, timeout=self.stream_timeout) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if line:
+                    yield line
+
+    async def close(self):
+        for client in self.clients.values():
+            await client.aclose()
+        self.clients = {}
+
+shard_client = ShardClient()
+
+async def send_error(send, status: int, detail: str):
+    await send({"type": "http.response.start", "status": status, "headers": [(b"content-type", b"application/json")]})
+    await send({"type": "http.response.body", "body": json.dumps({"detail": detail}).encode()})
+
+class ShardRouter:
+    # ASGI middleware: requests for an agent owned by another worker are
+    # proxied to it unchanged, streaming responses included, so only the
+    # owner ever loads the agent, its memory file and its schedule
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not is_sharded():
+            return await self.app(scope, receive, send)
+        match = AGENT_PATH.match(scope["path"])
+        if match is None or is_forwarded(scope) or owns(int(match.group(1))):
+            return await self.app(scope, receive, send)
+        await self.forward(owner_of(int(match.group(1))), scope, receive, send)
+
+    async def forward(self, worker, scope, receive, send):
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        path = scope["path"] + (f"?{scope['query_string'].decode('latin-1')}" if scope["query_string"] else "")
+        headers = [(key, value) for key, value in scope["headers"] if key not in (b"host", b"content-length")]
+        client = shard_client.client(worker)
+        request = client.build_request(scope["method"], path, headers=headers, content=body, timeout=shard_client.stream_timeout)
+        try:
+            response = await client.send(request, stream=True)
+        except httpx.ReadTimeout as e:
+            logger.error(f"Worker {worker} timed out: {str(e)}")
+            return await send_error(send, 504, f"Worker {worker} timed out")
+        except httpx.TransportError as e:
+            logger.error(f"Worker {worker} is unreachable: {str(e)}")
+            return await send_error(send, 503, f"Worker {worker} is unavailable")
+        try:
+            await send({
+                "type": "http.response.start",
+                "status": response.status_code,
+                "headers": [(key, value) for key, value in response.headers.raw if key.lower() not in HOP_BY_HOP_HEADERS]
+            })
+            async for chunk in response.aiter_raw():
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            await response.aclose()
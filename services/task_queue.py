@@ -1,32 +1,177 @@
 import asyncio
+import itertools
+import time
+from collections import deque
+from config.config import TASK_QUEUE_WORKERS, TASK_QUEUE_MAX_SIZE
 from utils.logger import setup_logger
+from utils.metrics import TASK_QUEUE_WAIT_SECONDS, TASK_QUEUE_RUN_SECONDS
 
 logger = setup_logger(__name__)
 
+# Lower values run first
+PRIORITY_USER = 0
+PRIORITY_PERIODIC = 1
+
+class QueueFullError(Exception):
+    pass
+
+def percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
 class TaskQueue:
-    def __init__(self, max_concurrent_tasks=3):
-        self.queue = asyncio.Queue()
+    def __init__(self, max_concurrent_tasks=TASK_QUEUE_WORKERS, max_queue_size=TASK_QUEUE_MAX_SIZE):
+        self.queue = asyncio.PriorityQueue(maxsize=max_queue_size)
         self.max_concurrent_tasks = max_concurrent_tasks
-        self.running_tasks = set()
-
-    async def add_task(self, coro):
-        await self.queue.put(coro)
+        self.max_queue_size = max_queue_size
+        self.sequence = itertools.count()
+        # Dedupe keys of tasks that are queued or running
+        self.active_keys = set()
+        # Key -> its live queue entry; entries left behind by a priority bump are stale
+        self.queued = {}
+        self.stale = 0
+        self.workers = []
+        self.in_flight = 0
+        self.accepting = True
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.deduplicated = 0
+        self.promoted = 0
+        self.wait_times = deque(maxlen=1000)
+        self.run_times = deque(maxlen=1000)
 
-    async def run(self):
-        while True:
-            if len(self.running_tasks) < self.max_concurrent_tasks and not self.queue.empty():
-                coro = await self.queue.get()
-                task = asyncio.create_task(self._run_task(coro))
-                self.running_tasks.add(task)
+    async def add_task(self, coro, priority=PRIORITY_PERIODIC, key=None, block=False):
+        # Returns False if a task with the same key is already queued or running.
+        # A queued one is moved up to this priority if that is higher, and the
+        # call returns True. When the queue is full, waits for space if block is
+        # set, otherwise raises QueueFullError.
+        if not self.accepting:
+            coro.close()
+            raise QueueFullError("Task queue is shutting down")
+        if key is not None and key in self.active_keys:
+            coro.close()
+            if self._promote(key, priority):
+                return True
+            self.deduplicated += 1
+            return False
+        item = (priority, next(self.sequence), time.monotonic(), key, coro)
+        if key is not None:
+            self.active_keys.add(key)
+            self.queued[key] = item
+        try:
+            if block:
+                await self.queue.put(item)
             else:
-                await asyncio.sleep(1)  # Wait before checking again
+                self.queue.put_nowait(item)
+        except (asyncio.QueueFull, asyncio.CancelledError) as e:
+            self.active_keys.discard(key)
+            self.queued.pop(key, None)
+            coro.close()
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self.rejected += 1
+            raise QueueFullError(f"Task queue is full ({self.max_queue_size} tasks)")
+        return True
 
-    async def _run_task(self, coro):
+    def _promote(self, key, priority) -> bool:
+        # Re-push the queued task at the higher priority; the old entry is
+        # skipped when it comes up. The queued coroutine is kept, not the new
+        # one, since its owner may be waiting on it to run.
+        item = self.queued.get(key)
+        if item is None or priority >= item[0]:
+            return False
+        promoted = (priority, next(self.sequence), item[2], key, item[4])
         try:
-            await coro
-        except Exception as e:
-            logger.error(f"Task error: {str(e)}")
+            self.queue.put_nowait(promoted)
+        except asyncio.QueueFull:
+            return False
+        self.queued[key] = promoted
+        self.stale += 1
+        self.promoted += 1
+        return True
+
+    async def run(self):
+        self.accepting = True
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(self.max_concurrent_tasks)]
+        try:
+            await asyncio.gather(*self.workers)
         finally:
-            self.running_tasks.remove(asyncio.current_task())
+            for worker in self.workers:
+                worker.cancel()
+
+    async def _worker(self):
+        while True:
+            item = await self.queue.get()
+            priority, _, enqueued_at, key, coro = item
+            if key is not None:
+                if self.queued.get(key) is not item:
+                    # Superseded by a higher-priority entry for the same task
+                    self.stale -= 1
+                    self.queue.task_done()
+                    continue
+                del self.queued[key]
+            started_at = time.monotonic()
+            self.wait_times.append(started_at - enqueued_at)
+            TASK_QUEUE_WAIT_SECONDS.observe(started_at - enqueued_at, priority=priority)
+            self.in_flight += 1
+            try:
+                await coro
+                self.completed += 1
+            except asyncio.CancelledError:
+                if asyncio.current_task().cancelling():
+                    raise
+                # Cancelled inside the task, not this worker: keep serving the queue
+                self.failed += 1
+                logger.error("Task error: task was cancelled")
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Task error: {str(e)}")
+            finally:
+                self.in_flight -= 1
+                self.run_times.append(time.monotonic() - started_at)
+                TASK_QUEUE_RUN_SECONDS.observe(self.run_times[-1], priority=priority)
+                self.active_keys.discard(key)
+                self.queue.task_done()
+
+    async def shutdown(self, drain_timeout=None):
+        # Stop accepting work, let queued tasks finish for up to drain_timeout
+        # seconds, then cancel the workers and drop whatever is left
+        self.accepting = False
+        if self.workers:
+            try:
+                await asyncio.wait_for(self.queue.join(), timeout=drain_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Task queue did not drain in {drain_timeout}s, dropping {self.queue.qsize()} tasks")
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+        while not self.queue.empty():
+            *_, coro = self.queue.get_nowait()
+            coro.close()
+            self.queue.task_done()
+        self.active_keys.clear()
+        self.queued.clear()
+        self.stale = 0
+
+    def stats(self):
+        return {
+            "queue_depth": self.queue.qsize() - self.stale,
+            "max_queue_size": self.max_queue_size,
+            "in_flight": self.in_flight,
+            "workers": len(self.workers),
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "deduplicated": self.deduplicated,
+            "promoted": self.promoted,
+            "wait_seconds_p50": percentile(self.wait_times, 0.5),
+            "wait_seconds_p99": percentile(self.wait_times, 0.99),
+            "run_seconds_p50": percentile(self.run_times, 0.5),
+            "run_seconds_p99": percentile(self.run_times, 0.99)
+        }
 
-task_queue = TaskQueue()
\ No newline at end of file
+task_queue = TaskQueue()
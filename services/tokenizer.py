@@ -0,0 +1,58 @@
+import os
+import re
+import threading
+from config.config import NLTK_DATA_DIR
+from utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Terminal punctuation followed by whitespace and something that can start a sentence
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+(?=[A-Z0-9"\'(\[])')
+
+_lock = threading.Lock()
+_sent_tokenize = None
+_status = "unchecked"
+
+def regex_sent_tokenize(text):
+    return [sentence.strip() for sentence in SENTENCE_BOUNDARY.split(text) if sentence.strip()]
+
+def load_sentence_tokenizer():
+    # Looks for NLTK's punkt data once, in NLTK_DATA_DIR and NLTK's usual
+    # locations, and checks that it loads. Nothing is downloaded at runtime:
+    # bundle the data with `python -m services.tokenizer`.
+    global _sent_tokenize, _status
+    with _lock:
+        if _status == "unchecked":
+            try:
+                import nltk
+                data_dir = os.path.abspath(NLTK_DATA_DIR)
+                if data_dir not in nltk.data.path:
+                    nltk.data.path.insert(0, data_dir)
+                from nltk.tokenize import sent_tokenize
+                sent_tokenize("Checking the tokenizer. It works.")
+                _sent_tokenize = sent_tokenize
+                _status = "punkt"
+            except Exception as e:
+                # LookupError when the data is missing; its message is a page long
+                logger.warning(f"NLTK punkt data is unavailable ({type(e).__name__}), splitting sentences with a regex")
+                _sent_tokenize = regex_sent_tokenize
+                _status = "regex"
+        return _sent_tokenize
+
+def sent_tokenize(text):
+    return load_sentence_tokenizer()(text)
+
+def tokenizer_status() -> str:
+    return _status
+
+def download(directory: str = NLTK_DATA_DIR):
+    import nltk
+    os.makedirs(directory, exist_ok=True)
+    # Older NLTK releases read punkt, newer ones punkt_tab
+    for package in ("punkt", "punkt_tab"):
+        if not nltk.download(package, download_dir=directory, quiet=True):
+            raise RuntimeError(f"Failed to download NLTK package {package}")
+
+if __name__ == "__main__":
+    download()
+    print(f"NLTK tokenizer data saved to {os.path.abspath(NLTK_DATA_DIR)}")
@@ -1,53 +1,81 @@
+import os
 import requests
 from bs4 import BeautifulSoup
 from utils.logger import setup_logger
+from services.cache import TTLCache, normalize_query, normalize_url
+from config.config import (BASE_DATA_DIR, SEARCH_CACHE_TTL, SEARCH_CACHE_SIZE, PAGE_CACHE_TTL,
+                           PAGE_CACHE_SIZE, WEB_CACHE_ON_DISK, SEARCH_URL, HTTP_TIMEOUT, PAGE_MAX_BYTES)
+from services.html_extract import TextExtractor, incremental_decoder, FEED_CHUNK_BYTES
 import time
 import random
-from nltk.tokenize import sent_tokenize
-import nltk
-import ssl
-import certifi
 
 logger = setup_logger(__name__)
 
-try:
-    _create_unverified_https_context = ssl._create_unverified_context
-except AttributeError:
-    pass
-else:
-    ssl._create_default_https_context = _create_unverified_https_context
+FETCH_FAILED_MESSAGE = "Unable to fetch webpage content after multiple attempts."
 
-try:
-    nltk.data.find('tokenizers/punkt')
-except LookupError:
-    try:
-        nltk.download('punkt', quiet=True)
-    except Exception as e:
-        logger.warning(f"Failed to download NLTK data: {str(e)}")
-        logger.warning("NLTK tokenization might not work properly.")
+def _cache_dir(name):
+    return os.path.join(BASE_DATA_DIR, "web_cache", name) if WEB_CACHE_ON_DISK else None
+
+# Shared by every agent, so overlapping interests hit the network only once
+search_cache = TTLCache("search", SEARCH_CACHE_TTL, SEARCH_CACHE_SIZE, _cache_dir("search"))
+page_cache = TTLCache("page", PAGE_CACHE_TTL, PAGE_CACHE_SIZE, _cache_dir("page"))
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+
+# Keep-alive connections are reused across calls
+session = requests.Session()
+session.headers.update({"User-Agent": USER_AGENT})
+
+def search_cache_key(query, num_results):
+    return f"{normalize_query(query)}|{num_results}"
+
+def parse_search_results(html, num_results=5):
+    soup = BeautifulSoup(html, 'html.parser')
+    search_results = []
+    for g in soup.find_all('div', class_='g')[:num_results]:
+        anchor = g.find('a')
+        if anchor:
+            link = anchor['href']
+            title = g.find('h3').text if g.find('h3') else "No title"
+            snippet = g.find('div', class_='VwiC3b').text if g.find('div', class_='VwiC3b') else "No snippet"
+            search_results.append({"title": title, "link": link, "snippet": snippet})
+    return search_results
+
+def read_page_text(response):
+    # Parse the body as it arrives; stop at PAGE_MAX_BYTES or once enough
+    # sentences have been found, leaving the rest of the page unread
+    decoder = incremental_decoder(response.encoding)
+    extractor = TextExtractor()
+    received = 0
+    for chunk in response.iter_content(FEED_CHUNK_BYTES):
+        chunk = chunk[:PAGE_MAX_BYTES - received]
+        received += len(chunk)
+        extractor.feed(decoder.decode(chunk))
+        if extractor.done or received >= PAGE_MAX_BYTES:
+            break
+    return extractor.result()
 
 def search_web(query, num_results=5, max_retries=3):
-    search_url = f"https://www.google.com/search?q={query}"
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-    }
-    
+    # Empty results are what a failed search looks like, so they are not cached
+    return search_cache.get_or_load(
+        search_cache_key(query, num_results),
+        lambda: _search_web(query, num_results, max_retries),
+        should_cache=bool
+    )
+
+def fetch_webpage_content(url, max_retries=3):
+    return page_cache.get_or_load(
+        normalize_url(url),
+        lambda: _fetch_webpage_content(url, max_retries),
+        should_cache=lambda content: content != FETCH_FAILED_MESSAGE
+    )
+
+def _search_web(query, num_results=5, max_retries=3):
     for attempt in range(max_retries):
         try:
-            response = requests.get(search_url, headers=headers, timeout=10)
+            response = session.get(SEARCH_URL, params={"q": query}, timeout=HTTP_TIMEOUT)
             response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            search_results = []
-            for g in soup.find_all('div', class_='g')[:num_results]:
-                anchor = g.find('a')
-                if anchor:
-                    link = anchor['href']
-                    title = g.find('h3').text if g.find('h3') else "No title"
-                    snippet = g.find('div', class_='VwiC3b').text if g.find('div', class_='VwiC3b') else "No snippet"
-                    search_results.append({"title": title, "link": link, "snippet": snippet})
-            
-            return search_results
+            return parse_search_results(response.text, num_results)
         except Exception as e:
             logger.error(f"Error during web search (attempt {attempt + 1}): {str(e)}")
             if attempt < max_retries - 1:
@@ -55,31 +83,19 @@ def search_web(query, num_results=5, max_retries=3):
     
     return []
 
-def fetch_webpage_content(url, max_retries=3):
+def _fetch_webpage_content(url, max_retries=3):
     for attempt in range(max_retries):
         try:
-            response = requests.get(url, timeout=10)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # Remove script and style elements
-            for script in soup(["script", "style"]):
-                script.decompose()
-            
-            text = soup.get_text()
-            lines = (line.strip() for line in text.splitlines())
-            chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-            text = '\n'.join(chunk for chunk in chunks if chunk)
-            
-            sentences = sent_tokenize(text)
-            return ' '.join(sentences[:50])  # Return first 50 sentences
+            with session.get(url, timeout=HTTP_TIMEOUT, stream=True) as response:
+                response.raise_for_status()
+                return read_page_text(response)
         except Exception as e:
             logger.error(f"Error fetching webpage content (attempt {attempt + 1}): {str(e)}")
         
         if attempt < max_retries - 1:
             time.sleep(2)  # Wait before retrying
     
-    return "Unable to fetch webpage content after multiple attempts."
+    return FETCH_FAILED_MESSAGE
 
 def get_random_article(interests):
     query = random.choice(interests)
@@ -92,4 +108,7 @@ def get_random_article(interests):
             "content": content,
             "url": article['link']
         }
-    return None
\ No newline at end of file
+    return None
+
+def web_cache_stats():
+    return [search_cache.stats(), page_cache.stats()]
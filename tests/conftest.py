@@ -0,0 +1,83 @@
+import os
+import sys
+import tempfile
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+# The app keeps its data under the working directory and reads its settings
+# when config is first imported, so both are set before any test imports it
+os.chdir(tempfile.mkdtemp(prefix="agent-village-tests-"))
+os.environ.setdefault("LOG_PAYLOADS", "false")
+os.environ.setdefault("HTTP_BACKOFF_BASE", "0")
+
+from benchmarks.fakes import StubWebServer
+
+stub_web_server = StubWebServer(latency=0).start()
+os.environ["SEARCH_URL"] = f"{stub_web_server.base_url}/search"
+
+@pytest.fixture
+def stub_server():
+    return stub_web_server
+
+@pytest.fixture
+def connection_error():
+    # A retryable OpenAI error, as raised by the client
+    import httpx
+    import openai
+    return lambda: openai.APIConnectionError(request=httpx.Request("POST", "http://llm.invalid"))
+
+@pytest.fixture
+def make_gateway():
+    # make_gateway(llm, **limits) -> an LLMGateway with `llm` as "fake-model";
+    # unthrottled and without backoff unless limits say otherwise
+    from services.llm_gateway import LLMGateway
+
+    def make(llm, **kwargs):
+        options = dict(requests_per_minute=10000, tokens_per_minute=10 ** 9, max_concurrency=4, max_retries=2, backoff_base=0)
+        options.update(kwargs)
+        gateway = LLMGateway(**options)
+        gateway.set_llm("fake-model", llm)
+        return gateway
+
+    return make
+
+@pytest.fixture
+def fake_llm():
+    # FakeLLM and hash embeddings behind the process-wide gateway
+    from llama_index.core import Settings
+    from benchmarks.embeddings import HashEmbedding
+    from benchmarks.fakes import FakeLLM
+    from config.config import DEFAULT_MODEL_NAME
+    from services.llm_gateway import llm_gateway
+
+    Settings.embed_model = HashEmbedding()
+    previous = llm_gateway.llms.get(DEFAULT_MODEL_NAME)
+    llm = FakeLLM(latency=0, token_latency=0, tokens=12)
+    llm_gateway.set_llm(DEFAULT_MODEL_NAME, llm)
+    yield llm
+    llm_gateway.llms.pop(DEFAULT_MODEL_NAME)
+    if previous is not None:
+        llm_gateway.set_llm(DEFAULT_MODEL_NAME, previous)
+
+@pytest.fixture
+def agent_factory(tmp_path, monkeypatch):
+    # A factory with its own store and agent files; the evolution engine hooks
+    # it installs are undone afterwards
+    from agents import agent_factory as agent_factory_module, base_agent
+    from agents.agent_factory import AgentFactory
+    from agents.evolution import evolution_engine
+    from agents.learning_scheduler import LearningScheduler
+
+    monkeypatch.setattr(base_agent, "BASE_DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(agent_factory_module, "learning_scheduler", LearningScheduler())
+    monkeypatch.setattr(evolution_engine, "resolve_agent", evolution_engine.resolve_agent)
+    monkeypatch.setattr(evolution_engine, "listeners", list(evolution_engine.listeners))
+    monkeypatch.setattr(evolution_engine, "buffers", {})
+    factory = AgentFactory(base_data_dir=str(tmp_path))
+    yield factory
+    factory.close()
+
+def pytest_sessionfinish(session, exitstatus):
+    stub_web_server.stop()
@@ -0,0 +1,98 @@
+import asyncio
+import threading
+from models import AgentCreate
+
+def create(factory, name):
+    return factory.create_agent(AgentCreate(personality_type="Curious", interests=["astronomy"], metadata={"name": name}))
+
+def limit_cache(factory, size):
+    factory.max_cached_agents = factory.cache_limit = size
+    factory.max_rss_mb = 0
+
+def record_flushes(agent):
+    flushed = []
+    original_flush = agent.flush
+
+    def flush():
+        flushed.append(threading.current_thread())
+        original_flush()
+
+    agent.flush = flush
+    return flushed
+
+def test_least_recently_used_agent_is_evicted(agent_factory):
+    limit_cache(agent_factory, 2)
+    first, second = create(agent_factory, "first"), create(agent_factory, "second")
+    agent_factory.get_agent(first.agent_id)
+    third = create(agent_factory, "third")
+    assert list(agent_factory.agents) == [first.agent_id, third.agent_id]
+
+def test_busy_agents_are_not_evicted(agent_factory):
+    limit_cache(agent_factory, 2)
+    first, second = create(agent_factory, "first"), create(agent_factory, "second")
+    with first.busy():
+        third = create(agent_factory, "third")
+    assert list(agent_factory.agents) == [first.agent_id, third.agent_id]
+    assert second.agent_id not in agent_factory.agents
+
+def test_evicted_agents_are_flushed(agent_factory):
+    limit_cache(agent_factory, 1)
+    first = create(agent_factory, "first")
+    flushed = record_flushes(first)
+    create(agent_factory, "second")
+    assert flushed == [threading.current_thread()]
+
+def test_evicted_agents_are_flushed_off_the_event_loop(agent_factory):
+    limit_cache(agent_factory, 1)
+    first = create(agent_factory, "first")
+    flushed = record_flushes(first)
+
+    async def run():
+        create(agent_factory, "second")
+        for _ in range(100):
+            if flushed:
+                break
+            await asyncio.sleep(0.01)
+
+    asyncio.run(run())
+    assert len(flushed) == 1
+    assert flushed[0] is not threading.current_thread()
+
+def test_reloaded_agent_sees_its_memory(agent_factory):
+    limit_cache(agent_factory, 1)
+    first = create(agent_factory, "first")
+    first.update_memory("What is a comet?", "An icy body.")
+    create(agent_factory, "second")
+    assert first.agent_id not in agent_factory.agents
+    reloaded = agent_factory.get_agent(first.agent_id)
+    assert reloaded is not first
+    assert reloaded.metadata == {"name": "first"}
+    interactions = asyncio.run(reloaded.get_recent_interactions())
+    assert [interaction["query"] for interaction in interactions] == ["What is a comet?"]
+
+def test_interest_index_follows_saves_and_deletes(agent_factory):
+    from models import AgentUpdate
+    first = agent_factory.create_agent(AgentCreate(personality_type="Curious", interests=["Astronomy ", "chess"], metadata={}))
+    assert agent_factory.find_agent_ids_by_interest("astronomy") == [first.agent_id]
+    second = agent_factory.create_agent(AgentCreate(personality_type="Curious", interests=["astronomy"], metadata={}))
+    assert agent_factory.find_agent_ids_by_interest("ASTRONOMY") == [first.agent_id, second.agent_id]
+    agent_factory.update_agent(first.agent_id, AgentUpdate(interests=["poetry"]))
+    assert agent_factory.find_agent_ids_by_interest("astronomy") == [second.agent_id]
+    assert agent_factory.find_agent_ids_by_interest("chess") == []
+    assert agent_factory.find_agent_ids_by_interest("poetry") == [first.agent_id]
+    # Evolutions are saved through save_agent too
+    second.interests.append("Comets")
+    agent_factory.save_agent(second)
+    assert agent_factory.find_agent_ids_by_interest("comets") == [second.agent_id]
+    agent_factory.delete_agent(second.agent_id)
+    assert agent_factory.find_agent_ids_by_interest("astronomy") == []
+    assert agent_factory.find_agent_ids_by_interest("comets") == []
+    assert "astronomy" not in agent_factory.get_interest_index()
+
+def test_interest_index_is_built_from_the_store(agent_factory):
+    created = [agent_factory.create_agent(AgentCreate(personality_type="Curious", interests=interests, metadata={}))
+               for interests in (["astronomy"], ["astronomy", "chess"], ["chess"])]
+    assert agent_factory.interest_index is None
+    index = agent_factory.get_interest_index()
+    assert index == {"astronomy": {created[0].agent_id, created[1].agent_id},
+                     "chess": {created[1].agent_id, created[2].agent_id}}
@@ -0,0 +1,37 @@
+from datetime import datetime, timedelta
+import pytest
+from agents.agent_store import AgentStore, create_agent_store
+from models import AgentResponse
+
+def test_agent_store_is_abstract():
+    with pytest.raises(TypeError):
+        AgentStore()
+
+    class PartialStore(AgentStore):
+        def get(self, agent_id):
+            return None
+
+    with pytest.raises(TypeError):
+        PartialStore()
+
+@pytest.mark.parametrize("backend", ["sqlite", "file"])
+def test_backends_round_trip_records(tmp_path, backend):
+    store = create_agent_store(backend, str(tmp_path))
+    try:
+        first, second = store.allocate_id(), store.allocate_id()
+        assert second > first
+        now = datetime(2024, 5, 1, 12, 0)
+        record = AgentResponse(agent_id=first, personality_type="Curious", interests=["astronomy"],
+                               metadata={"name": "Ada"}, last_learning_time=now)
+        store.upsert(record)
+        assert store.get(first) == record
+        assert store.get(second) is None
+        assert store.count() == 1
+        assert store.list() == [record]
+        store.set_next_learning_times({first: now + timedelta(hours=1)})
+        assert store.learning_schedule() == {first: now + timedelta(hours=1)}
+        assert store.delete(first)
+        assert not store.delete(first)
+        assert store.count() == 0
+    finally:
+        store.close()
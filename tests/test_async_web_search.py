@@ -0,0 +1,171 @@
+import asyncio
+from contextlib import asynccontextmanager
+import aiohttp
+import pytest
+from aiohttp import web
+from benchmarks.fakes import article_page
+from services.async_web_search import AsyncWebClient, RetryableStatus, async_fetch_top_pages
+from services.html_extract import extract_text
+
+@asynccontextmanager
+async def serve(routes):
+    # Local HTTP server on the test's own event loop; yields its base URL
+    app = web.Application()
+    for path, handler in routes.items():
+        app.router.add_get(path, handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    try:
+        yield f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+    finally:
+        await runner.cleanup()
+
+def failing_then_ok(statuses, text="ok"):
+    # Answers with each status in turn, then 200
+    hits = []
+
+    async def handler(request):
+        hits.append(request.path)
+        if len(hits) <= len(statuses):
+            return web.Response(status=statuses[len(hits) - 1])
+        return web.Response(text=text, content_type="text/html")
+
+    return handler, hits
+
+def make_client(base_url, **kwargs):
+    options = dict(search_url=f"{base_url}/search", timeout=5, max_retries=3, backoff_base=0)
+    options.update(kwargs)
+    return AsyncWebClient(**options)
+
+def test_search_parses_results_from_the_stub_server(stub_server):
+    async def run():
+        client = make_client(stub_server.base_url)
+        try:
+            return await client.search("quantum computing", num_results=5)
+        finally:
+            await client.close()
+
+    results = asyncio.run(run())
+    assert len(results) == 5
+    assert results[0]["title"] == "Quantum Computing result 0"
+    assert all(result["link"].startswith(f"{stub_server.base_url}/articles/") for result in results)
+
+def test_fetch_extracts_page_text():
+    async def article(request):
+        return web.Response(text=article_page(7), content_type="text/html")
+
+    async def run():
+        async with serve({"/articles/7": article}) as base_url:
+            client = make_client(base_url)
+            try:
+                return await client.fetch(f"{base_url}/articles/7")
+            finally:
+                await client.close()
+
+    text = asyncio.run(run())
+    assert text == extract_text(article_page(7))
+    assert "tracking" not in text
+    assert text.startswith("Article 7")
+
+@pytest.mark.parametrize("status", [429, 500, 503])
+def test_retryable_statuses_are_retried(status):
+    handler, hits = failing_then_ok([status, status])
+
+    async def run():
+        async with serve({"/page": handler}) as base_url:
+            client = make_client(base_url)
+            try:
+                return await client.get_text(f"{base_url}/page")
+            finally:
+                await client.close()
+
+    assert asyncio.run(run()) == "ok"
+    assert len(hits) == 3
+
+def test_retries_give_up_after_max_retries():
+    handler, hits = failing_then_ok([503] * 5)
+
+    async def run():
+        async with serve({"/page": handler}) as base_url:
+            client = make_client(base_url, max_retries=3)
+            try:
+                await client.get_text(f"{base_url}/page")
+            finally:
+                await client.close()
+
+    with pytest.raises(RetryableStatus):
+        asyncio.run(run())
+    assert len(hits) == 3
+
+def test_client_errors_are_not_retried():
+    handler, hits = failing_then_ok([404])
+
+    async def run():
+        async with serve({"/page": handler}) as base_url:
+            client = make_client(base_url)
+            try:
+                await client.get_text(f"{base_url}/page")
+            finally:
+                await client.close()
+
+    with pytest.raises(aiohttp.ClientResponseError) as error:
+        asyncio.run(run())
+    assert error.value.status == 404
+    assert len(hits) == 1
+
+def test_connection_errors_are_retried():
+    async def run():
+        # Nothing listens on this port any more
+        async with serve({}) as base_url:
+            pass
+        client = make_client(base_url, max_retries=2)
+        try:
+            await client.get_text(f"{base_url}/page")
+        finally:
+            await client.close()
+
+    with pytest.raises(aiohttp.ClientConnectionError):
+        asyncio.run(run())
+
+def test_backoff_grows_exponentially_with_jitter():
+    client = AsyncWebClient(backoff_base=0.5)
+    for attempt in range(4):
+        delays = [client.backoff_delay(attempt) for _ in range(200)]
+        assert all(0 <= delay <= 0.5 * 2 ** attempt for delay in delays)
+        assert max(delays) > 0.5 * 2 ** attempt / 2
+
+def test_top_pages_are_fetched_concurrently():
+    in_flight = 0
+    max_in_flight = 0
+
+    async def search(request):
+        base_url = f"http://{request.host}"
+        links = "".join(
+            f'<div class="g"><a href="{base_url}/articles/{i}">link</a><h3>Result {i}</h3>'
+            f'<div class="VwiC3b">Snippet {i}</div></div>'
+            for i in range(5)
+        )
+        return web.Response(text=f"<html><body>{links}</body></html>", content_type="text/html")
+
+    async def article(request):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.05)
+        in_flight -= 1
+        return web.Response(text=article_page(int(request.match_info["article_id"])), content_type="text/html")
+
+    async def run():
+        async with serve({"/search": search, "/articles/{article_id}": article}) as base_url:
+            client = make_client(base_url)
+            try:
+                return await async_fetch_top_pages("concurrent fetch test", k=3, client=client)
+            finally:
+                await client.close()
+
+    pages = asyncio.run(run())
+    assert [page["title"] for page in pages] == ["Result 0", "Result 1", "Result 2"]
+    assert pages[1]["content"] == extract_text(article_page(1))
+    assert max_in_flight == 3
@@ -0,0 +1,87 @@
+import asyncio
+import json
+import httpx
+import pytest
+
+@pytest.fixture
+def app(fake_llm):
+    from main import app
+    return app
+
+async def create_agent(client, interest):
+    response = await client.post("/agents", json={
+        "personality_type": "Curious", "interests": [interest], "metadata": {"name": "Batched"}
+    })
+    assert response.status_code == 200, response.text
+    return response.json()["agent_id"]
+
+def run_batch(app, setup):
+    # setup(client) creates the agents and returns (request body, context)
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            body, context = await setup(client)
+            response = await client.post("/query/batch", json=body)
+            return response, context
+
+    response, context = asyncio.run(run())
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    return [json.loads(line) for line in response.text.splitlines()], context
+
+def test_batch_reports_failures_per_agent(app):
+    from main import agent_factory
+
+    async def setup(client):
+        ok, failing = await create_agent(client, "batching"), await create_agent(client, "batching")
+
+        async def fail(query_text, search_results=None):
+            raise RuntimeError("LLM down")
+
+        agent_factory.get_agent(failing).query = fail
+        return {"query": "Anything new?", "agent_ids": [ok, failing, 999999]}, (ok, failing)
+
+    results, (ok, failing) = run_batch(app, setup)
+    by_agent = {result["agent_id"]: result for result in results}
+    assert len(results) == 3
+    assert by_agent[ok]["query"] == "Anything new?"
+    assert by_agent[ok]["response"]
+    assert by_agent[failing] == {"agent_id": failing, "error": "Query failed"}
+    assert by_agent[999999] == {"agent_id": 999999, "error": "Agent not found"}
+
+def test_batch_streams_answers_as_they_finish(app):
+    from main import agent_factory
+
+    async def setup(client):
+        slow, fast = await create_agent(client, "ordering"), await create_agent(client, "ordering")
+        agent = agent_factory.get_agent(slow)
+        query = agent.query
+
+        async def slow_query(query_text, search_results=None):
+            await asyncio.sleep(0.2)
+            return await query(query_text, search_results=search_results)
+
+        agent.query = slow_query
+        # Duplicates are answered once
+        return {"query": "Anything new?", "agent_ids": [slow, fast, slow], "concurrency": 2}, (slow, fast)
+
+    results, (slow, fast) = run_batch(app, setup)
+    assert [result["agent_id"] for result in results] == [fast, slow]
+    assert all("error" not in result for result in results)
+
+def test_batch_by_interest_answers_every_matching_agent(app):
+    async def setup(client):
+        agent_ids = [await create_agent(client, "batch-interest") for _ in range(3)]
+        await create_agent(client, "elsewhere")
+        return {"query": "Anything new?", "interest": "Batch-Interest"}, agent_ids
+
+    results, agent_ids = run_batch(app, setup)
+    assert sorted(result["agent_id"] for result in results) == agent_ids
+
+def test_batch_needs_agent_ids_or_an_interest(app):
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/query/batch", json={"query": "Anything new?"})
+
+    assert asyncio.run(run()).status_code == 400
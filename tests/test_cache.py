@@ -0,0 +1,156 @@
+import asyncio
+import threading
+import time
+import pytest
+from services import cache as cache_module
+from services.cache import TTLCache, LoadCancelledError
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, "time", lambda: now[0])
+    return now
+
+def test_entries_expire_after_their_ttl(clock):
+    cache = TTLCache("test", ttl=10, max_entries=10)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=100)
+    clock[0] += 9
+    assert cache.get("a") == 1
+    clock[0] += 2
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+    assert cache.stats()["entries"] == 1
+
+def test_least_recently_used_entries_are_evicted():
+    cache = TTLCache("test", ttl=60, max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    stats = cache.stats()
+    assert stats["entries"] == 2
+    assert (stats["hits"], stats["misses"]) == (3, 1)
+
+def test_concurrent_thread_misses_share_one_load():
+    cache = TTLCache("test", ttl=60, max_entries=10)
+    calls = []
+    release = threading.Event()
+
+    def loader():
+        calls.append(1)
+        release.wait(5)
+        return "value"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_load("k", loader))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    while cache.stats()["coalesced"] < 4:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert results == ["value"] * 5
+    assert len(calls) == 1
+    assert cache.get_or_load("k", loader) == "value"
+    assert len(calls) == 1
+
+def test_concurrent_async_misses_share_one_load():
+    cache = TTLCache("test", ttl=60, max_entries=10)
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "value"
+
+    async def run():
+        return await asyncio.gather(*(cache.aget_or_load("k", loader) for _ in range(5)))
+
+    assert asyncio.run(run()) == ["value"] * 5
+    assert len(calls) == 1
+    assert cache.stats()["coalesced"] == 4
+
+def test_cancelling_one_caller_leaves_the_load_to_the_others():
+    cache = TTLCache("test", ttl=60, max_entries=10)
+
+    async def loader():
+        await asyncio.sleep(0.05)
+        return "value"
+
+    async def run():
+        first = asyncio.create_task(cache.aget_or_load("k", loader))
+        second = asyncio.create_task(cache.aget_or_load("k", loader))
+        # Like a stage timeout on the request that started the load
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(first, 0.01)
+        return await second
+
+    assert asyncio.run(run()) == "value"
+    assert cache.get("k") == "value"
+
+def test_waiters_get_an_error_when_the_load_is_cancelled():
+    cache = TTLCache("test", ttl=60, max_entries=10)
+
+    async def loader():
+        await asyncio.sleep(5)
+
+    async def run():
+        waiter = asyncio.create_task(cache.aget_or_load("k", loader))
+        await asyncio.sleep(0.01)
+        cache.async_in_flight["k"].cancel()
+        return await asyncio.gather(waiter, return_exceptions=True)
+
+    [result] = asyncio.run(run())
+    assert isinstance(result, LoadCancelledError)
+    assert cache.async_in_flight == {}
+
+def test_failed_and_rejected_loads_are_not_cached():
+    cache = TTLCache("test", ttl=60, max_entries=10)
+
+    async def failing():
+        raise ValueError("search is down")
+
+    async def empty():
+        return []
+
+    async def run():
+        results = await asyncio.gather(cache.aget_or_load("k", failing), cache.aget_or_load("k", failing),
+                                       return_exceptions=True)
+        assert await cache.aget_or_load("e", empty, should_cache=bool) == []
+        return results
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert cache.get("k") is None
+    assert cache.get("e") is None
+
+def test_disk_tier_outlives_the_process_cache(tmp_path, clock):
+    first = TTLCache("test", ttl=10, max_entries=10, disk_dir=str(tmp_path))
+    first.set("a", {"title": "Comets"})
+
+    async def loader():
+        raise AssertionError("loaded a key that was on disk")
+
+    second = TTLCache("test", ttl=10, max_entries=10, disk_dir=str(tmp_path))
+    assert asyncio.run(second.aget_or_load("a", loader)) == {"title": "Comets"}
+    assert second.stats()["disk_hits"] == 1
+    third = TTLCache("test", ttl=10, max_entries=10, disk_dir=str(tmp_path))
+    assert third.get_or_load("a", lambda: "reloaded") == {"title": "Comets"}
+    # Expired on disk too
+    clock[0] += 11
+    fourth = TTLCache("test", ttl=10, max_entries=10, disk_dir=str(tmp_path))
+    assert fourth.get("a") is None
+
+def test_async_loads_are_written_to_disk(tmp_path):
+    cache = TTLCache("test", ttl=60, max_entries=10, disk_dir=str(tmp_path))
+
+    async def loader():
+        return "value"
+
+    assert asyncio.run(cache.aget_or_load("k", loader)) == "value"
+    assert TTLCache("test", ttl=60, max_entries=10, disk_dir=str(tmp_path)).get("k") == "value"
@@ -0,0 +1,127 @@
+import asyncio
+import os
+import subprocess
+import sys
+import pytest
+from agents.document_store import DocumentStore, migrate_legacy_knowledge_bases
+from services.cache import LoadCancelledError
+from benchmarks.embeddings import HashEmbedding
+
+def write_legacy_kb(persist_dir, source, text):
+    from llama_index.core import Document, VectorStoreIndex
+    index = VectorStoreIndex.from_documents([Document(text=text, metadata={"source": source})], embed_model=HashEmbedding())
+    index.storage_context.persist(persist_dir=persist_dir)
+
+def test_legacy_knowledge_bases_are_migrated_up_front(tmp_path, monkeypatch):
+    from llama_index.core import Settings
+    # Loading an old index resolves the global embedding model; its stored vectors are reused
+    monkeypatch.setattr(Settings, "_embed_model", HashEmbedding())
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    write_legacy_kb(str(data_dir / "agent_3_kb"), "https://example.com/comets", "Comets are icy bodies.")
+    # Left behind by a crash mid-persist
+    write_legacy_kb(str(data_dir / "agent_4_kb.old"), "https://example.com/tides", "Tides follow the moon.")
+    (data_dir / "agent_5_kb.tmp").mkdir()
+    store = DocumentStore(str(tmp_path / "shared_kb"))
+    try:
+        migrate_legacy_knowledge_bases(store, str(data_dir))
+        assert sorted(os.listdir(data_dir)) == ["agent_3_kb.migrated", "agent_4_kb.migrated"]
+        embedding = HashEmbedding().get_query_embedding("Comets are icy bodies.")
+        chunks = asyncio.run(store.retrieve(3, "comets", embedding))
+        assert [chunk.text for chunk in chunks] == ["Comets are icy bodies."]
+        assert len(store.agent_rows(4)) == 1
+    finally:
+        store.close()
+
+def test_empty_knowledge_base_is_not_embedded(tmp_path, monkeypatch):
+    from agents import document_store
+
+    async def embed_query(query_text):
+        raise AssertionError("embedded a query for an empty knowledge base")
+
+    monkeypatch.setattr(document_store, "embed_query", embed_query)
+    store = DocumentStore(str(tmp_path / "shared_kb"))
+    try:
+        assert asyncio.run(store.retrieve(1, "anything")) == []
+    finally:
+        store.close()
+
+def test_importing_the_module_creates_no_files(tmp_path):
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=repo_root)
+    subprocess.run([sys.executable, "-c", "import agents.document_store"], cwd=tmp_path, env=env, check=True)
+    assert os.listdir(tmp_path) == []
+
+def slow_embedding(monkeypatch, release):
+    from agents import document_store
+    calls = []
+
+    async def embed_chunks(chunks):
+        calls.append(chunks)
+        await release.wait()
+        return [HashEmbedding().get_text_embedding(chunk) for chunk in chunks]
+
+    monkeypatch.setattr(document_store, "embed_chunks", embed_chunks)
+    return calls
+
+def test_concurrent_learners_embed_an_article_once(tmp_path, monkeypatch):
+    store = DocumentStore(str(tmp_path / "shared_kb"))
+
+    async def run():
+        release = asyncio.Event()
+        calls = slow_embedding(monkeypatch, release)
+        learners = [asyncio.create_task(store.add_document(agent_id, "https://example.com/comets", "Comets are icy bodies."))
+                    for agent_id in (1, 2, 3)]
+        await asyncio.sleep(0.05)
+        release.set()
+        return calls, await asyncio.gather(*learners)
+
+    try:
+        calls, embedded = asyncio.run(run())
+        assert len(calls) == 1
+        assert sorted(embedded) == [False, False, True]
+        assert all(len(store.agent_rows(agent_id)) == 1 for agent_id in (1, 2, 3))
+    finally:
+        store.close()
+
+def test_cancelled_learner_leaves_the_embedding_to_the_others(tmp_path, monkeypatch):
+    store = DocumentStore(str(tmp_path / "shared_kb"))
+
+    async def run():
+        release = asyncio.Event()
+        calls = slow_embedding(monkeypatch, release)
+        first = asyncio.create_task(store._embed_once("digest", "Comets are icy bodies."))
+        await asyncio.sleep(0.05)
+        second = asyncio.create_task(store._embed_once("digest", "Comets are icy bodies."))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        chunks, vectors = await second
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return calls, chunks
+
+    try:
+        calls, chunks = asyncio.run(run())
+        assert len(calls) == 1
+        assert chunks == ["Comets are icy bodies."]
+    finally:
+        store.close()
+
+def test_waiters_get_an_error_when_the_embedding_is_cancelled(tmp_path, monkeypatch):
+    store = DocumentStore(str(tmp_path / "shared_kb"))
+
+    async def run():
+        slow_embedding(monkeypatch, asyncio.Event())
+        waiter = asyncio.create_task(store._embed_once("digest", "Comets are icy bodies."))
+        await asyncio.sleep(0.05)
+        store.in_flight["digest"].cancel()
+        with pytest.raises(LoadCancelledError):
+            await waiter
+        return store.in_flight
+
+    try:
+        assert asyncio.run(run()) == {}
+    finally:
+        store.close()
@@ -0,0 +1,136 @@
+import asyncio
+from types import SimpleNamespace
+from agents.evolution import EvolutionEngine, truncate_to_budget
+from models import AgentCreate
+
+class RecordingAgent:
+    def __init__(self, agent_id):
+        self.agent_id = agent_id
+        self.evolved_with = []
+
+    async def evolve(self, contents):
+        self.evolved_with.append(contents)
+
+def test_events_are_batched_into_one_evolution_per_agent():
+    engine = EvolutionEngine(window=60, batch_size=3, token_budget=1000)
+    first, second = RecordingAgent(1), RecordingAgent(2)
+    saved = []
+    engine.add_listener(lambda agent: saved.append(agent.agent_id))
+    engine.record(first, "a")
+    engine.record(second, "x")
+    engine.record(first, "b")
+    assert engine._due_agent_ids() == []
+    assert not engine.wakeup.is_set()
+    engine.record(first, "c")
+    assert engine.wakeup.is_set()
+    assert engine._due_agent_ids() == [1]
+
+    asyncio.run(engine.flush(engine._due_agent_ids()))
+    assert first.evolved_with == [["a", "b", "c"]]
+    assert second.evolved_with == []
+    assert saved == [1]
+    assert engine.stats() == {"buffered_agents": 1, "buffered_events": 1, "events": 4, "evolutions": 1}
+
+def test_buffers_are_flushed_once_their_window_has_passed(monkeypatch):
+    from agents import evolution
+    now = [100.0]
+    monkeypatch.setattr(evolution.time, "monotonic", lambda: now[0])
+    engine = EvolutionEngine(window=10, batch_size=100, token_budget=1000)
+    engine.record(RecordingAgent(1), "a")
+    now[0] += 5
+    engine.record(RecordingAgent(2), "b")
+    now[0] += 6
+    assert engine._due_agent_ids() == [1]
+
+def test_events_share_the_token_budget():
+    assert truncate_to_budget([], 10) == []
+    assert truncate_to_budget(["a" * 100, "b" * 10], 10) == ["a" * 20, "b" * 10]
+
+def test_evolution_applies_to_the_live_agent_and_skips_deleted_ones():
+    engine = EvolutionEngine(window=60, batch_size=1, token_budget=1000)
+    stale, live = RecordingAgent(1), RecordingAgent(1)
+    agents = {1: live}
+    engine.resolve_agent = agents.get
+    engine.record(stale, "a")
+    asyncio.run(engine.flush())
+    assert live.evolved_with == [["a"]]
+    assert stale.evolved_with == []
+
+    del agents[1]
+    engine.record(live, "b")
+    asyncio.run(engine.flush())
+    assert live.evolved_with == [["a"]]
+
+def test_failures_do_not_stop_other_agents_or_listeners():
+    engine = EvolutionEngine(window=60, batch_size=1, token_budget=1000)
+
+    class FailingAgent(RecordingAgent):
+        async def evolve(self, contents):
+            raise RuntimeError("LLM unavailable")
+
+    saved = []
+
+    def failing_listener(agent):
+        raise RuntimeError("store unavailable")
+
+    engine.add_listener(failing_listener)
+    engine.add_listener(lambda agent: saved.append(agent.agent_id))
+    engine.record(FailingAgent(1), "a")
+    engine.record(RecordingAgent(2), "b")
+    asyncio.run(engine.flush())
+    assert saved == [2]
+    assert engine.stats()["evolutions"] == 1
+
+def test_discard_drops_buffered_events():
+    engine = EvolutionEngine(window=60, batch_size=10, token_budget=1000)
+    agent = RecordingAgent(1)
+    engine.record(agent, "a")
+    engine.discard(1)
+    asyncio.run(engine.flush())
+    assert agent.evolved_with == []
+
+def test_agent_deleted_during_its_evolution_is_not_written_back(agent_factory, fake_llm):
+    from agents.evolution import evolution_engine
+    agent = agent_factory.create_agent(AgentCreate(personality_type="Curious", interests=["astronomy"], metadata={}))
+    agent_factory.get_interest_index()
+    started, finish = None, None
+    original_evolve = agent.evolve
+
+    async def slow_evolve(contents):
+        started.set()
+        await finish.wait()
+        await original_evolve(contents)
+        agent.personality_type = "Wiser"
+
+    agent.evolve = slow_evolve
+
+    async def run():
+        nonlocal started, finish
+        started, finish = asyncio.Event(), asyncio.Event()
+        evolution_engine.record(agent, "comets")
+        flush = asyncio.create_task(evolution_engine.flush())
+        await started.wait()
+        agent_factory.delete_agent(agent.agent_id)
+        finish.set()
+        await flush
+
+    asyncio.run(run())
+    assert agent_factory.store.get(agent.agent_id) is None
+    assert agent_factory.list_agents().agents == []
+    assert agent_factory.find_agent_ids_by_interest("astronomy") == []
+
+def test_deleting_an_agent_drops_its_pending_evolution(agent_factory, fake_llm):
+    from agents.evolution import evolution_engine
+    agent = agent_factory.create_agent(AgentCreate(personality_type="Curious", interests=["astronomy"], metadata={}))
+    evolution_engine.record(agent, "comets")
+    agent_factory.delete_agent(agent.agent_id)
+    assert evolution_engine.stats()["buffered_agents"] == 0
+
+def test_evolved_agents_are_saved(agent_factory, fake_llm):
+    from agents.evolution import evolution_engine
+    agent = agent_factory.create_agent(AgentCreate(personality_type="Curious", interests=["astronomy"], metadata={}))
+    evolution_engine.record(agent, "comets")
+    asyncio.run(evolution_engine.flush())
+    record = agent_factory.store.get(agent.agent_id)
+    assert record.personality_type == "Curious and evolving researcher"
+    assert len(record.interests) == 3
@@ -0,0 +1,63 @@
+import asyncio
+import random
+from agents.gossip import plan_gossip_round, run_gossip_round
+from models import AgentCreate
+
+INDEX = {
+    "astronomy": {1, 2, 3},
+    "chess": {2, 4},
+    "poetry": {5},
+    "comets": {1, 3, 6},
+}
+
+def learners_of(plan):
+    return [learner_id for step in plan for learner_id in step["learners"]]
+
+def test_each_step_pairs_a_teacher_with_learners_sharing_the_interest():
+    plan = plan_gossip_round(INDEX, max_pairs=10, rng=random.Random(1))
+    assert plan
+    for step in plan:
+        members = INDEX[step["interest"]]
+        assert step["teacher"] in members
+        assert step["teacher"] not in step["learners"]
+        assert set(step["learners"]) <= members
+
+def test_interests_with_one_agent_are_skipped():
+    plan = plan_gossip_round(INDEX, max_pairs=10, rng=random.Random(2))
+    assert "poetry" not in [step["interest"] for step in plan]
+
+def test_agents_learn_at_most_once_per_round():
+    for seed in range(20):
+        learners = learners_of(plan_gossip_round(INDEX, max_pairs=10, rng=random.Random(seed)))
+        assert len(learners) == len(set(learners))
+
+def test_max_pairs_caps_the_number_of_learners():
+    for seed in range(20):
+        assert len(learners_of(plan_gossip_round(INDEX, max_pairs=2, rng=random.Random(seed)))) <= 2
+    assert plan_gossip_round(INDEX, max_pairs=0) == []
+
+def test_rounds_can_be_limited_to_some_interests():
+    plan = plan_gossip_round(INDEX, max_pairs=10, interests=["chess", "unknown"], rng=random.Random(3))
+    assert [step["interest"] for step in plan] == ["chess"]
+    assert sorted([plan[0]["teacher"]] + plan[0]["learners"]) == [2, 4]
+
+def test_same_seed_gives_the_same_plan():
+    assert plan_gossip_round(INDEX, 10, rng=random.Random(4)) == plan_gossip_round(INDEX, 10, rng=random.Random(4))
+
+def test_gossip_round_teaches_agents_sharing_an_interest(agent_factory, fake_llm):
+    agents = [agent_factory.create_agent(AgentCreate(personality_type="Curious", interests=interests, metadata={}))
+              for interests in (["astronomy"], ["astronomy"], ["chess"])]
+    result = asyncio.run(run_gossip_round(agent_factory, max_pairs=10))
+    assert result["queries"] == 1
+    assert result["pairs"] == 1
+    assert result["failed"] == 0
+    exchange = result["exchanges"][0]
+    assert exchange["interest"] == "astronomy"
+    assert sorted([exchange["teacher"]] + exchange["learners"]) == [agents[0].agent_id, agents[1].agent_id]
+
+def test_gossip_round_reports_missing_teachers(agent_factory, fake_llm, monkeypatch):
+    from agents import gossip
+    monkeypatch.setattr(gossip, "plan_gossip_round", lambda *args: [{"interest": "astronomy", "teacher": 999, "learners": [998]}])
+    result = asyncio.run(run_gossip_round(agent_factory))
+    assert result["failed"] == 1
+    assert result["exchanges"][0] == {"interest": "astronomy", "teacher": 999, "learners": [], "error": "Teacher not found"}
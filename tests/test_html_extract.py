@@ -0,0 +1,105 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+from benchmarks.html_extraction import legacy_extract_text
+from services import async_web_search, html_extract, web_search
+from services.html_extract import TextExtractor, extract_text, extract_text_from_bytes, incremental_decoder
+
+PAGES = [
+    "<html><head><title>Comets</title><style>p { color: red; }</style></head>"
+    "<body><p>Comets are icy bodies. They orbit the sun.</p></body></html>",
+    "<body><script>var s = '<p>not text</p>'; if (a < b) {}</script><p>Visible text here.</p>"
+    "<script type='text/javascript'>document.write('</div>');</script><p>More text.</p></body>",
+    "<div><p>One <b>two <i>three</i></b> four.</p><div><span>Nested</span> <em>deeply</em> here.</div></div>",
+    "<ul><li>First item.</li><li>Second item.</li></ul><p>Fish &amp; chips &lt;3. Caf&eacute; au lait.</p>",
+    "<div><style>.a{}</style>Before style. <style>.b{}</style>After style.<script></script> End.</div>",
+    "<p>Unclosed paragraph. <p>Another one<br>with a break. <!-- a comment --> Trailing text.",
+]
+
+@pytest.mark.parametrize("html", PAGES)
+def test_matches_the_legacy_extractor(html):
+    assert extract_text(html) == legacy_extract_text(html)
+
+def long_page(paragraphs):
+    return "<html><body>" + "".join(
+        f"<p>Paragraph {i} starts here. It has a second sentence! Does it have a third?</p>" for i in range(paragraphs)
+    ) + "</body></html>"
+
+def test_sentence_limit_matches_the_legacy_extractor():
+    html = long_page(50)
+    assert extract_text(html, max_sentences=10) == legacy_extract_text(html, max_sentences=10)
+
+def test_parsing_stops_once_enough_sentences_are_found():
+    extractor = TextExtractor(max_sentences=5)
+    extractor.feed(long_page(1000))
+    extractor.feed("<p>Never parsed.</p>")
+    assert extractor.done
+    assert "Never parsed" not in extractor.result()
+
+def test_text_split_across_chunks_is_joined(monkeypatch):
+    monkeypatch.setattr(html_extract, "FEED_CHUNK_BYTES", 7)
+    html = PAGES[2].encode("utf-8")
+    assert extract_text_from_bytes(html) == legacy_extract_text(PAGES[2])
+
+def test_multibyte_characters_split_across_chunks_are_decoded(monkeypatch):
+    monkeypatch.setattr(html_extract, "FEED_CHUNK_BYTES", 3)
+    assert extract_text_from_bytes("<p>Café crème, naïve piñata.</p>".encode("utf-8")) == "Café crème, naïve piñata."
+
+def test_declared_charset_is_used():
+    data = "<p>Café crème.</p>".encode("iso-8859-1")
+    assert extract_text_from_bytes(data, charset="iso-8859-1") == "Café crème."
+
+def test_unknown_charset_falls_back_to_utf8():
+    assert incremental_decoder("no-such-charset").decode("é".encode("utf-8")) == "é"
+    assert extract_text_from_bytes("<p>Café.</p>".encode("utf-8"), charset="no-such-charset") == "Café."
+
+def test_invalid_bytes_are_replaced():
+    assert extract_text_from_bytes(b"<p>Bad \xff byte.</p>") == "Bad � byte."
+
+class SyncResponse:
+    def __init__(self, data, encoding="utf-8"):
+        self.data = data
+        self.encoding = encoding
+        self.chunks_read = 0
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.data), chunk_size):
+            self.chunks_read += 1
+            yield self.data[start:start + chunk_size]
+
+KEPT = b"<p>Kept before the cap.</p>"
+DROPPED = b"<p>Dropped after it.</p>" * 1000
+
+def test_page_text_is_capped_at_max_bytes(monkeypatch):
+    # The cap falls in the middle of the second chunk
+    monkeypatch.setattr(web_search, "PAGE_MAX_BYTES", len(KEPT))
+    monkeypatch.setattr(web_search, "FEED_CHUNK_BYTES", 16)
+    response = SyncResponse(KEPT + DROPPED)
+    assert web_search.read_page_text(response) == "Kept before the cap."
+    assert response.chunks_read == 2
+
+def test_page_text_uses_the_response_encoding():
+    response = SyncResponse("<p>Café crème.</p>".encode("iso-8859-1"), encoding="iso-8859-1")
+    assert web_search.read_page_text(response) == "Café crème."
+
+def async_response(data, charset="utf-8"):
+    async def iter_chunked(chunk_size):
+        for start in range(0, len(data), chunk_size):
+            yield data[start:start + chunk_size]
+
+    return SimpleNamespace(content=SimpleNamespace(iter_chunked=iter_chunked), charset=charset)
+
+def test_page_bytes_are_capped_at_max_bytes(monkeypatch):
+    monkeypatch.setattr(async_web_search, "PAGE_MAX_BYTES", len(KEPT))
+    monkeypatch.setattr(async_web_search, "FEED_CHUNK_BYTES", 16)
+    body, charset = asyncio.run(async_web_search.read_page_bytes(async_response(KEPT + DROPPED, "iso-8859-1")))
+    assert body == KEPT
+    assert charset == "iso-8859-1"
+
+def test_async_page_text_is_capped_at_max_bytes(monkeypatch):
+    kept = "<p>Kept before the cap, café.</p>".encode("iso-8859-1")
+    monkeypatch.setattr(async_web_search, "PAGE_MAX_BYTES", len(kept))
+    monkeypatch.setattr(async_web_search, "FEED_CHUNK_BYTES", 16)
+    data = kept + DROPPED
+    text = asyncio.run(async_web_search.read_page_text(async_response(data, "iso-8859-1")))
+    assert text == "Kept before the cap, café."
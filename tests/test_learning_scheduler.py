@@ -0,0 +1,94 @@
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import pytest
+from agents import learning_scheduler as learning_scheduler_module
+from agents.agent_store import create_agent_store
+from agents.learning_scheduler import LearningScheduler
+from models import AgentResponse
+from services.task_queue import TaskQueue
+
+@pytest.fixture
+def store(tmp_path):
+    store = create_agent_store("sqlite", str(tmp_path))
+    for agent_id in (1, 2, 3, 4):
+        store.upsert(AgentResponse(agent_id=agent_id, personality_type="Curious", interests=["astronomy"],
+                                   metadata={}, last_learning_time=datetime(2024, 5, 1)))
+    yield store
+    store.close()
+
+def make_factory(store):
+    learned = []
+
+    async def learn(agent_id):
+        learned.append(agent_id)
+
+    return SimpleNamespace(store=store, learn=learn), learned
+
+def run_scheduler(scheduler, monkeypatch, until):
+    # Runs the scheduler against its own task queue until until() holds
+    queue = TaskQueue(max_concurrent_tasks=1)
+    monkeypatch.setattr(learning_scheduler_module, "task_queue", queue)
+
+    async def run():
+        tasks = [asyncio.create_task(scheduler.run()), asyncio.create_task(queue.run())]
+        for _ in range(200):
+            if until():
+                break
+            await asyncio.sleep(0.01)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    asyncio.run(run())
+
+def test_agents_learn_in_due_time_order(store, monkeypatch):
+    now = datetime.now()
+    store.set_next_learning_times({1: now - timedelta(minutes=2), 2: now - timedelta(minutes=1),
+                                   3: now - timedelta(minutes=3), 4: now + timedelta(hours=1)})
+    factory, learned = make_factory(store)
+    scheduler = LearningScheduler(interval=timedelta(hours=1), jitter=0)
+    scheduler.start(factory)
+    run_scheduler(scheduler, monkeypatch, lambda: len(learned) == 3)
+    assert learned == [3, 1, 2]
+    assert scheduler.runs == 3
+
+def test_start_persists_due_times_only_for_new_agents(store):
+    due = datetime.now() + timedelta(minutes=30)
+    store.set_next_learning_times({1: due})
+    factory, _ = make_factory(store)
+    scheduler = LearningScheduler(interval=timedelta(hours=1))
+    scheduler.start(factory)
+    schedule = store.learning_schedule()
+    assert sorted(schedule) == [1, 2, 3, 4]
+    assert schedule[1] == due
+    assert all(datetime.now() <= schedule[agent_id] <= datetime.now() + timedelta(hours=1) for agent_id in (2, 3, 4))
+    # A restart picks up the persisted times instead of drawing new ones
+    restarted = LearningScheduler(interval=timedelta(hours=1))
+    restarted.start(factory)
+    assert restarted.due_times == scheduler.due_times
+
+def test_next_due_time_is_persisted_after_learning(store, monkeypatch):
+    now = datetime.now()
+    store.set_next_learning_times({agent_id: now + timedelta(hours=1) for agent_id in (2, 3, 4)})
+    store.set_next_learning_times({1: now - timedelta(minutes=1)})
+    factory, learned = make_factory(store)
+    scheduler = LearningScheduler(interval=timedelta(hours=2), jitter=0)
+    scheduler.start(factory)
+    run_scheduler(scheduler, monkeypatch, lambda: learned == [1])
+    assert learned == [1]
+    assert store.learning_schedule()[1] >= now + timedelta(hours=2)
+
+def test_removed_agents_are_not_learned(store, monkeypatch):
+    now = datetime.now()
+    store.set_next_learning_times({agent_id: now - timedelta(minutes=agent_id) for agent_id in (1, 2, 3, 4)})
+    factory, learned = make_factory(store)
+    scheduler = LearningScheduler(interval=timedelta(hours=1), jitter=0)
+    scheduler.start(factory)
+    scheduler.remove_agent(2)
+    # Deleted from the store without being removed from the scheduler
+    store.delete(4)
+    assert scheduler.stats()["scheduled_agents"] == 3
+    run_scheduler(scheduler, monkeypatch, lambda: len(learned) == 2)
+    assert learned == [3, 1]
+    assert sorted(scheduler.due_times) == [1, 3]
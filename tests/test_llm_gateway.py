@@ -0,0 +1,232 @@
+import asyncio
+from types import SimpleNamespace
+import openai
+import pytest
+from services import llm_gateway as gateway_module
+from services.llm_gateway import TokenBucket, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+
+MODEL = "fake-model"
+
+class RecordingLLM:
+    # Completes once release() is called, recording the order calls started in
+    def __init__(self):
+        self.started = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.released = asyncio.Event()
+
+    def release(self):
+        self.released.set()
+
+    async def acomplete(self, prompt, **kwargs):
+        self.started.append(prompt)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await self.released.wait()
+        finally:
+            self.in_flight -= 1
+        return SimpleNamespace(text=f"answer to {prompt}")
+
+class FlakyLLM:
+    # Raises the queued errors in order, then answers
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    async def acomplete(self, prompt, **kwargs):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return SimpleNamespace(text="ok")
+
+def test_token_bucket_refills_at_its_rate(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(gateway_module.time, "monotonic", lambda: now[0])
+    bucket = TokenBucket(60)
+    assert bucket.delay(60) == 0
+    bucket.consume(60)
+    assert bucket.delay(1) == pytest.approx(1.0)
+    now[0] += 0.5
+    assert bucket.delay(1) == pytest.approx(0.5)
+    now[0] += 10
+    assert bucket.delay(10) == 0
+    # Never holds more than a minute's worth
+    now[0] += 1000
+    assert bucket.delay(60) == 0
+    assert bucket.tokens == 60
+
+def test_token_bucket_clamps_oversized_requests(monkeypatch):
+    monkeypatch.setattr(gateway_module.time, "monotonic", lambda: 100.0)
+    bucket = TokenBucket(60)
+    # A request bigger than the bucket waits for a full bucket, not forever
+    assert bucket.delay(1000) == 0
+    bucket.consume(1000)
+    assert bucket.tokens == 0
+    assert bucket.delay(1000) == pytest.approx(60.0)
+
+def test_complete_goes_through_the_installed_llm(make_gateway):
+    llm = FlakyLLM()
+    gateway = make_gateway(llm)
+    assert asyncio.run(gateway.complete("hello", MODEL)) == "ok"
+    assert llm.calls == 1
+    assert gateway.stats() == {"active": 0, "waiting": 0, "calls": 1, "retries": 0, "errors": 0}
+
+def test_concurrency_is_capped(make_gateway):
+    async def run():
+        llm = RecordingLLM()
+        gateway = make_gateway(llm, max_concurrency=2)
+        tasks = [asyncio.create_task(gateway.complete(f"q{i}", MODEL)) for i in range(6)]
+        await asyncio.sleep(0.01)
+        assert llm.in_flight == 2
+        assert gateway.stats()["waiting"] == 4
+        llm.release()
+        await asyncio.gather(*tasks)
+        return llm, gateway
+
+    llm, gateway = asyncio.run(run())
+    assert llm.max_in_flight == 2
+    assert len(llm.started) == 6
+    assert gateway.active == 0
+
+def test_interactive_calls_are_admitted_before_background_ones(make_gateway):
+    async def run():
+        llm = RecordingLLM()
+        gateway = make_gateway(llm, max_concurrency=1)
+        blocker = asyncio.create_task(gateway.complete("blocker", MODEL))
+        await asyncio.sleep(0.01)
+        queued = [
+            asyncio.create_task(gateway.complete("background 1", MODEL, PRIORITY_BACKGROUND)),
+            asyncio.create_task(gateway.complete("background 2", MODEL, PRIORITY_BACKGROUND)),
+            asyncio.create_task(gateway.complete("interactive 1", MODEL, PRIORITY_INTERACTIVE)),
+            asyncio.create_task(gateway.complete("interactive 2", MODEL, PRIORITY_INTERACTIVE))
+        ]
+        await asyncio.sleep(0.01)
+        llm.release()
+        await asyncio.gather(blocker, *queued)
+        return llm.started
+
+    # Same priority is first come, first served
+    assert asyncio.run(run()) == ["blocker", "interactive 1", "interactive 2", "background 1", "background 2"]
+
+def test_requests_per_minute_limit_holds_calls_back(make_gateway):
+    async def run():
+        llm = FlakyLLM()
+        gateway = make_gateway(llm, requests_per_minute=3)
+        tasks = [asyncio.create_task(gateway.complete(f"q{i}", MODEL)) for i in range(4)]
+        await asyncio.sleep(0.05)
+        done = sum(task.done() for task in tasks)
+        stats = gateway.stats()
+        assert gateway.dispatch_timer is not None
+        tasks[3].cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return llm, done, stats
+
+    llm, done, stats = asyncio.run(run())
+    assert done == 3
+    assert llm.calls == 3
+    assert stats["waiting"] == 1
+
+def test_tokens_per_minute_limit_holds_calls_back(make_gateway):
+    async def run():
+        gateway = make_gateway(FlakyLLM(), tokens_per_minute=gateway_module.LLM_EXPECTED_COMPLETION_TOKENS + 10)
+        first = await gateway.complete("short", MODEL)
+        second = asyncio.create_task(gateway.complete("short", MODEL))
+        await asyncio.sleep(0.05)
+        waiting = gateway.stats()["waiting"]
+        second.cancel()
+        await asyncio.gather(second, return_exceptions=True)
+        return first, waiting
+
+    assert asyncio.run(run()) == ("ok", 1)
+
+def test_cancelled_waiter_does_not_take_a_slot(make_gateway):
+    async def run():
+        llm = RecordingLLM()
+        gateway = make_gateway(llm, max_concurrency=1)
+        blocker = asyncio.create_task(gateway.complete("blocker", MODEL))
+        await asyncio.sleep(0.01)
+        waiter = asyncio.create_task(gateway.complete("cancelled", MODEL))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        llm.release()
+        await blocker
+        after = await gateway.complete("after", MODEL)
+        return llm.started, gateway, after
+
+    started, gateway, after = asyncio.run(run())
+    assert started == ["blocker", "after"]
+    assert after == "answer to after"
+    assert gateway.active == 0
+    assert gateway.stats()["waiting"] == 0
+
+def test_waiter_cancelled_after_admission_hands_its_slot_back(make_gateway):
+    async def run():
+        gateway = make_gateway(FlakyLLM(), max_concurrency=1)
+        await gateway._acquire(PRIORITY_INTERACTIVE, 1)
+        waiter = asyncio.create_task(gateway._acquire(PRIORITY_INTERACTIVE, 1))
+        await asyncio.sleep(0)
+        # Admit the waiter, then cancel it before it gets to run
+        gateway._release()
+        assert gateway.active == 1
+        waiter.cancel()
+        results = await asyncio.gather(waiter, return_exceptions=True)
+        return gateway, results
+
+    gateway, results = asyncio.run(run())
+    assert isinstance(results[0], asyncio.CancelledError)
+    assert gateway.active == 0
+
+def test_retryable_errors_are_retried(make_gateway, connection_error):
+    llm = FlakyLLM(connection_error(), connection_error())
+    gateway = make_gateway(llm, max_retries=2)
+    assert asyncio.run(gateway.complete("hello", MODEL)) == "ok"
+    assert llm.calls == 3
+    assert gateway.stats() == {"active": 0, "waiting": 0, "calls": 3, "retries": 2, "errors": 0}
+
+def test_retries_give_up_after_max_retries(make_gateway, connection_error):
+    llm = FlakyLLM(connection_error(), connection_error(), connection_error())
+    gateway = make_gateway(llm, max_retries=2)
+    with pytest.raises(openai.APIConnectionError):
+        asyncio.run(gateway.complete("hello", MODEL))
+    assert llm.calls == 3
+    assert gateway.stats() == {"active": 0, "waiting": 0, "calls": 3, "retries": 2, "errors": 1}
+
+def test_other_errors_are_not_retried(make_gateway):
+    llm = FlakyLLM(ValueError("bad prompt"))
+    gateway = make_gateway(llm)
+    with pytest.raises(ValueError):
+        asyncio.run(gateway.complete("hello", MODEL))
+    assert llm.calls == 1
+    assert gateway.stats()["retries"] == 0
+    assert gateway.stats()["errors"] == 1
+    assert gateway.active == 0
+
+class FlakyEmbedding:
+    # FlakyLLM for the embedding model
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    async def aget_query_embedding(self, text):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return [float(len(text))]
+
+    async def aget_text_embedding_batch(self, texts):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return [[float(len(text))] for text in texts]
+
+def test_embeddings_go_through_admission_and_retries(make_gateway, connection_error, monkeypatch):
+    from llama_index.core import Settings
+    embed_model = FlakyEmbedding(connection_error(), connection_error())
+    monkeypatch.setattr(Settings, "_embed_model", embed_model)
+    gateway = make_gateway(FlakyLLM(), max_retries=2)
+    assert asyncio.run(gateway.embed_query("abc")) == [3.0]
+    assert asyncio.run(gateway.embed_texts(["a", "bb"])) == [[1.0], [2.0]]
+    assert embed_model.calls == 4
+    assert gateway.stats() == {"active": 0, "waiting": 0, "calls": 4, "retries": 2, "errors": 0}
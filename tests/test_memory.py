@@ -0,0 +1,94 @@
+import asyncio
+import json
+import threading
+from agents.memory import ConversationMemory, MemoryLogWriter, read_last_entries
+
+def entry(i):
+    return {"query": f"q{i}", "response": f"r{i}", "timestamp": "2024-05-01T12:00:00"}
+
+def log_lines(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+def test_ring_buffer_keeps_the_last_window_entries(tmp_path):
+    writer = MemoryLogWriter(fsync=False)
+    path = str(tmp_path / "memory.jsonl")
+    memory = ConversationMemory(path, window=3, writer=writer)
+    for i in range(5):
+        memory.append(entry(i))
+    assert len(memory) == 3
+    assert memory.last(2) == [entry(3), entry(4)]
+    assert memory.last(0) == []
+    # Older entries come from the log
+    assert memory.last(4) == [entry(i) for i in range(1, 5)]
+
+def test_log_is_compacted_to_the_window(tmp_path):
+    writer = MemoryLogWriter(fsync=False)
+    path = str(tmp_path / "memory.jsonl")
+    memory = ConversationMemory(path, window=3, writer=writer)
+    for i in range(7):
+        memory.append(entry(i))
+    memory.flush()
+    # Compacted after the 3rd and 6th appends, then one more appended
+    assert log_lines(path) == [entry(i) for i in range(3, 7)]
+    reloaded = ConversationMemory(path, window=3, writer=writer)
+    assert reloaded.last(3) == [entry(4), entry(5), entry(6)]
+
+def test_torn_final_line_is_skipped(tmp_path):
+    path = tmp_path / "memory.jsonl"
+    path.write_text("".join(json.dumps(entry(i)) + "\n" for i in range(3)) + '{"query": "q3", "resp')
+    assert read_last_entries(str(path), 10) == [entry(0), entry(1), entry(2)]
+    memory = ConversationMemory(str(path), window=5, writer=MemoryLogWriter(fsync=False))
+    assert memory.last(5) == [entry(0), entry(1), entry(2)]
+
+def test_legacy_json_memory_is_migrated(tmp_path):
+    legacy = tmp_path / "memory.json"
+    legacy.write_text(json.dumps([entry(i) for i in range(5)]))
+    path = str(tmp_path / "memory.jsonl")
+    memory = ConversationMemory(path, window=3, legacy_path=str(legacy), writer=MemoryLogWriter(fsync=False))
+    assert memory.last(3) == [entry(2), entry(3), entry(4)]
+    assert log_lines(path) == [entry(2), entry(3), entry(4)]
+    assert not legacy.exists()
+    assert (tmp_path / "memory.json.migrated").exists()
+
+class BlockedWriter(MemoryLogWriter):
+    # flush() waits until released, like a slow disk
+    def __init__(self):
+        super().__init__(fsync=False)
+        self.release = threading.Event()
+
+    def flush(self, path=None):
+        self.release.wait(5)
+        super().flush(path)
+
+def test_memory_is_loaded_off_the_event_loop(tmp_path):
+    path = tmp_path / "memory.jsonl"
+    path.write_text("".join(json.dumps(entry(i)) + "\n" for i in range(2)))
+    writer = BlockedWriter()
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        memory = ConversationMemory(str(path), window=5, writer=writer)
+        created_in = loop.time() - started
+        # Appended while the log is still being read: held back, then written after it
+        memory.append(entry(2))
+        assert not memory.loaded
+        writer.release.set()
+        await memory.aload()
+        return memory, created_in
+
+    memory, created_in = asyncio.run(run())
+    assert created_in < 1
+    assert memory.last(3) == [entry(0), entry(1), entry(2)]
+    memory.flush()
+    assert log_lines(str(path)) == [entry(0), entry(1), entry(2)]
+
+def test_reload_sees_writes_queued_before_eviction(tmp_path):
+    writer = MemoryLogWriter(fsync=False)
+    path = str(tmp_path / "memory.jsonl")
+    memory = ConversationMemory(path, window=5, writer=writer)
+    for i in range(3):
+        memory.append(entry(i))
+    # No flush: the new instance waits for the queued writes before reading
+    assert ConversationMemory(path, window=5, writer=writer).last(3) == [entry(0), entry(1), entry(2)]
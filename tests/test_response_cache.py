@@ -0,0 +1,80 @@
+import asyncio
+import numpy as np
+from agents.response_cache import ResponseCache
+from benchmarks.embeddings import HashEmbedding
+
+class CountingEmbed:
+    def __init__(self, delay=0):
+        self.model = HashEmbedding()
+        self.delay = delay
+        self.calls = 0
+
+    async def __call__(self, text):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return await self.model.aget_query_embedding(text)
+
+def test_a_miss_returns_the_embedding_for_reuse():
+    embed = CountingEmbed()
+    cache = ResponseCache(similarity_threshold=0.95, ttl=60, max_entries=10, embed=embed)
+
+    async def run():
+        # No cached responses for this agent yet, the query is embedded anyway
+        response, embedding = await cache.lookup(1, 0, "What is new in astronomy?")
+        await cache.store(1, 0, "What is new in astronomy?", "Comets.", embedding)
+        return response, embedding
+
+    response, embedding = asyncio.run(run())
+    assert response is None
+    assert embedding is not None
+    assert abs(np.linalg.norm(embedding) - 1) < 1e-5
+    assert embed.calls == 1
+
+def test_exact_hits_do_not_embed():
+    embed = CountingEmbed()
+    cache = ResponseCache(similarity_threshold=0.95, ttl=60, max_entries=10, embed=embed)
+
+    async def run():
+        _, embedding = await cache.lookup(1, 0, "What is new in astronomy?")
+        await cache.store(1, 0, "What is new in astronomy?", "Comets.", embedding)
+        return await cache.lookup(1, 0, "  what is new in ASTRONOMY? ")
+
+    response, embedding = asyncio.run(run())
+    assert response == "Comets."
+    assert embedding is not None
+    assert embed.calls == 1
+
+def test_other_queries_and_versions_miss():
+    embed = CountingEmbed()
+    cache = ResponseCache(similarity_threshold=0.95, ttl=60, max_entries=10, embed=embed)
+
+    async def run():
+        await cache.store(1, 0, "What is new in astronomy?", "Comets.")
+        return [
+            (await cache.lookup(1, 0, "Tell me about oceans"))[0],
+            (await cache.lookup(1, 1, "What is new in astronomy?"))[0],
+            (await cache.lookup(2, 0, "What is new in astronomy?"))[0]
+        ]
+
+    assert asyncio.run(run()) == [None, None, None]
+
+def test_slow_cache_lookup_degrades_to_a_miss(monkeypatch):
+    from agents import base_agent
+    from agents.response_cache import response_cache
+    from models import AgentCreate
+
+    embed = CountingEmbed(delay=5)
+    monkeypatch.setattr(response_cache, "embed", embed)
+    monkeypatch.setattr(base_agent, "QUERY_CACHE_LOOKUP_TIMEOUT", 0.05)
+    agent = base_agent.BaseAgent(424242, AgentCreate(personality_type="Curious", interests=["astronomy"], metadata={}))
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        result = await agent.lookup_cached_response("What is new in astronomy?")
+        return result, loop.time() - started
+
+    result, elapsed = asyncio.run(run())
+    assert result == (None, None)
+    assert elapsed < 1
+    assert embed.calls == 1
@@ -0,0 +1,101 @@
+import asyncio
+import zlib
+from contextlib import asynccontextmanager
+import httpx
+import pytest
+from aiohttp import web
+from services import sharding
+from services.sharding import ShardClient, ShardRouter, owner_of, worker_socket
+
+def test_owner_is_stable_and_spreads_agents():
+    assert owner_of(42, 4) == zlib.crc32(b"42") % 4
+    owners = [owner_of(agent_id, 4) for agent_id in range(1, 1001)]
+    assert all(owners.count(worker) > 150 for worker in range(4))
+
+def test_forwarded_header_is_only_trusted_on_the_private_socket(monkeypatch):
+    monkeypatch.setattr(sharding, "WORKER_COUNT", 2)
+    headers = [(sharding.FORWARDED_HEADER.encode(), b"1")]
+    assert sharding.is_forwarded({"server": ("/run/worker_0.sock", None), "headers": headers})
+    assert not sharding.is_forwarded({"server": ("127.0.0.1", 8000), "headers": headers})
+    assert not sharding.is_forwarded({"server": ("/run/worker_0.sock", None), "headers": []})
+
+@asynccontextmanager
+async def slow_worker(delay):
+    # Worker 1 on its Unix socket, answering every request after `delay` seconds
+    async def handler(request):
+        await asyncio.sleep(delay)
+        return web.json_response({"ok": True})
+
+    app = web.Application()
+    app.router.add_route("*", "/{tail:.*}", handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.UnixSite(runner, worker_socket(1)).start()
+    try:
+        yield
+    finally:
+        await runner.cleanup()
+
+@pytest.fixture
+def socket_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(sharding, "WORKER_SOCKET_DIR", str(tmp_path))
+    return tmp_path
+
+def test_forwarded_requests_time_out(socket_dir):
+    async def run():
+        client = ShardClient(connect_timeout=1, read_timeout=0.1, stream_read_timeout=0.1)
+        try:
+            async with slow_worker(delay=0.05):
+                assert (await client.request(1, "GET", "/agents/1")).json() == {"ok": True}
+            async with slow_worker(delay=0.5):
+                loop = asyncio.get_running_loop()
+                started = loop.time()
+                with pytest.raises(httpx.ReadTimeout):
+                    await client.request(1, "GET", "/agents/1")
+                with pytest.raises(httpx.ReadTimeout):
+                    async for _ in client.stream_lines(1, "POST", "/query/batch", {}):
+                        pass
+                return loop.time() - started
+        finally:
+            await client.close()
+
+    assert asyncio.run(run()) < 0.5
+
+def route_to_worker_1(monkeypatch, client):
+    monkeypatch.setattr(sharding, "is_sharded", lambda: True)
+    monkeypatch.setattr(sharding, "owns", lambda agent_id: False)
+    monkeypatch.setattr(sharding, "owner_of", lambda agent_id: 1)
+    monkeypatch.setattr(sharding, "shard_client", client)
+
+async def local_app(scope, receive, send):
+    raise AssertionError("request for another worker's agent was handled locally")
+
+def test_router_answers_504_when_the_owner_is_too_slow(socket_dir, monkeypatch):
+    async def run():
+        shard_client = ShardClient(connect_timeout=1, read_timeout=0.1, stream_read_timeout=0.1)
+        route_to_worker_1(monkeypatch, shard_client)
+        transport = httpx.ASGITransport(app=ShardRouter(local_app))
+        try:
+            async with slow_worker(delay=0.5), httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return await client.get("/agents/7")
+        finally:
+            await shard_client.close()
+
+    response = asyncio.run(run())
+    assert response.status_code == 504
+    assert response.json() == {"detail": "Worker 1 timed out"}
+
+def test_router_answers_503_when_the_owner_is_down(socket_dir, monkeypatch):
+    async def run():
+        shard_client = ShardClient(connect_timeout=1, read_timeout=1, stream_read_timeout=1)
+        route_to_worker_1(monkeypatch, shard_client)
+        transport = httpx.ASGITransport(app=ShardRouter(local_app))
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return await client.get("/agents/7")
+        finally:
+            await shard_client.close()
+
+    response = asyncio.run(run())
+    assert response.status_code == 503
+    assert response.json() == {"detail": "Worker 1 is unavailable"}
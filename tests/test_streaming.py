@@ -0,0 +1,171 @@
+import asyncio
+import json
+from types import SimpleNamespace
+import httpx
+import openai
+import pytest
+from benchmarks.fakes import FakeLLM
+
+MODEL = "fake-model"
+
+class ScriptedStreamingLLM(FakeLLM):
+    # Each stream plays the next script: a list of deltas, where an exception
+    # is raised at that point of the stream instead of being yielded. Plain
+    # completions are FakeLLM's.
+    def __init__(self, *scripts):
+        super().__init__(latency=0, token_latency=0)
+        self.scripts = list(scripts)
+
+    async def astream_complete(self, prompt, **kwargs):
+        self.calls += 1
+        script = self.scripts.pop(0)
+
+        async def stream():
+            text = ""
+            for item in script:
+                await asyncio.sleep(0)
+                if isinstance(item, Exception):
+                    raise item
+                text += item
+                yield SimpleNamespace(text=text, delta=item)
+
+        return stream()
+
+async def collect(stream):
+    return [delta async for delta in stream]
+
+def test_deltas_are_yielded_in_order(make_gateway):
+    gateway = make_gateway(ScriptedStreamingLLM(["Hello", ", ", "", "world"]))
+    # Empty deltas are skipped
+    assert asyncio.run(collect(gateway.stream_complete("hi", MODEL))) == ["Hello", ", ", "world"]
+    assert gateway.stats() == {"active": 0, "waiting": 0, "calls": 1, "retries": 0, "errors": 0}
+
+def test_failure_before_the_first_delta_is_retried(make_gateway, connection_error):
+    llm = ScriptedStreamingLLM([connection_error()], ["", connection_error()], ["fine"])
+    gateway = make_gateway(llm)
+    assert asyncio.run(collect(gateway.stream_complete("hi", MODEL))) == ["fine"]
+    assert llm.calls == 3
+    assert gateway.stats()["retries"] == 2
+    assert gateway.active == 0
+
+def test_failure_after_the_first_delta_is_not_retried(make_gateway, connection_error):
+    llm = ScriptedStreamingLLM(["partial", connection_error()], ["never used"])
+    gateway = make_gateway(llm)
+    received = []
+
+    async def run():
+        async for delta in gateway.stream_complete("hi", MODEL):
+            received.append(delta)
+
+    with pytest.raises(openai.APIConnectionError):
+        asyncio.run(run())
+    assert received == ["partial"]
+    assert llm.calls == 1
+    assert gateway.stats()["errors"] == 1
+    assert gateway.active == 0
+
+def test_abandoned_stream_releases_its_slot(make_gateway):
+    gateway = make_gateway(ScriptedStreamingLLM(["a", "b", "c"]))
+
+    async def run():
+        stream = gateway.stream_complete("hi", MODEL)
+        first = await stream.__anext__()
+        await stream.aclose()
+        return first
+
+    assert asyncio.run(run()) == "a"
+    assert gateway.active == 0
+
+def parse_sse(body):
+    events = []
+    for message in body.strip().split("\n\n"):
+        event = "message"
+        for line in message.split("\n"):
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                events.append((event, json.loads(line[len("data: "):])))
+    return events
+
+@pytest.fixture
+def app(fake_llm):
+    from main import app
+    return app
+
+async def create_agent(client):
+    response = await client.post("/agents", json={
+        "personality_type": "Curious", "interests": ["astronomy"], "metadata": {"name": "Streamer"}
+    })
+    assert response.status_code == 200, response.text
+    return response.json()["agent_id"]
+
+def test_stream_endpoint_sends_deltas_then_the_full_response(app):
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            agent_id = await create_agent(client)
+            response = await client.post(f"/query/{agent_id}/stream", json={"query": "What is new in astronomy?"})
+            memory = await client.get(f"/agents/{agent_id}/memory")
+            return agent_id, response, memory.json()
+
+    agent_id, response, memory = asyncio.run(run())
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = parse_sse(response.text)
+    deltas = [data["delta"] for event, data in events if event == "message"]
+    assert len(deltas) == 12
+    assert [event for event, _ in events][-1] == "done"
+    done = events[-1][1]
+    assert done["agent_id"] == agent_id
+    assert done["response"] == "".join(deltas)
+    # Memory is updated once the stream has completed
+    assert memory["interactions"][-1]["response"] == done["response"]
+
+def test_stream_endpoint_reports_failures_mid_stream(app, connection_error):
+    from config.config import DEFAULT_MODEL_NAME
+    from services.llm_gateway import llm_gateway
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            agent_id = await create_agent(client)
+            llm_gateway.set_llm(DEFAULT_MODEL_NAME, ScriptedStreamingLLM(["partial ", connection_error()]))
+            response = await client.post(f"/query/{agent_id}/stream", json={"query": "Tell me about comets"})
+            memory = await client.get(f"/agents/{agent_id}/memory")
+            return response, memory.json()
+
+    response, memory = asyncio.run(run())
+    events = parse_sse(response.text)
+    assert events[0] == ("message", {"delta": "partial "})
+    assert events[-1] == ("error", {"detail": "Query failed"})
+    assert memory["interactions"] == []
+
+def test_stream_endpoint_returns_404_for_unknown_agents(app):
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/query/999999/stream", json={"query": "Anyone there?"})
+
+    assert asyncio.run(run()).status_code == 404
+
+def test_stream_endpoint_pins_the_agent_until_the_stream_ends(app):
+    from main import agent_factory, stream_query_agent
+    from models import AgentCreate, Query
+
+    async def run():
+        agent = agent_factory.create_agent(AgentCreate(personality_type="Curious", interests=["comets"],
+                                                       metadata={"name": "Pinned"}))
+        response = await stream_query_agent(agent.agent_id, Query(query="Any comets tonight?"))
+        pinned_before_streaming = agent.in_use
+        body = [chunk async for chunk in response.body_iterator]
+        pinned_after_streaming = agent.in_use
+        # A response whose body is never streamed is released by its background task
+        unstarted = await stream_query_agent(agent.agent_id, Query(query="And tomorrow?"))
+        await unstarted.background()
+        return pinned_before_streaming, body, pinned_after_streaming, agent.in_use
+
+    pinned_before_streaming, body, pinned_after_streaming, pinned_after_background = asyncio.run(run())
+    assert pinned_before_streaming == 1
+    assert body[-1].startswith("event: done")
+    assert pinned_after_streaming == 0
+    assert pinned_after_background == 0
@@ -0,0 +1,133 @@
+import asyncio
+import pytest
+from services.task_queue import TaskQueue, QueueFullError, PRIORITY_USER, PRIORITY_PERIODIC
+
+async def record(log, name):
+    log.append(name)
+
+def run_queue(queue, fill):
+    # fill(queue, log) queues the tasks before any worker starts
+    async def run():
+        log = []
+        await fill(queue, log)
+        runner = asyncio.create_task(queue.run())
+        await asyncio.sleep(0)
+        await queue.shutdown(drain_timeout=5)
+        await asyncio.gather(runner, return_exceptions=True)
+        return log
+
+    return asyncio.run(run())
+
+def test_user_tasks_run_before_periodic_ones():
+    async def fill(queue, log):
+        await queue.add_task(record(log, "periodic 1"), PRIORITY_PERIODIC)
+        await queue.add_task(record(log, "user 1"), PRIORITY_USER)
+        await queue.add_task(record(log, "periodic 2"), PRIORITY_PERIODIC)
+        await queue.add_task(record(log, "user 2"), PRIORITY_USER)
+
+    assert run_queue(TaskQueue(max_concurrent_tasks=1), fill) == ["user 1", "user 2", "periodic 1", "periodic 2"]
+
+def test_duplicate_keys_are_dropped():
+    queue = TaskQueue(max_concurrent_tasks=1)
+
+    async def fill(queue, log):
+        assert await queue.add_task(record(log, "first"), PRIORITY_USER, key=1)
+        assert not await queue.add_task(record(log, "second"), PRIORITY_USER, key=1)
+        assert not await queue.add_task(record(log, "third"), PRIORITY_PERIODIC, key=1)
+
+    assert run_queue(queue, fill) == ["first"]
+    assert queue.stats()["deduplicated"] == 2
+
+def test_user_request_promotes_a_queued_periodic_task():
+    queue = TaskQueue(max_concurrent_tasks=1)
+
+    async def fill(queue, log):
+        await queue.add_task(record(log, "other periodic"), PRIORITY_PERIODIC, key=2)
+        assert await queue.add_task(record(log, "periodic"), PRIORITY_PERIODIC, key=1)
+        # Same work, asked for by a user: it moves up instead of being dropped
+        assert await queue.add_task(record(log, "user"), PRIORITY_USER, key=1)
+        assert queue.stats()["queue_depth"] == 2
+
+    # The queued task is kept, so whoever queued it still sees it run, once
+    assert run_queue(queue, fill) == ["periodic", "other periodic"]
+    stats = queue.stats()
+    assert stats["promoted"] == 1
+    assert stats["deduplicated"] == 0
+    assert stats["completed"] == 2
+    assert stats["queue_depth"] == 0
+
+def test_running_tasks_are_not_promoted_or_requeued():
+    async def run():
+        queue = TaskQueue(max_concurrent_tasks=1)
+        started = asyncio.Event()
+        finish = asyncio.Event()
+
+        async def slow():
+            started.set()
+            await finish.wait()
+
+        runner = asyncio.create_task(queue.run())
+        await queue.add_task(slow(), PRIORITY_PERIODIC, key=1)
+        await started.wait()
+        queued = await queue.add_task(asyncio.sleep(0), PRIORITY_USER, key=1)
+        finish.set()
+        await queue.shutdown(drain_timeout=5)
+        await asyncio.gather(runner, return_exceptions=True)
+        return queued, queue.stats()
+
+    queued, stats = asyncio.run(run())
+    assert not queued
+    assert stats["completed"] == 1
+    assert stats["promoted"] == 0
+
+def test_full_queue_rejects_new_tasks():
+    async def run():
+        queue = TaskQueue(max_concurrent_tasks=1, max_queue_size=1)
+        await queue.add_task(asyncio.sleep(0), key=1)
+        with pytest.raises(QueueFullError):
+            await queue.add_task(asyncio.sleep(0), key=2)
+        # No room to promote either; the queued task stays where it is
+        assert not await queue.add_task(asyncio.sleep(0), PRIORITY_USER, key=1)
+        await queue.shutdown()
+        return queue.stats()
+
+    stats = asyncio.run(run())
+    assert stats["rejected"] == 1
+    assert stats["promoted"] == 0
+
+def test_a_task_cancelled_from_inside_does_not_stop_the_queue():
+    async def cancelled():
+        raise asyncio.CancelledError()
+
+    async def fill(queue, log):
+        await queue.add_task(cancelled())
+        await queue.add_task(record(log, "after"))
+
+    queue = TaskQueue(max_concurrent_tasks=1)
+    assert run_queue(queue, fill) == ["after"]
+    stats = queue.stats()
+    assert (stats["completed"], stats["failed"]) == (1, 1)
+
+def test_workers_keep_running_after_a_cancelled_task():
+    async def run():
+        queue = TaskQueue(max_concurrent_tasks=2)
+        runner = asyncio.create_task(queue.run())
+        await asyncio.sleep(0)
+
+        async def cancelled():
+            await asyncio.sleep(0)
+            raise asyncio.CancelledError()
+
+        await queue.add_task(cancelled())
+        await asyncio.sleep(0.01)
+        log = []
+        await queue.add_task(record(log, "later"))
+        await asyncio.sleep(0.01)
+        workers_alive = all(not worker.done() for worker in queue.workers)
+        await queue.shutdown(drain_timeout=5)
+        await asyncio.gather(runner, return_exceptions=True)
+        return log, workers_alive
+
+    log, workers_alive = asyncio.run(run())
+    assert log == ["later"]
+    assert workers_alive
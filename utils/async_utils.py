@@ -0,0 +1,12 @@
+import asyncio
+
+async def wait_event(event: asyncio.Event, timeout: float = None) -> bool:
+    # Like asyncio.wait_for(event.wait(), timeout), except that a cancellation
+    # racing with event.set() is never swallowed (it is on Python < 3.12),
+    # which would leave background loops running after shutdown cancels them
+    waiter = asyncio.ensure_future(event.wait())
+    try:
+        done, _ = await asyncio.wait({waiter}, timeout=timeout)
+    finally:
+        waiter.cancel()
+    return bool(done)
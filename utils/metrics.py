@@ -0,0 +1,170 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from config.config import TRACING_ENABLED
+from utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Seconds; covers everything from a cache hit to a slow LLM call
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def format_labels(labels) -> str:
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+def format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, key, value) for key, value in self.values.items()]
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (last one is +Inf), sum, count]
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        samples = []
+        with self.lock:
+            for key, (counts, total, count) in self.values.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    samples.append((f"{self.name}_bucket", key + (("le", format_value(float(bound))),), cumulative))
+                samples.append((f"{self.name}_sum", key, total))
+                samples.append((f"{self.name}_count", key, count))
+        return samples
+
+class CallbackMetric:
+    # Read at scrape time from counters that already live elsewhere (cache and
+    # gateway stats), so the hot paths are not instrumented twice
+    def __init__(self, name: str, help_text: str, kind: str, callback):
+        self.name = name
+        self.help_text = help_text
+        self.kind = kind
+        self.callback = callback
+
+    def samples(self):
+        value = self.callback()
+        if isinstance(value, dict):
+            return [(self.name, tuple(sorted(labels)), sample) for labels, sample in value.items()]
+        return [(self.name, (), value)]
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = {}
+
+    def _register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        return self._register(Counter(name, help_text))
+
+    def histogram(self, name: str, help_text: str, buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, buckets))
+
+    def gauge_callback(self, name: str, help_text: str, callback):
+        # callback returns a number, or a dict of label tuples to numbers
+        return self._register(CallbackMetric(name, help_text, "gauge", callback))
+
+    def counter_callback(self, name: str, help_text: str, callback):
+        return self._register(CallbackMetric(name, help_text, "counter", callback))
+
+    def render(self) -> str:
+        # Prometheus text exposition format 0.0.4
+        lines = []
+        for metric in self.metrics.values():
+            try:
+                samples = metric.samples()
+            except Exception as e:
+                logger.error(f"Collecting metric {metric.name} failed: {str(e)}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in samples:
+                lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+
+_tracer = None
+if TRACING_ENABLED:
+    try:
+        from opentelemetry import trace
+        _tracer = trace.get_tracer("agent_village")
+    except ImportError:
+        logger.warning("TRACING_ENABLED is set but opentelemetry is not installed; tracing is disabled")
+
+def span(name: str, **attributes):
+    # An OpenTelemetry span when tracing is enabled, otherwise a no-op
+    if _tracer is None:
+        return nullcontext()
+    return _tracer.start_as_current_span(name, attributes=attributes)
+
+QUERY_STAGE_SECONDS = metrics.histogram(
+    "agent_query_stage_seconds", "Latency of each stage of an agent query")
+QUERY_STAGE_FAILURES = metrics.counter(
+    "agent_query_stage_failures_total", "Query stages that timed out or failed and fell back to their default")
+QUERY_SECONDS = metrics.histogram(
+    "agent_query_seconds", "End-to-end latency of agent queries")
+KB_INSERT_SECONDS = metrics.histogram(
+    "kb_insert_seconds", "Time to add a learned article to the shared knowledge base, embedding included")
+TASK_QUEUE_WAIT_SECONDS = metrics.histogram(
+    "task_queue_wait_seconds", "Time tasks spend queued before a worker picks them up")
+TASK_QUEUE_RUN_SECONDS = metrics.histogram(
+    "task_queue_run_seconds", "Time tasks take to run once started")
+LLM_REQUEST_SECONDS = metrics.histogram(
+    "llm_request_seconds", "Latency of LLM calls, excluding time waiting for admission")
+HTTP_RETRIES = metrics.counter(
+    "http_retries_total", "Outbound web requests retried after a transient failure")
+HTTP_ERRORS = metrics.counter(
+    "http_errors_total", "Outbound web requests that failed after all retries")